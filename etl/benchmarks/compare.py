@@ -0,0 +1,44 @@
+"""
+Сравнение результатов бенчмарков двух запусков.
+
+Запуск из каталога etl:
+    python -m benchmarks.compare baseline.jsonl candidate.jsonl
+Для каждого бенчмарка берется последняя запись в файле, числовые метрики сравниваются попарно.
+"""
+import argparse
+import json
+
+
+def load_latest(path: str) -> dict:
+    """Функция возвращает последние результаты каждого бенчмарка из файла"""
+    latest = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                latest[record['benchmark']] = record
+    return latest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    baseline, candidate = load_latest(args.baseline), load_latest(args.candidate)
+    for benchmark in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[benchmark], candidate[benchmark]
+        print(f'{benchmark}: {before["commit"]} -> {after["commit"]}')
+        if before['params'] != after['params']:
+            print(f'  warning: params differ {before["params"]} != {after["params"]}')
+        for metric, old in before['results'].items():
+            new = after['results'].get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+                continue
+            change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+            print(f'  {metric:<40} {old:>14.4f} {new:>14.4f} {change:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Генератор синтетических данных для схемы content.
+
+Заполняет film_work, person, genre и таблицы связей в заданном масштабе.
+Популярность персон распределена по степенному закону, часть фильмов - сериалы с очень большим составом.
+Данные детерминированы параметром --seed, поэтому запуски на разных коммитах сравнимы.
+
+Запуск из каталога etl (параметры подключения берутся из DataBaseConfig):
+    python -m benchmarks.datagen --films 100000 --reset
+"""
+import argparse
+import io
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+from utils.config import DataBaseConfig
+
+SQL_SCHEMA = """
+    CREATE SCHEMA IF NOT EXISTS content;
+
+    CREATE TABLE IF NOT EXISTS content.film_work (
+        id uuid PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        creation_date DATE,
+        rating FLOAT,
+        type TEXT NOT NULL,
+        created timestamp with time zone,
+        modified timestamp with time zone
+    );
+
+    CREATE TABLE IF NOT EXISTS content.genre (
+        id uuid PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        created timestamp with time zone,
+        modified timestamp with time zone
+    );
+
+    CREATE TABLE IF NOT EXISTS content.person (
+        id uuid PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        created timestamp with time zone,
+        modified timestamp with time zone
+    );
+
+    CREATE TABLE IF NOT EXISTS content.genre_film_work (
+        id uuid PRIMARY KEY,
+        genre_id uuid NOT NULL REFERENCES content.genre (id) ON DELETE CASCADE,
+        film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+        created timestamp with time zone
+    );
+
+    CREATE TABLE IF NOT EXISTS content.person_film_work (
+        id uuid PRIMARY KEY,
+        person_id uuid NOT NULL REFERENCES content.person (id) ON DELETE CASCADE,
+        film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        created timestamp with time zone
+    );
+
+    CREATE INDEX IF NOT EXISTS film_work_modified_idx ON content.film_work (modified);
+    CREATE INDEX IF NOT EXISTS person_modified_idx ON content.person (modified);
+    CREATE INDEX IF NOT EXISTS genre_modified_idx ON content.genre (modified);
+    CREATE INDEX IF NOT EXISTS genre_film_work_film_work_idx ON content.genre_film_work (film_work_id);
+    CREATE INDEX IF NOT EXISTS person_film_work_film_work_idx ON content.person_film_work (film_work_id);
+    CREATE INDEX IF NOT EXISTS person_film_work_person_idx ON content.person_film_work (person_id);
+"""
+
+SQL_TRUNCATE = """
+    TRUNCATE content.person_film_work, content.genre_film_work,
+             content.person, content.genre, content.film_work
+"""
+
+GENRES = (
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary', 'Drama',
+    'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Musical', 'Mystery', 'News', 'Reality-TV',
+    'Romance', 'Sci-Fi', 'Short', 'Sport', 'Talk-Show', 'Thriller', 'War', 'Western', 'Game-Show',
+)
+
+COPY_BUFFER_ROWS = 50000
+
+
+def copy_value(value) -> str:
+    """Функция кодирует значение для COPY в текстовом формате"""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class CopyWriter:
+    """
+    Буферизованная запись строк в таблицу через COPY.
+    Перед записью сбрасываются буферы таблиц из depends_on, на которые ссылаются внешние ключи
+    """
+
+    def __init__(self, cursor, table: str, columns: tuple, depends_on: tuple = ()):
+        self.cursor = cursor
+        self.depends_on = depends_on
+        self.sql = f'COPY content.{table} ({", ".join(columns)}) FROM STDIN'
+        self.buffer = io.StringIO()
+        self.rows = 0
+        self.total = 0
+
+    def write(self, *values) -> None:
+        self.buffer.write('\t'.join(map(copy_value, values)) + '\n')
+        self.rows += 1
+        if self.rows >= COPY_BUFFER_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        for writer in self.depends_on:
+            writer.flush()
+        if self.rows:
+            self.buffer.seek(0)
+            self.cursor.copy_expert(self.sql, self.buffer)
+            self.total += self.rows
+            self.buffer = io.StringIO()
+            self.rows = 0
+
+
+def generate(cursor, films: int, persons_ratio: float, series_ratio: float, seed: int) -> dict:
+    """Функция генерирует данные и возвращает количество строк по таблицам"""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+
+    def new_id() -> uuid.UUID:
+        return uuid.UUID(int=rnd.getrandbits(128), version=4)
+
+    def timestamp() -> datetime:
+        return now - timedelta(seconds=rnd.randint(0, 365 * 24 * 3600))
+
+    genre_ids = [new_id() for _ in GENRES]
+    genre_writer = CopyWriter(cursor, 'genre', ('id', 'name', 'description', 'created', 'modified'))
+    for genre_id, name in zip(genre_ids, GENRES):
+        created = timestamp()
+        genre_writer.write(genre_id, name, f'{name} movies', created, created)
+    genre_writer.flush()
+
+    person_ids = [new_id() for _ in range(max(100, int(films * persons_ratio)))]
+    person_writer = CopyWriter(cursor, 'person', ('id', 'full_name', 'created', 'modified'))
+    for number, person_id in enumerate(person_ids):
+        created = timestamp()
+        person_writer.write(person_id, f'Person {number}', created, created)
+    person_writer.flush()
+
+    film_writer = CopyWriter(
+        cursor, 'film_work', ('id', 'title', 'description', 'creation_date', 'rating', 'type', 'created', 'modified')
+    )
+    genre_link_writer = CopyWriter(
+        cursor, 'genre_film_work', ('id', 'genre_id', 'film_work_id', 'created'), depends_on=(film_writer,)
+    )
+    person_link_writer = CopyWriter(
+        cursor, 'person_film_work', ('id', 'person_id', 'film_work_id', 'role', 'created'), depends_on=(film_writer,)
+    )
+
+    def pick_person():
+        # Степенное распределение: небольшое число персон участвует в большинстве фильмов
+        return person_ids[min(int(rnd.paretovariate(1.2)) - 1, len(person_ids) - 1) * 7919 % len(person_ids)]
+
+    for number in range(films):
+        film_id = new_id()
+        created = timestamp()
+        is_series = rnd.random() < series_ratio
+        film_writer.write(
+            film_id,
+            f'Film {number}',
+            f'Description of film {number}. ' * rnd.randint(1, 20) if rnd.random() > 0.05 else None,
+            created.date(),
+            round(rnd.uniform(1, 10), 1) if rnd.random() > 0.1 else None,
+            'tv_show' if is_series else 'movie',
+            created,
+            created,
+        )
+        for genre_id in rnd.sample(genre_ids, rnd.randint(1, 3)):
+            genre_link_writer.write(new_id(), genre_id, film_id, created)
+
+        roles = (
+            ('actor', rnd.randint(300, 3000) if is_series else rnd.randint(5, 25)),
+            ('writer', rnd.randint(1, 4)),
+            ('director', rnd.randint(1, 2)),
+        )
+        for role, count in roles:
+            for person_id in {pick_person() for _ in range(count)}:
+                person_link_writer.write(new_id(), person_id, film_id, role, created)
+
+    genre_link_writer.flush()
+    person_link_writer.flush()
+
+    return {
+        'genre': genre_writer.total,
+        'person': person_writer.total,
+        'film_work': film_writer.total,
+        'genre_film_work': genre_link_writer.total,
+        'person_film_work': person_link_writer.total,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--persons-ratio', type=float, default=0.5, help='persons per film')
+    parser.add_argument('--series-ratio', type=float, default=0.001, help='share of films with a huge cast')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='truncate content tables before generation')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with psycopg2.connect(**DataBaseConfig().dict()) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_SCHEMA)
+            if args.reset:
+                cursor.execute(SQL_TRUNCATE)
+            counts = generate(cursor, args.films, args.persons_ratio, args.series_ratio, args.seed)
+            cursor.execute('ANALYZE')
+    conn.close()
+
+    print(f'Generated {counts} in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
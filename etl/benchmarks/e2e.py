@@ -0,0 +1,113 @@
+"""
+Сквозной бенчмарк загрузки фильмов: Extractor -> Transformer -> Loader.
+
+Данные читаются из PostgreSQL (заполняется benchmarks.datagen), загрузка идет в Elasticsearch
+из ElasticConfig или во встроенную HTTP-заглушку (--standin). Используется та же функция sync_filmworks,
+что и в сервисе, но состояние хранится в памяти, поэтому Redis не нужен и каждый запуск - полная загрузка.
+
+Запуск из каталога etl:
+    python -m benchmarks.datagen --films 100000 --reset
+    python -m benchmarks.e2e --standin --output results.jsonl
+"""
+import argparse
+import time
+from typing import Any, Dict
+
+from etl_modules.extractor import Extractor
+from etl_modules.loader import Loader
+from etl_modules.pipeline import Pipeline
+from etl_modules.transform_pool import TransformPool
+from etl_modules.transformer import Transformer
+from main import sync_filmworks
+from utils.config import AppConfig, DataBaseConfig, ElasticConfig
+from utils.metrics import REGISTRY
+from utils.state_storage import BaseStorage, State
+from .es_standin import start_standin
+from .results import save_results
+
+
+class MemoryStorage(BaseStorage):
+    """Хранилище состояния в памяти процесса"""
+
+    def __init__(self):
+        self.state = {}
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        self.state = state
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        return dict(self.state)
+
+
+class NoLease:
+    """Аренда, которая никогда не теряется: бенчмарк выполняется единственным процессом"""
+
+    def check(self) -> None:
+        pass
+
+
+def main() -> None:
+    app_config = AppConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--standin', action='store_true', help='load into the built-in HTTP stand-in')
+    parser.add_argument('--movies-index', default='movies_bench')
+    parser.add_argument('--chunk-size', type=int, default=app_config.chunk_size)
+    parser.add_argument('--page-size', type=int, default=app_config.page_size)
+    parser.add_argument('--itersize', type=int, default=app_config.itersize)
+    parser.add_argument('--pipeline', action='store_true', help='run stages in the threaded pipeline')
+    parser.add_argument('--fast-transform', action='store_true')
+    parser.add_argument('--workers', type=int, default=0, help='transform in a pool of this many processes')
+    parser.add_argument('--output', help='append results to this JSONL file')
+    args = parser.parse_args()
+
+    elastic_overrides = {'movies_index': args.movies_index, 'genres_index': f'{args.movies_index}_genres'}
+    standin = None
+    if args.standin:
+        standin = start_standin()
+        host, port = standin.server_address
+        elastic_overrides.update(elastic_host=host, elastic_port=port)
+    elastic_config = ElasticConfig(**elastic_overrides)
+
+    extractor = Extractor(
+        args.chunk_size,
+        DataBaseConfig(),
+        itersize=args.itersize,
+        server_side_cursor=app_config.server_side_cursor,
+        page_size=args.page_size,
+    )
+    loader = Loader(elastic_config)
+    pipeline = Pipeline(app_config.pipeline_queue_size) if args.pipeline else None
+    transform_pool = TransformPool(args.workers, fast_mode=args.fast_transform) if args.workers else None
+
+    started = time.perf_counter()
+    try:
+        sync_filmworks(
+            extractor, Transformer(fast_mode=args.fast_transform), loader, State(MemoryStorage()), NoLease(),
+            pipeline, transform_pool=transform_pool,
+        )
+    finally:
+        loader.close()
+        if transform_pool is not None:
+            transform_pool.close()
+    duration = time.perf_counter() - started
+
+    metrics = REGISTRY.snapshot()
+    documents = metrics['etl_rows_total'].get('load', 0)
+    results = {
+        'duration_seconds': round(duration, 3),
+        'documents': documents,
+        'documents_per_second': round(documents / duration, 1),
+        'payload_bytes': sum(metrics['etl_bytes_total'].values()),
+    }
+    for stage, timing in metrics['etl_stage_duration_seconds'].items():
+        results[f'{stage}_seconds'] = timing['sum']
+    if standin is not None:
+        results['bulk_requests'] = standin.stats.snapshot()['bulk_requests']
+        standin.shutdown()
+
+    params = vars(args) | {'target': 'standin' if args.standin else elastic_config.get_elastic_url()}
+    save_results('e2e', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+HTTP-заглушка Elasticsearch для бенчмарков.
+
+Отвечает на запросы, которые делает Loader при загрузке (проверка и создание индексов, _bulk),
+принимает все документы и считает запросы, документы и байты. Позволяет измерить пропускную способность
+Extractor/Transformer/Loader без настоящего кластера.
+
+Запуск отдельным процессом из каталога etl:
+    python -m benchmarks.es_standin --port 9201
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandinStats:
+    """Счетчики запросов, полученных заглушкой"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bulk_requests = 0
+        self.documents = 0
+        self.bytes = 0
+
+    def record(self, size: int, documents: int = 0, bulk: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+            self.documents += documents
+            self.bulk_requests += bulk
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'bulk_requests': self.bulk_requests,
+                'documents': self.documents,
+                'bytes': self.bytes,
+            }
+
+
+class _StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self) -> None:
+        self._respond(200 if self._index() in self.server.indices else 404, None)
+
+    def do_GET(self) -> None:
+        if self.path.startswith('/_stats'):
+            self._respond(200, self.server.stats.snapshot())
+        elif self._index() in self.server.indices:
+            self._respond(200, {self._index(): {}})
+        else:
+            self._respond(404, {'error': {'type': 'index_not_found_exception'}, 'status': 404})
+
+    def do_PUT(self) -> None:
+        body = self._read()
+        if self._is_bulk():
+            self._bulk(body)
+            return
+        index = self._index()
+        if index in self.server.indices:
+            self._respond(400, {'error': {'type': 'resource_already_exists_exception'}, 'status': 400})
+            return
+        self.server.indices.add(index)
+        self.server.indices.update(json.loads(body or b'{}').get('aliases', {}))
+        self._respond(200, {'acknowledged': True, 'index': index})
+
+    def do_POST(self) -> None:
+        body = self._read()
+        if self._is_bulk():
+            self._bulk(body)
+        else:
+            self._respond(200, {'acknowledged': True})
+
+    def _bulk(self, body: bytes) -> None:
+        items = []
+        lines = iter(body.splitlines())
+        for line in lines:
+            if not line.strip():
+                continue
+            (op_type, meta), = json.loads(line).items()
+            if op_type != 'delete':
+                next(lines, None)
+            status = 200 if op_type == 'delete' else 201
+            items.append({op_type: {'_index': meta.get('_index'), '_id': meta.get('_id'), 'status': status}})
+
+        self.server.stats.record(len(body), documents=len(items), bulk=True)
+        self._respond(200, {'took': 0, 'errors': False, 'items': items})
+
+    def _is_bulk(self) -> bool:
+        return self.path.split('?')[0].endswith('/_bulk')
+
+    def _index(self) -> str:
+        return self.path.split('?')[0].strip('/').split('/')[0]
+
+    def _read(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self._is_bulk():
+            self.server.stats.record(len(body))
+        return body
+
+    def _respond(self, status: int, data) -> None:
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_standin(port: int = 0, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    Функция запускает заглушку в фоновом потоке.
+    При port=0 порт выбирается системой, его можно узнать из server.server_address
+    """
+    server = ThreadingHTTPServer((host, port), _StandinHandler)
+    server.daemon_threads = True
+    server.indices = set()
+    server.stats = StandinStats()
+    threading.Thread(target=server.serve_forever, name='es-standin', daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9201)
+    args = parser.parse_args()
+
+    server = start_standin(args.port, args.host)
+    print(f'Elasticsearch stand-in is listening on http://{args.host}:{args.port}, stats at /_stats')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Микробенчмарки трансформации и кодирования bulk-тела.
+
+Измеряет Transformer.transform_filmworks в режиме pydantic и в быстром режиме,
+а также кодирование документов: row.json() pydantic, json и orjson (если установлен).
+Каждое измерение повторяется --repeat раз, в результаты попадает лучшее время.
+
+Запуск из каталога etl:
+    python -m benchmarks.micro --films 20000 --output results.jsonl
+"""
+import argparse
+import json
+import time
+
+from etl_modules.transformer import Transformer
+from utils import serializer
+from .results import save_results
+from .transform_bench import generate_records
+
+
+def best_time(func, repeat: int) -> float:
+    """Функция возвращает лучшее время выполнения func из repeat запусков"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--persons-per-film', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='append results to this JSONL file')
+    args = parser.parse_args()
+
+    records = generate_records(args.films, args.persons_per_film, args.seed)
+    chunks = [records[i:i + args.chunk_size] for i in range(0, len(records), args.chunk_size)]
+    pydantic_transformer, fast_transformer = Transformer(), Transformer(fast_mode=True)
+    models = [model for chunk in chunks for model in pydantic_transformer.transform_filmworks(chunk)]
+    documents = [model.dict() for model in models]
+
+    def transform(transformer: Transformer):
+        return lambda: [transformer.transform_filmworks(chunk) for chunk in chunks]
+
+    timings = {
+        'transform_pydantic': best_time(transform(pydantic_transformer), args.repeat),
+        'transform_fast': best_time(transform(fast_transformer), args.repeat),
+        'encode_model_json': best_time(lambda: [model.json() for model in models], args.repeat),
+        'encode_json': best_time(
+            lambda: [json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode() for doc in documents],
+            args.repeat,
+        ),
+        'encode_document': best_time(lambda: [serializer.encode_document(doc) for doc in documents], args.repeat),
+    }
+    if serializer.orjson is not None:
+        timings['encode_orjson'] = best_time(lambda: [serializer.orjson.dumps(doc) for doc in documents], args.repeat)
+
+    results = {'payload_bytes': sum(len(serializer.dumps(doc)) for doc in documents)}
+    for name, seconds in timings.items():
+        results[f'{name}_seconds'] = round(seconds, 6)
+        results[f'{name}_docs_per_second'] = round(args.films / seconds, 1)
+
+    save_results('micro', vars(args) | {'orjson': serializer.orjson is not None}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Воспроизведение записанного трафика сервиса для профилирования без PostgreSQL, Redis и Elasticsearch.
+
+Запись включается в сервисе переменной RECORD_PATH: Extractor сохраняет выбранные чанки строк,
+Loader - тела bulk-запросов. Режим chunks прогоняет записанные чанки через Transformer и Loader,
+режим bulk отправляет записанные тела bulk-запросов без изменений.
+Приемник --sink null отвечает успехом без сети, --sink http - встроенная HTTP-заглушка Elasticsearch.
+Профиль снимается через cProfile или pyinstrument (если установлен); без --profile-output
+сводка печатается в консоль.
+
+Запуск из каталога etl:
+    RECORD_PATH=/tmp/etl-record python main.py
+    python -m benchmarks.replay /tmp/etl-record --sink http --profile cprofile --profile-output replay.prof
+"""
+import argparse
+import cProfile
+import json
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from etl_modules.loader import Loader
+from etl_modules.recorder import Recorder
+from etl_modules.transformer import Transformer
+from main import transform_chunk
+from utils.config import ElasticConfig
+from utils.metrics import REGISTRY
+from .es_standin import start_standin
+from .results import save_results
+
+
+class NullLoader(Loader):
+    """Loader без сети: индексы считаются созданными, каждый документ bulk-запроса - загруженным"""
+
+    def _ensure_indices(self) -> None:
+        self._indices_ready = True
+
+    def _bulk_request(self, batch: list[dict]) -> list[tuple[bool, dict]]:
+        return [(True, {action.get('_op_type', 'index'): {'_id': action['_id'], 'status': 200}}) for action in batch]
+
+
+@contextmanager
+def profiled(profiler: Optional[str], output: Optional[str] = None):
+    """
+    Контекстный менеджер профилирует выполнение блока
+    :param profiler: cprofile, pyinstrument или None
+    :param output: файл профиля: статистика pstats для cProfile, HTML для pyinstrument
+    """
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if output:
+                profile.dump_stats(output)
+            else:
+                pstats.Stats(profile).sort_stats('cumulative').print_stats(30)
+    elif profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise SystemExit('pyinstrument is not installed')
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            if output:
+                with open(output, 'w', encoding='utf-8') as file:
+                    file.write(profile.output_html())
+            else:
+                print(profile.output_text(unicode=True))
+    else:
+        yield
+
+
+def replay_chunks(directory: str, transformer: Transformer, loader: Loader) -> int:
+    """
+    Функция прогоняет записанные чанки строк через Transformer и Loader
+    :return: количество загруженных документов
+    """
+    loaded = 0
+    for data in Recorder.read_chunks(directory):
+        _, _, transformed_data = transform_chunk(transformer, data)
+        loaded += len(loader.load_filmworks(transformed_data))
+    return loaded
+
+
+def replay_bulk(directory: str, loader: Loader, send: bool) -> int:
+    """
+    Функция отправляет записанные тела bulk-запросов
+    :param send: отправлять ли запросы; иначе тела только читаются
+    :return: количество отправленных документов
+    """
+    documents = 0
+    for body in Recorder.read_bulk(directory):
+        if send:
+            documents += len(loader.client.bulk(operations=body)['items'])
+        else:
+            documents += count_bulk_actions(body)
+    return documents
+
+
+def count_bulk_actions(body: bytes) -> int:
+    """Функция считает действия в теле bulk-запроса: за строкой действия следует документ, кроме удаления"""
+    lines = body.splitlines()
+    count = position = 0
+    while position < len(lines):
+        operation = next(iter(json.loads(lines[position])))
+        count += 1
+        position += 1 if operation == 'delete' else 2
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='directory written by the service with RECORD_PATH')
+    parser.add_argument('--mode', choices=('chunks', 'bulk'), default='chunks')
+    parser.add_argument('--sink', choices=('null', 'http'), default='null')
+    parser.add_argument('--fast-transform', action='store_true')
+    parser.add_argument('--profile', choices=('cprofile', 'pyinstrument'))
+    parser.add_argument('--profile-output', help='write the profile to this file instead of printing it')
+    parser.add_argument('--output', help='append results to this JSONL file')
+    args = parser.parse_args()
+
+    elastic_overrides = {'movies_index': 'movies_replay', 'genres_index': 'genres_replay'}
+    standin = None
+    if args.sink == 'http':
+        standin = start_standin()
+        host, port = standin.server_address
+        elastic_overrides.update(elastic_host=host, elastic_port=port)
+    elastic_config = ElasticConfig(**elastic_overrides)
+    loader = NullLoader(elastic_config) if args.sink == 'null' else Loader(elastic_config)
+
+    started = time.perf_counter()
+    try:
+        with profiled(args.profile, args.profile_output):
+            if args.mode == 'chunks':
+                documents = replay_chunks(args.directory, Transformer(fast_mode=args.fast_transform), loader)
+            else:
+                documents = replay_bulk(args.directory, loader, send=standin is not None)
+    finally:
+        loader.close()
+        if standin is not None:
+            standin.shutdown()
+    duration = time.perf_counter() - started
+
+    metrics = REGISTRY.snapshot()
+    results = {
+        'duration_seconds': round(duration, 3),
+        'documents': documents,
+        'documents_per_second': round(documents / duration, 1) if duration else 0,
+    }
+    for stage, timing in metrics['etl_stage_duration_seconds'].items():
+        results[f'{stage}_seconds'] = timing['sum']
+    save_results('replay', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Сохранение результатов бенчмарков в машиночитаемом виде для сравнения между коммитами"""
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def git_commit() -> Optional[str]:
+    """Функция возвращает текущий коммит репозитория, если он доступен"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(benchmark: str, params: dict, results: dict, output: Optional[str] = None) -> dict:
+    """
+    Функция печатает результаты и при необходимости дописывает их строкой JSON в файл output
+    :param benchmark: имя бенчмарка
+    :param params: параметры запуска
+    :param results: измеренные значения, имена метрик должны совпадать между запусками
+    """
+    record = {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    print(json.dumps(record, indent=2, ensure_ascii=False))
+    if output:
+        with open(output, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return record
@@ -0,0 +1,118 @@
+"""
+Бенчмарк трансформации и кодирования документов фильмов.
+Сравнивает путь через pydantic-модели с быстрым режимом Transformer,
+проверяет, что итоговые bulk-тела обоих режимов совпадают побайтно, а документы семантически равны
+прежнему кодированию Loader (ESFilmWork.json()): совпадают после разбора JSON, хотя байты отличаются
+разделителями и экранированием не-ASCII символов.
+
+Запуск из каталога etl:
+    python -m benchmarks.transform_bench --films 20000 --chunk-size 500
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+
+from etl_modules.transformer import Transformer
+from utils.serializer import encode_document
+
+
+def generate_records(count: int, persons_per_film: int = 12, seed: int = 42) -> list[dict]:
+    """Функция генерирует строки в формате результата SQL_FILMWORD_DATA"""
+    rnd = random.Random(seed)
+    genres = ['Action', 'Comedy', 'Drama', 'Sci-Fi', 'Документальный', 'Thriller']
+    persons = [
+        {'id': str(uuid.UUID(int=rnd.getrandbits(128))), 'name': f'Person {number} Имя'}
+        for number in range(count // 2 + persons_per_film)
+    ]
+    records = []
+    for number in range(count):
+        cast = rnd.sample(persons, persons_per_film)
+        actors, writers, directors = cast[:-4], cast[-4:-1], cast[-1:]
+        if number % 50 == 0:
+            records.append(empty_record(rnd, number))
+            continue
+        records.append({
+            'id': str(uuid.UUID(int=rnd.getrandbits(128))),
+            'rating': round(rnd.uniform(0, 10), 1) if rnd.random() > 0.1 else None,
+            'title': f'Film {number} "Название"',
+            'description': f'Description of film {number}\n' * rnd.randint(0, 3) or None,
+            'genre': rnd.sample(genres, rnd.randint(1, 3)),
+            'director': [p['name'] for p in directors],
+            'actors_names': [p['name'] for p in actors],
+            'writers_names': [p['name'] for p in writers],
+            'actors': actors,
+            'writers': writers,
+            'directors': directors,
+        })
+    return records
+
+
+def empty_record(rnd: random.Random, number: int) -> dict:
+    """
+    Функция генерирует строку фильма без связей: агрегаты SQL дают NULL, [] или [null] для жанров
+    """
+    return {
+        'id': str(uuid.UUID(int=rnd.getrandbits(128))),
+        'rating': None,
+        'title': f'Film {number} without links',
+        'description': None,
+        'genre': rnd.choice(([None], [])),
+        'director': [],
+        'actors_names': None,
+        'writers_names': None,
+        'actors': None,
+        'writers': None,
+        'directors': None,
+    }
+
+
+def baseline_documents(chunks: list[list[dict]]) -> list[dict]:
+    """Функция кодирует документы прежним способом Loader, ESFilmWork.json(), и разбирает их обратно"""
+    transformer = Transformer()
+    return [json.loads(row.json()) for chunk in chunks for row in transformer.transform_filmworks(chunk)]
+
+
+def encode_chunks(transformer: Transformer, chunks: list[list[dict]]) -> list[bytes]:
+    """Функция трансформирует чанки и кодирует их в NDJSON-тела документов"""
+    return [
+        b'\n'.join(source for _, source in map(encode_document, transformer.transform_filmworks(chunk)))
+        for chunk in chunks
+    ]
+
+
+def measure(func, *args) -> tuple:
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    args = parser.parse_args()
+
+    records = generate_records(args.films)
+    chunks = [records[i:i + args.chunk_size] for i in range(0, len(records), args.chunk_size)]
+
+    reference, reference_time = measure(encode_chunks, Transformer(), chunks)
+    fast, fast_time = measure(encode_chunks, Transformer(fast_mode=True), chunks)
+
+    if reference != fast:
+        raise SystemExit('Fast transform output differs from the pydantic path')
+    decoded = [json.loads(line) for body in fast for line in body.split(b'\n')]
+    if decoded != baseline_documents(chunks):
+        raise SystemExit('Fast transform documents are not semantically equal to ESFilmWork.json()')
+
+    print(
+        f'films: {args.films}, payload: {sum(map(len, reference))} bytes, '
+        'outputs are byte-identical between modes and semantically equal to ESFilmWork.json()'
+    )
+    print(f'pydantic path: {reference_time:.3f}s ({args.films / reference_time:.0f} docs/s)')
+    print(f'fast path:     {fast_time:.3f}s ({args.films / fast_time:.0f} docs/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import logging
+import re
+import time
+from datetime import datetime
+from typing import AsyncGenerator, Iterable, Optional
+
+from utils.connection import async_postgresql_connection
+from utils.metrics import STAGE_DURATION, ROWS
+from utils.serializer import estimate_size
+from .extractor import Extractor
+from .sql_queries import SQL_SKIP_PROCESSED_FILMWORKS, SQL_COUNT_CHANGED_FILMWORKS
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+PARAM_PATTERN = re.compile(r'%\((\w+)\)s')
+# Параметры запросов с моментом времени: в бинарном протоколе asyncpg они передаются как datetime
+TIMESTAMP_PARAM_PATTERN = re.compile(r'^(modified|\w+_since|\w+_until)$')
+
+# Ошибки соединения с PostgreSQL, после которых запуск можно повторить
+POSTGRES_ERRORS = (OSError,) if asyncpg is None else (
+    OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError, asyncpg.CannotConnectNowError,
+)
+
+
+def to_positional(sql: str, params: dict) -> tuple[str, list]:
+    """
+    Функция переводит запрос с параметрами psycopg2 (%(name)s) в запрос asyncpg ($1, $2, ...)
+    :return: запрос и список аргументов
+    """
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f'${names.index(name) + 1}'
+
+    sql = PARAM_PATTERN.sub(replace, sql).replace('%%', '%')
+    args = [
+        datetime.fromisoformat(params[name])
+        if TIMESTAMP_PARAM_PATTERN.match(name) and isinstance(params[name], str) else params[name]
+        for name in names
+    ]
+    return sql, args
+
+
+class AsyncExtractor(Extractor):
+    """
+    Класс AsyncExtractor - вариант Extractor для асинхронного режима на asyncpg.
+    Запросы и порядок обхода те же, что у Extractor, но строки читаются в бинарном протоколе
+    через серверный курсор с упреждающей выборкой (prefetch = itersize), а ожидание базы
+    не блокирует загрузку предыдущих чанков в Elastic.
+    Кеш персон и жанров не поддерживается. Водяные знаки и жанры выбираются синхронными методами Extractor
+    в отдельном потоке: это несколько коротких запросов за запуск
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.lookup_cache is not None:
+            raise ValueError('AsyncExtractor does not support the lookup cache')
+
+    async def extract_filmworks(
+            self,
+            watermarks: Optional[dict],
+            target: Optional[dict] = None,
+            last_key: Optional[tuple] = None,
+            pending_ids: Iterable[str] = (),
+    ) -> AsyncGenerator:
+        """
+        Асинхронный вариант Extractor.extract_filmworks, параметры совпадают.
+        Временная таблица changed_filmworks удаляется при завершении транзакции,
+        поэтому вся выгрузка выполняется в одной транзакции
+        """
+        async with async_postgresql_connection(self.database_config.dict()) as pg_conn:
+            async with pg_conn.transaction():
+                total = await self._collect_changed_filmworks_async(pg_conn, watermarks, target, last_key, pending_ids)
+                logger.info(f'Shard {self.shard_index}/{self.shard_count}: {total} filmworks to update')
+                if not total:
+                    logger.info('No data to update')
+                    return
+
+                count = 0
+                page_key = None
+                while True:
+                    page_count = 0
+                    query, args = to_positional(*self._filmworks_page_query(page_key))
+                    async for chunk in self._fetch_chunks_async(pg_conn, query, args):
+                        page_count += len(chunk)
+                        count += len(chunk)
+                        page_key = self.chunk_key(chunk)
+                        if self.recorder is not None:
+                            self.recorder.record_chunk(chunk)
+                        logger.info(f'{count}/{total}')
+                        yield chunk
+
+                    if page_count < self.page_size:
+                        break
+
+    async def _collect_changed_filmworks_async(self, pg_conn, watermarks, target, last_key, pending_ids) -> int:
+        """
+        Асинхронный вариант Extractor._collect_changed_filmworks.
+        Запрос с параметрами в asyncpg может содержать только одну команду, поэтому команды выполняются по очереди
+        """
+        pending_ids = list(pending_ids)
+        sql, params = self._changed_filmworks_query(watermarks, target, pending_ids)
+        for statement in filter(str.strip, sql.split(';')):
+            query, args = to_positional(statement, params)
+            await pg_conn.execute(query, *args)
+
+        if last_key is not None:
+            modified, filmwork_id = last_key
+            query, args = to_positional(
+                SQL_SKIP_PROCESSED_FILMWORKS, {'modified': modified, 'id': filmwork_id, 'pending_ids': pending_ids}
+            )
+            await pg_conn.execute(query, *args)
+
+        total, oldest_modified = await pg_conn.fetchrow(SQL_COUNT_CHANGED_FILMWORKS)
+        return self._observe_changes(total, oldest_modified)
+
+    async def _fetch_chunks_async(self, pg_conn, query: str, args: list) -> AsyncGenerator:
+        """
+        Асинхронный вариант Extractor._fetch_chunks: чанк ограничивается batch_size строк и max_chunk_bytes.
+        Серверный курсор asyncpg при обходе заранее запрашивает следующие itersize строк
+        """
+        if self.server_side_cursor:
+            records = pg_conn.cursor(query, *args, prefetch=self.itersize).__aiter__()
+        else:
+            records = self._iterate(await pg_conn.fetch(query, *args))
+
+        carry = None
+        while True:
+            size = self.batch_size.size
+            chunk, chunk_bytes = [], 0
+            started = time.perf_counter()
+            with STAGE_DURATION.time(stage='extract'):
+                while len(chunk) < size:
+                    if carry is None:
+                        try:
+                            row = dict(await records.__anext__())
+                        except StopAsyncIteration:
+                            break
+                        carry = row, 0 if self.max_chunk_bytes is None else estimate_size(row)
+                    row, row_bytes = carry
+                    if chunk and self.max_chunk_bytes is not None and chunk_bytes + row_bytes > self.max_chunk_bytes:
+                        break
+                    chunk.append(row)
+                    chunk_bytes += row_bytes
+                    carry = None
+            if not chunk:
+                return
+            self.batch_size.record(
+                len(chunk), time.perf_counter() - started, None if self.max_chunk_bytes is None else chunk_bytes
+            )
+            ROWS.inc(len(chunk), stage='extract')
+            yield chunk
+
+    @staticmethod
+    async def _iterate(rows: list) -> AsyncGenerator:
+        for row in rows:
+            yield row
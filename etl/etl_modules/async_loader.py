@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Iterable, Optional, Union
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
+
+from utils.batching import AdaptiveBatchSize
+from utils.config import ESFilmWork
+from utils.connection import async_backoff
+from utils.fingerprint_cache import FingerprintCache
+from utils.metrics import STAGE_DURATION, ROWS, BULK_ERRORS
+from utils.resilience import CircuitBreaker
+from .loader import Loader, ELASTIC_ERRORS
+from .recorder import Recorder
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLoader(Loader):
+    """
+    Класс AsyncLoader - вариант Loader для асинхронного режима.
+    Документы фильмов отправляются клиентом AsyncElasticsearch: до bulk_concurrency bulk-запросов
+    выполняются одновременно в одном потоке, без пула потоков.
+    Управление индексами (создание, полная перезагрузка, переключение алиаса) и загрузка жанров
+    выполняются редко и остаются синхронными методами Loader
+    """
+
+    def __init__(
+            self,
+            elastic_config,
+            fingerprint_cache: Optional[FingerprintCache] = None,
+            bulk_batch_size: Optional[AdaptiveBatchSize] = None,
+            chunk_retries: int = 0,
+            breaker: Optional[CircuitBreaker] = None,
+            recorder: Optional[Recorder] = None,
+    ):
+        super().__init__(elastic_config, fingerprint_cache, bulk_batch_size, chunk_retries, breaker, recorder)
+        self.bulk_concurrency = elastic_config.bulk_concurrency
+        self.async_client = AsyncElasticsearch(
+            self.elastic_url, connections_per_node=elastic_config.connections_per_node
+        )
+
+    async def load_filmworks(self, transformed_data: list[Union[ESFilmWork, dict, tuple[str, bytes]]]) -> list[str]:
+        """
+        Асинхронный вариант Loader.load_filmworks
+        :return: список id успешно загруженных и пропущенных без изменений документов
+        """
+        documents, digests, unchanged_ids = self._filmwork_documents(transformed_data)
+        loaded_ids = await self._bulk_async(self._index_actions(self._rebuild_index or self.movies_index, documents))
+        return self._remember_loaded(loaded_ids, digests, unchanged_ids)
+
+    async def aclose(self) -> None:
+        """Метод закрывает асинхронные и синхронные соединения с Elastic"""
+        await self.async_client.close()
+        self.close()
+
+    async def _bulk_async(self, actions: Iterable[dict]) -> list[str]:
+        """Асинхронный вариант Loader._bulk"""
+        actions = list(actions)
+        retry = async_backoff(
+            exceptions=ELASTIC_ERRORS, start_sleep_time=1, max_retries=self.chunk_retries, breaker=self.breaker
+        )
+        with STAGE_DURATION.time(stage='load'):
+            loaded_ids = await retry(self._send_chunk_async)(actions)
+        ROWS.inc(len(loaded_ids), stage='load')
+        return loaded_ids
+
+    async def _send_chunk_async(self, actions: list[dict]) -> list[str]:
+        """
+        Асинхронный вариант Loader._send_chunk: одновременно выполняется не более bulk_concurrency запросов
+        :return: список id успешно обработанных документов
+        """
+        loaded_ids = []
+        queue = deque(actions)
+        for attempt in range(self.bulk_rejection_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.bulk_rejection_backoff * 2 ** (attempt - 1))
+            rejected = []
+            in_flight = set()
+            try:
+                while queue or in_flight:
+                    while queue and len(in_flight) < self.bulk_concurrency:
+                        in_flight.add(asyncio.create_task(self._send_batch_async(self._next_batch(queue))))
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        batch_loaded_ids, batch_rejected = task.result()
+                        loaded_ids.extend(batch_loaded_ids)
+                        rejected.extend(batch_rejected)
+            except Exception:
+                # Перед повтором пачки нужно дождаться запросов, которые еще выполняются
+                if in_flight:
+                    await asyncio.wait(in_flight)
+                raise
+            if not rejected:
+                break
+            logger.warning(f'{len(rejected)} documents rejected by Elastic, retry {attempt + 1}')
+            queue.extend(rejected)
+
+        for action in queue:
+            BULK_ERRORS.inc(index=action['_index'])
+            logger.error(f'Failed to index document {action["_id"]}: rejected by Elastic')
+
+        return loaded_ids
+
+    async def _send_batch_async(self, batch: list[dict]) -> tuple[list[str], list[dict]]:
+        """Асинхронный вариант Loader._send_batch"""
+        if self.recorder is not None:
+            self.recorder.record_bulk(batch)
+        started = time.perf_counter()
+        retry = async_backoff(exceptions=ELASTIC_ERRORS, max_retries=self.bulk_retries, breaker=self.breaker)
+        return self._batch_results(batch, await retry(self._bulk_request_async)(batch), started)
+
+    async def _bulk_request_async(self, batch: list[dict]) -> list[tuple[bool, dict]]:
+        """Метод выполняет один bulk-запрос, ошибки отдельных документов возвращаются в результате"""
+        return [
+            result async for result in async_streaming_bulk(
+                self.async_client,
+                batch,
+                chunk_size=len(batch),
+                max_chunk_bytes=self.bulk_max_chunk_bytes,
+                raise_on_error=False,
+                raise_on_exception=False,
+            )
+        ]
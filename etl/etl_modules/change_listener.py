@@ -0,0 +1,96 @@
+import json
+import logging
+import select
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from utils.config import DataBaseConfig
+from utils.connection import postgresql_connection
+from .sql_queries import SQL_NOTIFY_FUNCTION, SQL_NOTIFY_TRIGGER
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeListener:
+    """
+    Класс ChangeListener получает уведомления об изменениях из PostgreSQL через LISTEN/NOTIFY.
+    Триггеры на таблицах контента отправляют в канал событие с таблицей, операцией и id строки,
+    что позволяет запускать обновление сразу после изменения, а не по таймеру
+    """
+
+    TABLES = ('film_work', 'person', 'genre', 'person_film_work', 'genre_film_work')
+
+    def __init__(self, database_config: DataBaseConfig, channel: str = 'etl_changes', debounce: float = 1.0):
+        self.database_config = database_config
+        self.channel = channel
+        self.debounce = debounce
+        self.conn = None
+
+    def install_triggers(self) -> None:
+        """Метод создает функцию и триггеры, отправляющие уведомления об изменениях"""
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor() as curs:
+                curs.execute(SQL_NOTIFY_FUNCTION)
+                for table in self.TABLES:
+                    curs.execute(SQL_NOTIFY_TRIGGER.format(table=table), {'channel': self.channel})
+            pg_conn.commit()
+        logger.info(f'Change notification triggers installed for channel {self.channel}')
+
+    def wait(self, timeout: float) -> list[dict]:
+        """
+        Метод ждет события не дольше timeout секунд.
+        После первого события еще debounce секунд собирает следующие, чтобы обработать их одной пачкой.
+        При потере соединения метод просто выжидает timeout: обновление произойдет по таймеру
+        :return: список событий
+        """
+        try:
+            conn = self._connect()
+            if not select.select([conn], [], [], timeout)[0]:
+                return []
+
+            events = []
+            deadline = time.monotonic() + self.debounce
+            while True:
+                conn.poll()
+                while conn.notifies:
+                    events.append(json.loads(conn.notifies.pop(0).payload))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return events
+                select.select([conn], [], [], remaining)
+        except psycopg2.OperationalError as e:
+            logger.warning(f'Change listener connection error {e}, falling back to polling')
+            self.close()
+            time.sleep(timeout)
+            return []
+
+    def close(self) -> None:
+        """Метод закрывает соединение слушателя"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def filmwork_ids(events: list[dict]) -> set[str]:
+        """
+        Метод возвращает id фильмов, затронутых событиями: измененных фильмов и фильмов, у которых
+        изменились связи с персонами и жанрами. Изменения персон и жанров находятся по полю modified
+        """
+        ids = set()
+        for event in events:
+            if event['table'] == 'film_work' and event['op'] != 'DELETE':
+                ids.add(event['id'])
+            elif event.get('film_work_id'):
+                ids.add(event['film_work_id'])
+        return ids
+
+    def _connect(self):
+        """Метод открывает соединение и подписывается на канал"""
+        if self.conn is None:
+            self.conn = psycopg2.connect(**self.database_config.dict())
+            self.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with self.conn.cursor() as curs:
+                curs.execute(f'LISTEN "{self.channel}"')
+        return self.conn
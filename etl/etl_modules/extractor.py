@@ -1,13 +1,23 @@
 import logging
-from datetime import datetime
-from typing import Generator
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Generator, Iterable, Optional
 
+from utils.batching import AdaptiveBatchSize
 from utils.config import DataBaseConfig
 from utils.connection import postgresql_connection
+from utils.metrics import STAGE_DURATION, ROWS, CHECKPOINT_LAG, FRESHNESS_LAG
+from utils.serializer import estimate_size
+from utils.watermarks import with_overlap
+from .lookup_cache import LookupCache
+from .recorder import Recorder
 from .sql_queries import (
-    SQL_FILMWORD_DATA, SQL_FILMWORK_IDS,
+    SQL_FILMWORD_DATA, SQL_FILMWORK_LINKS, SQL_FILMWORK_IDS,
     SQL_FILMWORK_IDS_BY_PERSONS, SQL_FILMWORK_IDS_BY_GENRES,
-    SQL_GENRES_DATA
+    SQL_CHANGED_FILMWORKS, SQL_SKIP_PROCESSED_FILMWORKS,
+    SQL_COUNT_CHANGED_FILMWORKS, SQL_GENRES_DATA,
+    SQL_GENRE_IDS, SQL_HIGH_WATERMARKS, SQL_NOW
 )
 
 logger = logging.getLogger(__name__)
@@ -16,83 +26,290 @@ logger = logging.getLogger(__name__)
 class Extractor:
     """Класс Extractor предназначен для извлечения данных из PostgreSQL"""
 
-    def __init__(self, chunk_size: int, database_config: DataBaseConfig):
+    def __init__(
+            self,
+            chunk_size: int,
+            database_config: DataBaseConfig,
+            itersize: int = 2000,
+            server_side_cursor: bool = True,
+            page_size: int = 1000,
+            shard_index: int = 0,
+            shard_count: int = 1,
+            batch_size: Optional[AdaptiveBatchSize] = None,
+            lookup_cache: Optional[LookupCache] = None,
+            watermark_overlap: float = 0.0,
+            max_chunk_bytes: Optional[int] = None,
+            recorder: Optional[Recorder] = None,
+    ):
+        """
+        :param chunk_size: размер чанка, если не задан адаптивный batch_size
+        :param batch_size: контроллер, подбирающий размер чанка по времени выборки
+        :param lookup_cache: кеш персон и жанров; если задан, из базы выбираются только id связей,
+        а документы собираются в Python
+        :param watermark_overlap: окно перекрытия в секундах, на которое нижние водяные знаки сдвигаются назад
+        :param max_chunk_bytes: ограничение оценочного объема чанка; строка, которая не помещается в чанк,
+        начинает следующий, поэтому фильм с тысячами участников не раздувает чанк из обычных фильмов
+        :param recorder: запись выбранных чанков фильмов для воспроизведения без базы
+        """
         self.chunk_size = chunk_size
+        self.batch_size = batch_size or AdaptiveBatchSize.fixed('extract', chunk_size)
         self.database_config = database_config
+        self.itersize = itersize
+        self.server_side_cursor = server_side_cursor
+        self.page_size = page_size
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.lookup_cache = lookup_cache
+        self.watermark_overlap = watermark_overlap
+        self.max_chunk_bytes = max_chunk_bytes
+        self.recorder = recorder
 
-    def extract_filmworks(self, extract_timestamp: datetime, to_skip_list: list) -> Generator:
+    def capture_watermarks(self) -> dict:
+        """
+        Метод фиксирует верхние водяные знаки по часам PostgreSQL до начала выгрузки:
+        ключ (modified, id) последней измененной строки фильмов, персон и жанров и момент фиксации
+        :return: водяные знаки {таблица: [modified, id, момент фиксации]} с моментами в ISO/UTC,
+        пустые таблицы отсутствуют
+        """
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor() as curs:
+                curs.execute(SQL_HIGH_WATERMARKS)
+                return {
+                    table: [
+                        modified.astimezone(timezone.utc).isoformat(),
+                        row_id,
+                        captured_at.astimezone(timezone.utc).isoformat(),
+                    ]
+                    for table, modified, row_id, captured_at in curs.fetchall()
+                }
+
+    def extract_filmworks(
+            self,
+            watermarks: Optional[dict],
+            target: Optional[dict] = None,
+            last_key: Optional[tuple] = None,
+            pending_ids: Iterable[str] = (),
+    ) -> Generator:
         """
         Метод позволяет чанками извлекать список фильмов для обновления
-        Для начала выбираются все id фильмов которые были обновлены, обновлены их жанры или
-        обновлены их участники.
-        Далее выбираются данных, для всех нужных id, которые будут загружены в Elastic
-        :param extract_timestamp: время, с которого нужно выбрать все обновленные фильмы
-        :param to_skip_list: список id фильмов, которые уже были обработаны, но произошла какая то ошибка
-        поэтому мы можем пропустить их
+        Для начала во временную таблицу changed_filmworks собираются id фильмов которые были обновлены,
+        обновлены их жанры или обновлены их участники. Дедупликация выполняется в PostgreSQL,
+        поэтому список id не передается в Python.
+        Далее измененные фильмы обходятся страницами по ключу (modified, id), каждая страница
+        соединяется с запросом агрегации данных, которые будут загружены в Elastic.
+        С кешем lookup_cache вместо агрегации выбираются id связанных персон и жанров, а строки собираются из кеша.
+        При шардировании выбираются только фильмы, хеш id которых попадает в шард воркера
+        :param watermarks: водяные знаки прошлого запуска {таблица: [modified, id]}; строки фильмов, персон
+        и жанров после них (с учетом окна перекрытия) считаются измененными. None - полная выгрузка
+        :param target: верхние водяные знаки из capture_watermarks; строки, измененные после них,
+        достанутся следующему запуску
+        :param last_key: ключ (modified, id) последнего загруженного фильма прерванного запуска,
+        все фильмы до него включительно уже обработаны и пропускаются
+        :param pending_ids: id фильмов, которые нужно обработать независимо от времени изменения:
+        не загруженные ранее или полученные из уведомлений об изменениях
         """
         with postgresql_connection(self.database_config.dict()) as pg_conn:
             with pg_conn.cursor() as curs:
-                filmworks_to_update = []
-                filmworks_to_update.extend(self._extract_filmworks(extract_timestamp, curs))
-                filmworks_to_update.extend(self._extract_filmworks_by_persons(extract_timestamp, curs))
-                filmworks_to_update.extend(self._extract_filmworks_by_genres(extract_timestamp, curs))
-                filmworks_to_update = list(set(filmworks_to_update))
-                filmworks_to_update = tuple(set(filmworks_to_update) - set(to_skip_list))
-
-                if not filmworks_to_update:
-                    logger.info('No data to update')
-                    return
-
-                sql = SQL_FILMWORD_DATA
-                curs.execute(sql, [filmworks_to_update])
-                count = 0
-                while rows := curs.fetchmany(self.chunk_size):
-                    count += self.chunk_size
-                    logger.info(f'{count}/{len(filmworks_to_update)}')
-                    columns = [col[0] for col in curs.description]
-                    yield [dict(zip(columns, row)) for row in rows]
-
-    def extract_genres(self) -> Generator:
-        """
-        Метод позволяет чанками извлекать жанры для обновления
+                total = self._collect_changed_filmworks(watermarks, target, last_key, pending_ids, curs)
+                logger.info(f'Shard {self.shard_index}/{self.shard_count}: {total} filmworks to update')
+                if total and self.lookup_cache is not None:
+                    self.lookup_cache.refresh(curs)
+
+            if not total:
+                logger.info('No data to update')
+                return
+
+            count = 0
+            page_key = None
+            while True:
+                page_count = 0
+                with self._data_cursor(pg_conn, 'etl_filmworks') as curs:
+                    curs.execute(*self._filmworks_page_query(page_key))
+                    for chunk in self._fetch_chunks(curs):
+                        page_count += len(chunk)
+                        count += len(chunk)
+                        page_key = self.chunk_key(chunk)
+                        if self.lookup_cache is not None:
+                            with pg_conn.cursor() as lookup_curs:
+                                chunk = self.lookup_cache.assemble(lookup_curs, chunk)
+                        if self.recorder is not None:
+                            self.recorder.record_chunk(chunk)
+                        logger.info(f'{count}/{total}')
+                        yield chunk
+
+                if page_count < self.page_size:
+                    break
+
+    def extract_genres(self, last_key: Optional[tuple] = None) -> Generator:
         """
+        Метод позволяет чанками извлекать жанры для обновления в порядке (modified, id)
+        :param last_key: ключ (modified, id) последнего загруженного жанра, более ранние жанры пропускаются
+        """
+        params = {}
+        sql = SQL_GENRES_DATA.format(filter=" ")
+        if last_key is not None:
+            params['modified'], params['id'] = last_key
+            sql = SQL_GENRES_DATA.format(filter="WHERE (g.modified, g.id) > (%(modified)s, %(id)s)")
+
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with self._data_cursor(pg_conn, 'etl_genres') as curs:
+                curs.execute(sql, params)
+                yield from self._fetch_chunks(curs)
+
+    def capture_time(self) -> str:
+        """Метод возвращает текущий момент по часам PostgreSQL в ISO/UTC"""
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor() as curs:
+                curs.execute(SQL_NOW)
+                return curs.fetchone()[0].astimezone(timezone.utc).isoformat()
+
+    def extract_genre_ids(self) -> set[str]:
+        """Метод возвращает id всех жанров"""
         with postgresql_connection(self.database_config.dict()) as pg_conn:
             with pg_conn.cursor() as curs:
-                sql = SQL_GENRES_DATA
-                curs.execute(sql)
-                while rows := curs.fetchmany(self.chunk_size):
-                    columns = [col[0] for col in curs.description]
-                    yield [dict(zip(columns, row)) for row in rows]
+                curs.execute(SQL_GENRE_IDS)
+                return {row[0] for row in curs.fetchall()}
+
+    def _data_cursor(self, pg_conn, name: str):
+        """
+        Метод создает курсор для выборки данных.
+        В потоковом режиме используется именованный (серверный) курсор: PostgreSQL отдает строки
+        порциями по itersize, поэтому память клиента не зависит от размера выборки
+        :param pg_conn: соединение с PostgreSQL
+        :param name: имя серверного курсора
+        """
+        if not self.server_side_cursor:
+            return pg_conn.cursor()
+        curs = pg_conn.cursor(name=name)
+        curs.itersize = self.itersize
+        return curs
+
+    def _fetch_chunks(self, curs) -> Generator:
+        """
+        Метод разбивает результат запроса на чанки.
+        Размер каждого следующего чанка берется из контроллера batch_size с учетом времени выборки предыдущего,
+        при заданном max_chunk_bytes чанк ограничивается и по оценочному объему строк
+        """
+        rows_iterator = iter(curs)
+        carry = None
+        while True:
+            started = time.perf_counter()
+            with STAGE_DURATION.time(stage='extract'):
+                if self.max_chunk_bytes is None:
+                    rows, rows_bytes = list(islice(rows_iterator, self.batch_size.size)), None
+                else:
+                    rows, rows_bytes, carry = self._take_rows(rows_iterator, carry)
+            if not rows:
+                return
+            self.batch_size.record(len(rows), time.perf_counter() - started, rows_bytes)
+            ROWS.inc(len(rows), stage='extract')
+            columns = [col[0] for col in curs.description]
+            yield [dict(zip(columns, row)) for row in rows]
+
+    def _take_rows(self, rows_iterator, carry) -> tuple:
+        """
+        Метод набирает строки чанка, пока не достигнуты batch_size строк или max_chunk_bytes
+        :param carry: строка с оценкой объема, не поместившаяся в предыдущий чанк
+        :return: строки чанка, их оценочный объем и строка для следующего чанка
+        """
+        rows, rows_bytes = [], 0
+        size = self.batch_size.size
+        while len(rows) < size:
+            if carry is None:
+                row = next(rows_iterator, None)
+                if row is None:
+                    break
+                carry = row, estimate_size(row)
+            row, row_bytes = carry
+            if rows and rows_bytes + row_bytes > self.max_chunk_bytes:
+                break
+            rows.append(row)
+            rows_bytes += row_bytes
+            carry = None
+        return rows, rows_bytes, carry
+
+    def _filmworks_page_query(self, last_key: Optional[tuple]) -> tuple:
+        """
+        Метод формирует запрос следующей страницы фильмов
+        :param last_key: ключ (modified, id) последнего полученного фильма
+        """
+        query = SQL_FILMWORD_DATA if self.lookup_cache is None else SQL_FILMWORK_LINKS
+        params = {'page_size': self.page_size}
+        if last_key is None:
+            return query.format(filter=" "), params
+
+        params['modified'], params['id'] = last_key
+        sql = query.format(filter="WHERE (cfw.modified, cfw.id) > (%(modified)s, %(id)s)")
+        return sql, params
 
     @staticmethod
-    def _extract_filmworks(date, cursor):
-        sql = SQL_FILMWORK_IDS
-        if date is None:
-            sql = sql.format(filter=" ")
+    def chunk_key(chunk: list[dict]) -> tuple:
+        """Метод возвращает ключ (modified, id) последней строки чанка для контрольной точки"""
+        return chunk[-1]['modified'].isoformat(), chunk[-1]['id']
+
+    def _collect_changed_filmworks(self, watermarks, target, last_key, pending_ids, cursor) -> int:
+        """
+        Метод заполняет временную таблицу changed_filmworks id измененных фильмов
+        :return: количество фильмов для обновления
+        """
+        pending_ids = list(pending_ids)
+        cursor.execute(*self._changed_filmworks_query(watermarks, target, pending_ids))
+
+        if last_key is not None:
+            modified, filmwork_id = last_key
+            cursor.execute(
+                SQL_SKIP_PROCESSED_FILMWORKS, {'modified': modified, 'id': filmwork_id, 'pending_ids': pending_ids}
+            )
+
+        cursor.execute(SQL_COUNT_CHANGED_FILMWORKS)
+        return self._observe_changes(*cursor.fetchone())
+
+    def _changed_filmworks_query(self, watermarks, target, pending_ids: list[str]) -> tuple:
+        """Метод формирует запрос заполнения временной таблицы changed_filmworks и его параметры"""
+        params = {}
+        if watermarks is None:
+            changes = [SQL_FILMWORK_IDS.format(filter=" ")]
         else:
-            sql = sql.format(filter="WHERE fw.modified >  %s ")
-        cursor.execute(sql, [date])
-        rows = cursor.fetchall()
-        return [row[0] for row in rows]
+            since = with_overlap(watermarks, self.watermark_overlap)
+            changes = [
+                SQL_FILMWORK_IDS.format(filter=self._watermark_filter('fw', 'film_work', since, target, params)),
+                SQL_FILMWORK_IDS_BY_PERSONS.format(filter=self._watermark_filter('p', 'person', since, target, params)),
+                SQL_FILMWORK_IDS_BY_GENRES.format(filter=self._watermark_filter('g', 'genre', since, target, params)),
+            ]
+        if pending_ids:
+            changes.append(SQL_FILMWORK_IDS.format(filter="WHERE fw.id = ANY(%(pending_ids)s::uuid[]) "))
+        shard_filter = " "
+        if self.shard_count > 1:
+            shard_filter = "WHERE (hashtext(changes.id::text) & 2147483647) %% %(shard_count)s = %(shard_index)s "
+        sql = SQL_CHANGED_FILMWORKS.format(changes=' UNION ALL '.join(changes), shard_filter=shard_filter)
+        return sql, {
+            **params,
+            'pending_ids': pending_ids,
+            'shard_count': self.shard_count,
+            'shard_index': self.shard_index,
+        }
 
     @staticmethod
-    def _extract_filmworks_by_persons(date, cursor):
-        sql = SQL_FILMWORK_IDS_BY_PERSONS
-        if date is None:
-            sql = sql.format(filter=" ")
-        else:
-            sql = sql.format(filter="WHERE p.modified >  %s ")
-        cursor.execute(sql, [date])
-        rows = cursor.fetchall()
-        return [row[0] for row in rows]
+    def _observe_changes(total: int, oldest_modified: Optional[datetime]) -> int:
+        """Метод обновляет метрики отставания по результату SQL_COUNT_CHANGED_FILMWORKS"""
+        CHECKPOINT_LAG.set(total)
+        FRESHNESS_LAG.set((datetime.now(timezone.utc) - oldest_modified).total_seconds() if total else 0)
+        return total
 
     @staticmethod
-    def _extract_filmworks_by_genres(date, cursor):
-        sql = SQL_FILMWORK_IDS_BY_GENRES
-        if date is None:
-            sql = sql.format(filter=" ")
-        else:
-            sql = sql.format(filter="WHERE g.modified >  %s ")
-        cursor.execute(sql, [date])
-        rows = cursor.fetchall()
-        return [row[0] for row in rows]
+    def _watermark_filter(alias: str, table: str, since: dict, target: Optional[dict], params: dict) -> str:
+        """
+        Метод формирует условие выбора строк таблицы между водяными знаками: (since, target].
+        Сравнение по ключу (modified, id) не пропускает и не повторяет строки с одинаковым modified
+        :param params: параметры запроса, дополняются границами таблицы
+        """
+        conditions = []
+        if table in since:
+            params[f'{table}_since'], params[f'{table}_since_id'] = since[table]
+            conditions.append(f"({alias}.modified, {alias}.id) > (%({table}_since)s, %({table}_since_id)s::uuid)")
+        if target and table in target:
+            params[f'{table}_until'], params[f'{table}_until_id'] = target[table][:2]
+            conditions.append(f"({alias}.modified, {alias}.id) <= (%({table}_until)s, %({table}_until_id)s::uuid)")
+        if not conditions:
+            return " "
+        return f"WHERE {' AND '.join(conditions)} "
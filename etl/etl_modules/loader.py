@@ -1,16 +1,72 @@
-from elasticsearch import helpers
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Optional, Union
 
-from utils.config import ESFilmWork
-from utils.connection import elastic_connection
+from elasticsearch import Elasticsearch, helpers
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout
+
+from utils.batching import AdaptiveBatchSize
+from utils.config import ESFilmWork, ESGenre
+from utils.connection import backoff
+from utils.fingerprint_cache import FingerprintCache
+from utils.metrics import STAGE_DURATION, ROWS, BYTES, BULK_ERRORS, DOCUMENT_BYTES, OVERSIZED_DOCUMENTS
+from utils.resilience import CircuitBreaker
+from utils.serializer import encode_document
+from .recorder import Recorder
+
+logger = logging.getLogger(__name__)
+
+# Ошибки соединения, после которых запрос можно безопасно повторить: индексация по id идемпотентна
+ELASTIC_ERRORS = (ConnectionError, ConnectionTimeout)
 
 
 class Loader:
-    """Класс Loader предназначен для загрузки данных в Elasticsearch."""
+    """
+    Класс Loader предназначен для загрузки данных в Elasticsearch.
+    Loader владеет одним долгоживущим клиентом с пулом соединений, индексы проверяются один раз.
+    Имена индексов из конфигурации являются алиасами на версионные индексы (movies_v1, movies_v2, ...),
+    поэтому полная перезагрузка фильмов может выполняться в новый индекс без влияния на поиск.
+    Bulk-запросы отправляются параллельно, размер каждого запроса задает контроллер bulk_batch_size.
+    Ошибки соединения повторяются на уровне отдельного bulk-запроса (bulk_retries) и всей пачки (chunk_retries),
+    поэтому кратковременный сбой Elastic стоит одной пачки, а не перезапуска всей загрузки
+    """
 
-    def __init__(self, elastic_config):
+    def __init__(
+            self,
+            elastic_config,
+            fingerprint_cache: Optional[FingerprintCache] = None,
+            bulk_batch_size: Optional[AdaptiveBatchSize] = None,
+            chunk_retries: int = 0,
+            breaker: Optional[CircuitBreaker] = None,
+            recorder: Optional[Recorder] = None,
+    ):
+        if elastic_config.movies_index == elastic_config.genres_index:
+            # Алиасы и версионные индексы фильмов и жанров не должны пересекаться
+            raise ValueError(f'Movies and genres must use different indices, got {elastic_config.movies_index!r}')
         self.elastic_url = elastic_config.get_elastic_url()
         self.movies_index = elastic_config.movies_index
         self.genres_index = elastic_config.genres_index
+        self.bulk_thread_count = elastic_config.bulk_thread_count
+        self.bulk_max_chunk_bytes = elastic_config.bulk_max_chunk_bytes
+        self.bulk_oversized_bytes = elastic_config.bulk_oversized_bytes
+        self.bulk_rejection_retries = elastic_config.bulk_rejection_retries
+        self.bulk_rejection_backoff = elastic_config.bulk_rejection_backoff
+        self.bulk_batch_size = bulk_batch_size or AdaptiveBatchSize.fixed('bulk', elastic_config.bulk_chunk_size)
+        self.bulk_retries = elastic_config.bulk_retries
+        self.chunk_retries = chunk_retries
+        self.breaker = breaker
+        self.recorder = recorder
+        self._executor = ThreadPoolExecutor(self.bulk_thread_count, thread_name_prefix='etl-bulk')
+        self.number_of_replicas = elastic_config.number_of_replicas
+        self.forcemerge_segments = elastic_config.forcemerge_segments
+        self.client = Elasticsearch(self.elastic_url, connections_per_node=elastic_config.connections_per_node)
+        self._indices_ready = False
+        self._rebuild_index = None
+        self.fingerprint_cache = fingerprint_cache
+        self.skipped_documents = 0
 
         self.settings = {
             'refresh_interval': '1s',
@@ -154,23 +210,326 @@ class Loader:
             },
         }
 
-    def load_filmworks(self, transformed_data: list[ESFilmWork]) -> list[str]:
-        """Метод создает индекс при отсутствии и сохраняет переданную пачку данных в Elastic"""
+    def load_filmworks(self, transformed_data: list[Union[ESFilmWork, dict, tuple[str, bytes]]]) -> list[str]:
+        """
+        Метод сохраняет переданную пачку данных в Elastic.
+        Документ кодируется в JSON один раз, клиент Elastic передает готовые байты без повторной сериализации.
+        Документы, уже закодированные пулом процессов, передаются парами (id, bytes).
+        Если задан кеш отпечатков, документы, не изменившиеся с прошлой загрузки, не отправляются
+        :return: список id успешно загруженных и пропущенных без изменений документов
+        """
+        documents, digests, unchanged_ids = self._filmwork_documents(transformed_data)
+        loaded_ids = self._bulk(self._index_actions(self._rebuild_index or self.movies_index, documents))
+        return self._remember_loaded(loaded_ids, digests, unchanged_ids)
+
+    def load_genres(self, transformed_data: list[Union[ESGenre, dict]]) -> list[str]:
+        """
+        Метод сохраняет переданную пачку данных в Elastic
+        :return: список id успешно загруженных документов
+        """
+        self._ensure_indices()
+        documents = map(encode_document, transformed_data)
+        return self._bulk(self._index_actions(self.genres_index, documents))
+
+    def delete_filmworks(self, ids: Iterable[str]) -> list[str]:
+        """
+        Метод удаляет фильмы из Elastic, в том числе из индекса идущей полной перезагрузки
+        :return: список id удаленных документов
+        """
+        self._ensure_indices()
+        ids = list(ids)
+        indices = [self.movies_index] + ([self._rebuild_index] if self._rebuild_index else [])
+        deleted_ids = self._bulk(
+            {'_op_type': 'delete', '_index': index, '_id': doc_id} for index in indices for doc_id in ids
+        )
+        if self.fingerprint_cache is not None:
+            self.fingerprint_cache.discard(ids)
+        return deleted_ids
+
+    def genre_ids(self) -> set[str]:
+        """Метод возвращает id всех жанров в Elastic"""
+        self._ensure_indices()
+        return {hit['_id'] for hit in helpers.scan(self.client, index=self.genres_index, _source=False)}
+
+    def delete_genres(self, ids: Iterable[str]) -> list[str]:
+        """
+        Метод удаляет жанры из Elastic
+        :return: список id удаленных документов
+        """
+        self._ensure_indices()
+        return self._bulk({'_op_type': 'delete', '_index': self.genres_index, '_id': doc_id} for doc_id in ids)
+
+    def start_rebuild(self) -> str:
+        """
+        Метод начинает полную перезагрузку фильмов в новый версионный индекс.
+        Индекс создается без реплик и без обновления (refresh_interval: -1), что ускоряет bulk-загрузку
+        :return: имя нового индекса
+        """
+        self._ensure_indices()
+        versions = [version for _, version in self._versioned_indices(self.movies_index)]
+        index = f'{self.movies_index}_v{max(versions, default=0) + 1}'
+        settings = {**self.settings, 'refresh_interval': '-1', 'number_of_replicas': 0}
+        self.client.indices.create(index=index, settings=settings, mappings=self.movies_mappings)
+        logger.info(f'Full rebuild started into {index}')
+        self._rebuild_index = index
+        return index
+
+    def prepare(self, rebuild_index: Optional[str] = None) -> None:
+        """
+        Метод готовит Loader к запуску: создает индексы при их отсутствии и, если задан rebuild_index,
+        продолжает полную перезагрузку в этот индекс
+        """
+        self._ensure_indices()
+        if rebuild_index is not None:
+            self.resume_rebuild(rebuild_index)
+
+    def resume_rebuild(self, index: str) -> None:
+        """Метод продолжает прерванную полную перезагрузку в индекс index"""
+        self._rebuild_index = index
+
+    def finish_rebuild(self) -> None:
+        """
+        Метод завершает полную перезагрузку: возвращает рабочие настройки индекса, выполняет force merge,
+        атомарно переключает алиас на новый индекс и удаляет старые индексы.
+        Повторный вызов после сбоя безопасен
+        """
+        index = self._rebuild_index
+        self.client.indices.put_settings(
+            index=index,
+            settings={
+                'refresh_interval': self.settings['refresh_interval'],
+                'number_of_replicas': self.number_of_replicas,
+            },
+        )
+        self.client.options(request_timeout=3600).indices.forcemerge(
+            index=index, max_num_segments=self.forcemerge_segments
+        )
+        self.client.indices.refresh(index=index)
+
+        actions = [{'add': {'index': index, 'alias': self.movies_index}}]
+        if self.client.indices.exists_alias(name=self.movies_index):
+            actions.extend(
+                {'remove': {'index': name, 'alias': self.movies_index}}
+                for name in self._aliased_indices(self.movies_index) if name != index
+            )
+        elif self.client.indices.exists(index=self.movies_index):
+            # Индекс старого формата без алиаса удаляется в той же атомарной операции
+            actions.insert(0, {'remove_index': {'index': self.movies_index}})
+        self.client.indices.update_aliases(actions=actions)
+
+        # Удаляются и прежние версии, и версии, оставшиеся от прерванных перезагрузок
+        for name, _ in self._versioned_indices(self.movies_index):
+            if name != index:
+                self.client.options(ignore_status=404).indices.delete(index=name)
+        logger.info(f'Full rebuild finished, alias {self.movies_index} points to {index}')
+        self._rebuild_index = None
+        self.skipped_documents = 0
+
+    def close(self) -> None:
+        """Метод закрывает соединения с Elastic"""
+        self._executor.shutdown()
+        self.client.close()
+
+    def _ensure_indices(self) -> None:
+        """
+        Метод один раз за время жизни Loader создает индексы при их отсутствии.
+        Создается первая версия индекса с алиасом из конфигурации.
+        Ошибка 400 игнорируется: индекс мог быть создан параллельно другим воркером
+        """
+        if self._indices_ready:
+            return
+
+        indices = (
+            (self.movies_index, self.movies_mappings),
+            (self.genres_index, self.genres_mappings),
+        )
+        for alias, mappings in indices:
+            if not self.client.indices.exists(index=alias):
+                self.client.options(ignore_status=400).indices.create(
+                    index=f'{alias}_v1', settings=self.settings, mappings=mappings, aliases={alias: {}}
+                )
+                # Отпечатки относятся к документам прежнего индекса
+                if alias == self.movies_index and self.fingerprint_cache is not None:
+                    self.fingerprint_cache.clear()
+        self._indices_ready = True
+
+    def _filmwork_documents(self, transformed_data: list) -> tuple[list[tuple[str, bytes]], dict, set[str]]:
+        """
+        Метод кодирует документы фильмов и отбрасывает не изменившиеся с прошлой загрузки
+        :return: документы для отправки, отпечатки документов и id пропущенных документов
+        """
+        self._ensure_indices()
+        documents = list(map(encode_document, transformed_data))
+        if self.fingerprint_cache is None:
+            return documents, {}, set()
+
+        digests = {doc_id: FingerprintCache.digest(source) for doc_id, source in documents}
+        unchanged_ids = set()
+        # В новый индекс полной перезагрузки нужно записать все документы
+        if self._rebuild_index is None:
+            unchanged_ids = self.fingerprint_cache.unchanged(digests)
+            documents = [document for document in documents if document[0] not in unchanged_ids]
+            self.skipped_documents += len(unchanged_ids)
+        return documents, digests, unchanged_ids
+
+    def _remember_loaded(self, loaded_ids: list[str], digests: dict, unchanged_ids: set[str]) -> list[str]:
+        """Метод запоминает отпечатки загруженных документов и возвращает id загруженных и пропущенных"""
+        if self.fingerprint_cache is None:
+            return loaded_ids
+        self.fingerprint_cache.update({doc_id: digests[doc_id] for doc_id in loaded_ids})
+        return loaded_ids + list(unchanged_ids)
+
+    def _versioned_indices(self, alias: str) -> list[tuple[str, int]]:
+        """Метод возвращает версионные индексы алиаса с номерами версий"""
+        pattern = re.compile(rf'^{re.escape(alias)}_v(\d+)$')
+        indices = self.client.indices.get(index=f'{alias}_v*')
+        return [(name, int(match.group(1))) for name in indices if (match := pattern.match(name))]
+
+    def _aliased_indices(self, alias: str) -> list[str]:
+        """Метод возвращает индексы, на которые сейчас указывает алиас"""
+        return list(self.client.indices.get_alias(name=alias))
+
+    def _index_actions(self, index: str, documents: Iterable[tuple[str, bytes]]) -> Iterable[dict]:
+        """Метод формирует bulk-действия индексации закодированных документов и учитывает их размер"""
+        for doc_id, source in documents:
+            BYTES.inc(len(source), index=index)
+            DOCUMENT_BYTES.observe(len(source), index=index)
+            if len(source) >= self.bulk_oversized_bytes:
+                OVERSIZED_DOCUMENTS.inc(index=index)
+                logger.warning(f'Document {doc_id} is {len(source)} bytes, it will be sent in a separate bulk request')
+            yield {'_index': index, '_id': doc_id, '_source': source}
+
+    def _bulk(self, actions: Iterable[dict]) -> list[str]:
+        """
+        Метод отправляет пачку действий в Elastic.
+        При ошибке соединения, не исправленной повторами отдельных запросов, пачка отправляется заново
+        не более chunk_retries раз
+        :return: список id успешно обработанных документов
+        """
+        actions = list(actions)
+        retry = backoff(
+            exceptions=ELASTIC_ERRORS, start_sleep_time=1, max_retries=self.chunk_retries, breaker=self.breaker
+        )
+        with STAGE_DURATION.time(stage='load'):
+            loaded_ids = retry(self._send_chunk)(actions)
+        ROWS.inc(len(loaded_ids), stage='load')
+        return loaded_ids
+
+    def _send_chunk(self, actions: list[dict]) -> list[str]:
+        """
+        Метод параллельно отправляет bulk-запросы в Elastic, не более bulk_thread_count одновременно.
+        Размер следующего запроса берется из контроллера bulk_batch_size, поэтому он меняется
+        вслед за задержкой и отказами кластера уже в пределах одного вызова.
+        Документы, отклоненные из-за перегрузки (429), отправляются повторно с паузой,
+        остальные ошибки документов не прерывают загрузку, такие документы не попадают в результат
+        :return: список id успешно обработанных документов
+        """
+        loaded_ids = []
+        queue = deque(actions)
+        for attempt in range(self.bulk_rejection_retries + 1):
+            if attempt:
+                time.sleep(self.bulk_rejection_backoff * 2 ** (attempt - 1))
+            rejected = []
+            in_flight = set()
+            try:
+                while queue or in_flight:
+                    while queue and len(in_flight) < self.bulk_thread_count:
+                        in_flight.add(self._executor.submit(self._send_batch, self._next_batch(queue)))
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_loaded_ids, batch_rejected = future.result()
+                        loaded_ids.extend(batch_loaded_ids)
+                        rejected.extend(batch_rejected)
+            except Exception:
+                # Перед повтором пачки нужно дождаться запросов, которые еще выполняются
+                wait(in_flight)
+                raise
+            if not rejected:
+                break
+            logger.warning(f'{len(rejected)} documents rejected by Elastic, retry {attempt + 1}')
+            queue.extend(rejected)
+
+        for action in queue:
+            BULK_ERRORS.inc(index=action['_index'])
+            logger.error(f'Failed to index document {action["_id"]}: rejected by Elastic')
+
+        return loaded_ids
+
+    def _next_batch(self, queue: deque) -> list[dict]:
+        """
+        Метод забирает из очереди пачку действий размером bulk_batch_size, но не больше bulk_max_chunk_bytes.
+        Документ не меньше bulk_oversized_bytes отправляется отдельным запросом: его время и объем
+        не задерживают соседние документы и не влияют на подбор размера пачки
+        """
+        batch, batch_bytes = [], 0
+        size = self.bulk_batch_size.size
+        while queue and len(batch) < size:
+            action_bytes = self._action_bytes(queue[0])
+            oversized = action_bytes >= self.bulk_oversized_bytes
+            if batch and (oversized or batch_bytes + action_bytes > self.bulk_max_chunk_bytes):
+                break
+            batch.append(queue.popleft())
+            batch_bytes += action_bytes
+            if oversized:
+                break
+        return batch
+
+    def _send_batch(self, batch: list[dict]) -> tuple[list[str], list[dict]]:
+        """
+        Метод отправляет один bulk-запрос и передает контроллеру его время, объем и отказы
+        :return: id успешно обработанных документов и действия, отклоненные из-за перегрузки
+        """
+        if self.recorder is not None:
+            self.recorder.record_bulk(batch)
+        started = time.perf_counter()
+        retry = backoff(exceptions=ELASTIC_ERRORS, max_retries=self.bulk_retries, breaker=self.breaker)
+        return self._batch_results(batch, retry(self._bulk_request)(batch), started)
+
+    def _batch_results(self, batch: list[dict], results: list[tuple[bool, dict]], started: float) -> tuple:
+        """
+        Метод разбирает ответ bulk-запроса и передает контроллеру его время, объем и отказы
+        :param started: момент отправки запроса по time.perf_counter
+        :return: id успешно обработанных документов и действия, отклоненные из-за перегрузки
+        """
+        loaded_ids, rejected = [], []
+        for action, (ok, item) in zip(batch, results):
+            op_type, result = item.popitem()
+            # Удаление отсутствующего документа не считается ошибкой
+            if ok or (op_type == 'delete' and result.get('status') == 404):
+                loaded_ids.append(action['_id'])
+            elif self._is_rejection(result):
+                rejected.append(action)
+            else:
+                BULK_ERRORS.inc(index=action['_index'])
+                logger.error(f'Failed to index document {action["_id"]}: {result.get("error")}')
 
-        with elastic_connection(self.elastic_url) as conn:
-            if not conn.indices.exists(index=self.movies_index):
-                conn.indices.create(index=self.movies_index, settings=self.settings, mappings=self.movies_mappings)
+        payload_bytes = sum(map(self._action_bytes, batch))
+        if rejected:
+            self.bulk_batch_size.reject()
+        elif len(batch) > 1 or payload_bytes < self.bulk_oversized_bytes:
+            self.bulk_batch_size.record(len(batch), time.perf_counter() - started, payload_bytes)
+        return loaded_ids, rejected
 
-            data = [{'_index': 'movies', '_id': row.id, '_source': row.json()} for row in transformed_data]
-            helpers.bulk(conn, data)
-            return [x['_id'] for x in data]
+    def _bulk_request(self, batch: list[dict]) -> list[tuple[bool, dict]]:
+        """Метод выполняет один bulk-запрос, ошибки отдельных документов возвращаются в результате"""
+        return list(helpers.streaming_bulk(
+            self.client,
+            batch,
+            chunk_size=len(batch),
+            max_chunk_bytes=self.bulk_max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ))
 
-    def load_genres(self, transformed_data: list[ESFilmWork]) -> list[str]:
-        """Метод создает индекс при отсутствии и сохраняет переданную пачку данных в Elastic"""
-        with elastic_connection(self.elastic_url) as conn:
-            if not conn.indices.exists(index=self.genres_index):
-                conn.indices.create(index=self.genres_index, settings=self.settings, mappings=self.genres_mappings)
+    @staticmethod
+    def _action_bytes(action: dict) -> int:
+        """Метод возвращает размер закодированного документа действия, у удаления документа нет"""
+        source = action.get('_source')
+        return len(source) if isinstance(source, bytes) else 0
 
-            data = [{'_index': 'genres', '_id': row.id, '_source': row.json()} for row in transformed_data]
-            helpers.bulk(conn, data)
-            return [x['_id'] for x in data]
+    @staticmethod
+    def _is_rejection(result: dict) -> bool:
+        """Метод проверяет, отклонен ли документ из-за перегрузки кластера"""
+        error = result.get('error')
+        error_type = error.get('type') if isinstance(error, dict) else str(error)
+        return result.get('status') == 429 or 'es_rejected_execution_exception' in (error_type or '')
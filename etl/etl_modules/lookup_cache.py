@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+from .sql_queries import SQL_PERSON_NAMES, SQL_GENRE_NAMES, SQL_NOW
+
+
+class LookupCache:
+    """
+    Класс LookupCache хранит в памяти имена персон и названия жанров по id.
+    Вместо агрегации в PostgreSQL из базы выбираются только id связанных персон и жанров,
+    а поля документа собираются из кеша, что снимает с базы GROUP BY и DISTINCT и уменьшает строки.
+    Кеш обновляется инкрементально по полю modified с тем же окном перекрытия overlap, что и водяные знаки:
+    перечитываются строки, измененные не раньше момента прошлого обновления минус overlap секунд.
+    Жанры кешируются полностью, персоны - полностью или, если задан max_persons, как LRU
+    с догрузкой отсутствующих по id
+    """
+
+    def __init__(self, max_persons: Optional[int] = None, overlap: float = 0):
+        self.max_persons = max_persons
+        self.overlap = timedelta(seconds=overlap)
+        self.persons = OrderedDict()
+        self.genres = {}
+        self._refreshed_at = None
+
+    def refresh(self, cursor) -> None:
+        """
+        Метод загружает персоны и жанры, измененные после прошлого обновления.
+        Вызывается в начале выгрузки, после выборки измененных фильмов, на том же соединении
+        """
+        # Окно отсчитывается от времени базы, а не от modified: иначе строка, закоммиченная позже
+        # с меньшим modified, не попала бы в кеш, а окно от сохраненного modified не сдвигалось бы без изменений
+        cursor.execute(SQL_NOW)
+        refreshed_at = cursor.fetchone()[0]
+        since = self._refreshed_at and self._refreshed_at - self.overlap
+
+        self._load(cursor, SQL_GENRE_NAMES, 'g', since, self.genres)
+        # В режиме LRU персоны не загружаются заранее, а догружаются по мере необходимости
+        if self.max_persons is None or self._refreshed_at is not None:
+            self._load(cursor, SQL_PERSON_NAMES, 'p', since, self.persons)
+            self._evict()
+        self._refreshed_at = refreshed_at
+
+    def assemble(self, cursor, rows: list[dict]) -> list[dict]:
+        """
+        Метод собирает из строк SQL_FILMWORK_LINKS строки в формате SQL_FILMWORD_DATA
+        :param cursor: курсор для догрузки персон и жанров, отсутствующих в кеше
+        :param rows: строки с id связанных персон и жанров
+        """
+        self._fetch_missing(cursor, rows)
+        assembled = [self._assemble_row(row) for row in rows]
+        # Вытеснение после сборки: персоны текущего чанка должны оставаться в кеше, пока он собирается
+        self._evict()
+        return assembled
+
+    def _assemble_row(self, row: dict) -> dict:
+        actors = self._persons(row['actor_ids'])
+        writers = self._persons(row['writer_ids'])
+        directors = self._persons(row['director_ids'])
+        # sorted() упорядочивает имена по кодам символов, как COLLATE "C" в SQL_FILMWORK_AGGREGATES
+        return {
+            'id': row['id'],
+            'modified': row['modified'],
+            'rating': row['rating'],
+            'title': row['title'],
+            'description': row['description'],
+            'genre': sorted({self.genres[genre_id] for genre_id in row['genre_ids'] if genre_id in self.genres}),
+            'director': sorted({person['name'] for person in directors}),
+            'actors_names': sorted({person['name'] for person in actors}),
+            'writers_names': sorted({person['name'] for person in writers}),
+            'actors': actors,
+            'writers': writers,
+            'directors': directors,
+        }
+
+    def _persons(self, ids: list[str]) -> list[dict]:
+        """Метод возвращает персоны без повторов в порядке id, как json_agg(DISTINCT ...)"""
+        persons = []
+        for person_id in sorted(set(ids)):
+            name = self.persons.get(person_id)
+            if name is None:
+                continue
+            if self.max_persons is not None:
+                self.persons.move_to_end(person_id)
+            persons.append({'id': person_id, 'name': name})
+        return persons
+
+    def _fetch_missing(self, cursor, rows: list[dict]) -> None:
+        """Метод одним запросом догружает персоны и жанры, которых нет в кеше"""
+        person_ids = {
+            person_id
+            for row in rows
+            for key in ('actor_ids', 'writer_ids', 'director_ids')
+            for person_id in row[key]
+            if person_id not in self.persons
+        }
+        if person_ids:
+            sql = SQL_PERSON_NAMES.format(filter='WHERE p.id = ANY(%(ids)s::uuid[])')
+            cursor.execute(sql, {'ids': list(person_ids)})
+            self.persons.update((person_id, name) for person_id, name, _ in cursor.fetchall())
+
+        genre_ids = {genre_id for row in rows for genre_id in row['genre_ids'] if genre_id not in self.genres}
+        if genre_ids:
+            sql = SQL_GENRE_NAMES.format(filter='WHERE g.id = ANY(%(ids)s::uuid[])')
+            cursor.execute(sql, {'ids': list(genre_ids)})
+            self.genres.update((genre_id, name) for genre_id, name, _ in cursor.fetchall())
+
+    @staticmethod
+    def _load(cursor, sql: str, alias: str, since, target: dict) -> None:
+        """Метод загружает в target строки, измененные не раньше since, или все строки, если since не задан"""
+        if since is None:
+            cursor.execute(sql.format(filter=' '))
+        else:
+            cursor.execute(sql.format(filter=f'WHERE {alias}.modified >= %(since)s'), {'since': since})
+        target.update((row_id, name) for row_id, name, _ in cursor.fetchall())
+
+    def _evict(self) -> None:
+        if self.max_persons is None:
+            return
+        while len(self.persons) > self.max_persons:
+            self.persons.popitem(last=False)
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from contextlib import suppress
+from queue import Queue, Empty, Full
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Generator, Iterable
+
+_DONE = object()
+_STOPPED = object()
+
+
+class _Failure:
+    """Обертка для исключения, возникшего в фоновом этапе конвейера"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Pipeline:
+    """
+    Класс Pipeline выполняет этапы ETL конвейером.
+    Источник данных и каждый этап обработки работают в отдельных потоках и связаны ограниченными очередями:
+    пока вызывающий код загружает чанк N, следующие чанки уже извлекаются и трансформируются.
+    Размер очередей ограничивает число чанков в памяти (backpressure).
+    Результаты отдаются строго в порядке источника, поэтому контрольные точки сохраняются последовательно.
+    """
+
+    def __init__(self, queue_size: int = 2, poll_timeout: float = 0.5):
+        self.queue_size = queue_size
+        self.poll_timeout = poll_timeout
+
+    def run(self, source: Iterable, *stages: Callable[[Any], Any]) -> Generator:
+        """
+        Метод запускает конвейер и отдает результаты последнего этапа
+        :param source: итерируемый источник чанков, например генератор Extractor
+        :param stages: функции обработки чанка, каждая выполняется в своем потоке
+        """
+        stop_event = threading.Event()
+        queues = [Queue(maxsize=self.queue_size) for _ in range(len(stages) + 1)]
+        threads = [
+            threading.Thread(
+                target=self._produce, args=(source, queues[0], stop_event), name='etl-extract', daemon=True
+            )
+        ]
+        for number, stage in enumerate(stages):
+            threads.append(threading.Thread(
+                target=self._process,
+                args=(stage, queues[number], queues[number + 1], stop_event),
+                name=f'etl-stage-{number}',
+                daemon=True,
+            ))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1], stop_event)
+                if item is _DONE or item is _STOPPED:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def _produce(self, source: Iterable, output: Queue, stop_event: threading.Event) -> None:
+        """Метод читает источник в фоновом потоке"""
+        iterator = iter(source)
+        try:
+            for item in iterator:
+                if not self._put(output, item, stop_event):
+                    return
+            self._put(output, _DONE, stop_event)
+        except Exception as e:
+            self._put(output, _Failure(e), stop_event)
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def _process(self, stage: Callable, input_queue: Queue, output: Queue, stop_event: threading.Event) -> None:
+        """Метод применяет этап обработки к каждому чанку из входной очереди"""
+        while True:
+            item = self._get(input_queue, stop_event)
+            if item is _STOPPED:
+                return
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(output, item, stop_event)
+                return
+            try:
+                result = stage(item)
+            except Exception as e:
+                self._put(output, _Failure(e), stop_event)
+                return
+            if not self._put(output, result, stop_event):
+                return
+
+    def _put(self, queue: Queue, item: Any, stop_event: threading.Event) -> bool:
+        """Метод кладет элемент в очередь, ожидая свободного места, пока конвейер не остановлен"""
+        while not stop_event.is_set():
+            try:
+                queue.put(item, timeout=self.poll_timeout)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _get(self, queue: Queue, stop_event: threading.Event) -> Any:
+        """Метод забирает элемент из очереди; возвращает _STOPPED, если конвейер остановлен"""
+        while not stop_event.is_set():
+            try:
+                return queue.get(timeout=self.poll_timeout)
+            except Empty:
+                continue
+        return _STOPPED
+
+
+class AsyncPipeline:
+    """
+    Класс AsyncPipeline - конвейер для асинхронного режима.
+    Асинхронный источник читается отдельной задачей, трансформация выполняется в пуле потоков,
+    чтобы не задерживать цикл событий, а результаты передаются через ограниченную asyncio.Queue.
+    Пока вызывающий код загружает чанк N, следующие чанки уже извлекаются и трансформируются.
+    """
+
+    def __init__(self, queue_size: int = 2):
+        self.queue_size = queue_size
+
+    async def run(self, source: AsyncIterable, stage: Callable[[Any], Any]) -> AsyncGenerator:
+        """
+        Метод запускает конвейер и отдает результаты этапа в порядке источника
+        :param source: асинхронный источник чанков, например генератор AsyncExtractor
+        :param stage: функция обработки чанка
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        producer = asyncio.create_task(self._produce(source, stage, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            producer.cancel()
+            with suppress(asyncio.CancelledError):
+                await producer
+
+    @staticmethod
+    async def _produce(source: AsyncIterable, stage: Callable, queue: asyncio.Queue) -> None:
+        """Метод читает источник и обрабатывает чанки в фоновой задаче"""
+        try:
+            async for item in source:
+                await queue.put(await asyncio.to_thread(stage, item))
+            await queue.put(_DONE)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        finally:
+            aclose = getattr(source, 'aclose', None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Generator, Iterable
+
+CHUNKS_FILE = 'chunks.jsonl.gz'
+BULK_FILE = 'bulk.ndjson.gz'
+
+
+class Recorder:
+    """
+    Класс Recorder записывает трафик конвейера для воспроизведения без PostgreSQL, Redis и Elastic.
+    Чанки строк, выбранных Extractor, пишутся строками JSON в chunks.jsonl.gz,
+    тела bulk-запросов Loader - в формате NDJSON Elastic в bulk.ndjson.gz, по одному запросу на запись.
+    Файлы открываются на дозапись, поэтому несколько запусков сервиса пишутся в одну запись трафика.
+    Воспроизведение выполняет benchmarks.replay
+    """
+
+    def __init__(self, directory: str, compression_level: int = 6):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._chunks = gzip.open(os.path.join(directory, CHUNKS_FILE), 'ab', compresslevel=compression_level)
+        self._bulk = gzip.open(os.path.join(directory, BULK_FILE), 'ab', compresslevel=compression_level)
+        # Bulk-запросы отправляются из нескольких потоков
+        self._lock = threading.Lock()
+
+    def record_chunk(self, rows: list[dict]) -> None:
+        """Метод записывает чанк строк; моменты времени сохраняются в ISO"""
+        line = json.dumps(rows, ensure_ascii=False, default=datetime.isoformat).encode('utf-8')
+        with self._lock:
+            self._chunks.write(line + b'\n')
+            self._chunks.flush()
+
+    def record_bulk(self, actions: Iterable[dict]) -> None:
+        """Метод записывает тело bulk-запроса из действий с закодированными документами"""
+        lines = []
+        for action in actions:
+            operation = action.get('_op_type', 'index')
+            lines.append(json.dumps({operation: {'_index': action['_index'], '_id': action['_id']}}).encode())
+            if '_source' in action:
+                lines.append(action['_source'])
+        body = b'\n'.join(lines) + b'\n'
+        with self._lock:
+            # Перед телом пишется его длина, так как тело само состоит из строк
+            self._bulk.write(f'{len(body)}\n'.encode() + body)
+            self._bulk.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._chunks.close()
+            self._bulk.close()
+
+    @staticmethod
+    def read_chunks(directory: str) -> Generator:
+        """
+        Метод читает записанные чанки строк
+        :return: генератор чанков в формате строк Extractor
+        """
+        with gzip.open(os.path.join(directory, CHUNKS_FILE), 'rb') as file, _until_truncated():
+            for line in file:
+                rows = json.loads(line)
+                for row in rows:
+                    if row.get('modified') is not None:
+                        row['modified'] = datetime.fromisoformat(row['modified'])
+                yield rows
+
+    @staticmethod
+    def read_bulk(directory: str) -> Generator:
+        """
+        Метод читает записанные тела bulk-запросов
+        :return: генератор тел запросов в формате NDJSON
+        """
+        with gzip.open(os.path.join(directory, BULK_FILE), 'rb') as file, _until_truncated():
+            while header := file.readline():
+                yield file.read(int(header))
+
+
+@contextmanager
+def _until_truncated():
+    """
+    Контекстный менеджер завершает чтение на оборванном конце файла:
+    сервис останавливается без закрытия записи, и последний блок gzip остается незавершенным
+    """
+    try:
+        yield
+    except EOFError:
+        return
@@ -0,0 +1,163 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import Generator, Iterable
+
+from utils.serializer import encode_document
+
+logger = logging.getLogger(__name__)
+
+# Заголовок записи: длина сжатых данных и их CRC32
+FRAME_HEADER = struct.Struct('>II')
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.spool$')
+
+
+class Spool:
+    """
+    Класс Spool - локальный журнал извлеченных чанков между выгрузкой из PostgreSQL и загрузкой в Elastic.
+    Чанк хранится одной сжатой zlib записью в формате NDJSON: строка заголовка с ключом чанка и id,
+    затем по строке на закодированный документ. Записи только дописываются в файлы-сегменты,
+    указатель прочитанной позиции хранится в файле consumed и заменяется атомарно.
+    Сегменты читаются через mmap; полностью прочитанные сегменты удаляются.
+    Так выгрузка из базы выполняется один раз, а загрузка при недоступности Elastic
+    продолжается из журнала без повторных запросов к PostgreSQL
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 256 * 1024 * 1024, compression_level: int = 1):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compression_level = compression_level
+        os.makedirs(directory, exist_ok=True)
+        self._consumed_path = os.path.join(directory, 'consumed')
+        self._writer = None
+        self._repair()
+
+    def append(self, chunk_key: tuple, ids: list[str], documents: Iterable) -> None:
+        """
+        Метод дописывает чанк в журнал и сбрасывает его на диск
+        :param chunk_key: ключ (modified, id) последнего фильма чанка
+        :param ids: id фильмов чанка
+        :param documents: документы чанка: модели, словари или закодированные пары (id, bytes)
+        """
+        documents = [encode_document(document) for document in documents]
+        header = json.dumps({
+            'key': chunk_key,
+            'ids': [str(doc_id) for doc_id in ids],
+            'documents': [doc_id for doc_id, _ in documents],
+        }).encode('utf-8')
+        payload = zlib.compress(b'\n'.join([header] + [source for _, source in documents]), self.compression_level)
+
+        writer = self._segment_writer()
+        writer.write(FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        writer.flush()
+        os.fsync(writer.fileno())
+
+    def pending(self) -> bool:
+        """Метод проверяет, есть ли в журнале непрочитанные чанки"""
+        segment, offset = self._consumed()
+        segments = self._segments()
+        return any(number > segment for number in segments) or (
+            segment in segments and os.path.getsize(self._segment_path(segment)) > offset
+        )
+
+    def read(self) -> Generator:
+        """
+        Метод читает непрочитанные чанки в порядке записи.
+        Позиция после чанка передается в commit, когда чанк обработан
+        :return: генератор (позиция, ключ чанка, id фильмов, закодированные документы)
+        """
+        consumed_segment, consumed_offset = self._consumed()
+        for segment in self._segments():
+            if segment < consumed_segment:
+                continue
+            offset = consumed_offset if segment == consumed_segment else 0
+            with open(self._segment_path(segment), 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size <= offset:
+                    continue
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    while offset + FRAME_HEADER.size <= size:
+                        length, checksum = FRAME_HEADER.unpack_from(data, offset)
+                        start = offset + FRAME_HEADER.size
+                        payload = data[start:start + length]
+                        offset = start + length
+                        if zlib.crc32(payload) != checksum:
+                            raise ValueError(f'Spool segment {segment} is corrupted at offset {start}')
+                        header, *sources = zlib.decompress(payload).split(b'\n')
+                        header = json.loads(header)
+                        documents = list(zip(header['documents'], sources))
+                        yield (segment, offset), tuple(header['key']), header['ids'], documents
+
+    def commit(self, position: tuple[int, int]) -> None:
+        """
+        Метод сохраняет позицию, до которой чанки обработаны, и удаляет прочитанные сегменты
+        :param position: позиция из read
+        """
+        segment, offset = position
+        tmp_path = f'{self._consumed_path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'segment': segment, 'offset': offset}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._consumed_path)
+
+        for number in self._segments():
+            if number < segment:
+                os.remove(self._segment_path(number))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _segment_writer(self):
+        """Метод возвращает файл текущего сегмента, при превышении segment_bytes начинается новый"""
+        if self._writer is not None and self._writer.tell() < self.segment_bytes:
+            return self._writer
+
+        self.close()
+        segments = self._segments()
+        segment = segments[-1] if segments else self._consumed()[0]
+        if segments and os.path.getsize(self._segment_path(segment)) >= self.segment_bytes:
+            segment += 1
+        self._writer = open(self._segment_path(segment), 'ab')
+        return self._writer
+
+    def _repair(self) -> None:
+        """Метод обрезает запись, не дописанную до конца из-за аварийной остановки"""
+        segments = self._segments()
+        if not segments:
+            return
+        path = self._segment_path(segments[-1])
+        size = os.path.getsize(path)
+        offset = 0
+        with open(path, 'rb') as file:
+            while offset + FRAME_HEADER.size <= size:
+                file.seek(offset)
+                length, _ = FRAME_HEADER.unpack(file.read(FRAME_HEADER.size))
+                if offset + FRAME_HEADER.size + length > size:
+                    break
+                offset += FRAME_HEADER.size + length
+        if offset < size:
+            logger.warning(f'Spool segment {segments[-1]} has an incomplete record, truncating {size - offset} bytes')
+            os.truncate(path, offset)
+
+    def _consumed(self) -> tuple[int, int]:
+        try:
+            with open(self._consumed_path) as file:
+                position = json.load(file)
+        except FileNotFoundError:
+            return 0, 0
+        return position['segment'], position['offset']
+
+    def _segments(self) -> list[int]:
+        return sorted(
+            int(match.group(1)) for name in os.listdir(self.directory) if (match := SEGMENT_PATTERN.match(name))
+        )
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'segment-{segment:08d}.spool')
@@ -1,48 +1,263 @@
-SQL_FILMWORD_DATA = """
-    SELECT
-        fw.id,
-        fw.rating AS rating,
-        fw.title,
-        fw.description,
-        COALESCE (json_agg(DISTINCT g.name)) AS genre,
-        COALESCE (json_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), '[]') as director,
-        json_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') as actors_names,
-        json_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') as writers_names,
+# Агрегация данных фильма для документа Elastic, общая для выгрузки и проверки согласованности.
+# Имена упорядочены в сортировке "C" (по кодам символов), как sorted() в LookupCache, а персоны - по id,
+# поэтому документы из запроса и из кеша совпадают побайтно
+SQL_FILMWORK_AGGREGATES = """
+        COALESCE (
+            json_agg(DISTINCT g.name COLLATE "C" ORDER BY g.name COLLATE "C") FILTER (WHERE g.name IS NOT NULL), '[]'
+        ) AS genre,
+        COALESCE (
+            json_agg(DISTINCT p.full_name COLLATE "C" ORDER BY p.full_name COLLATE "C")
+            FILTER (WHERE pfw.role = 'director'), '[]'
+        ) as director,
+        json_agg(DISTINCT p.full_name COLLATE "C" ORDER BY p.full_name COLLATE "C")
+            FILTER (WHERE pfw.role = 'actor') as actors_names,
+        json_agg(DISTINCT p.full_name COLLATE "C" ORDER BY p.full_name COLLATE "C")
+            FILTER (WHERE pfw.role = 'writer') as writers_names,
         json_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor') as actors,
         json_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer') as writers,
         json_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'director') as directors
-    FROM "content".film_work as fw
+"""
+
+SQL_FILMWORK_JOINS = """
     LEFT JOIN "content".genre_film_work gfw on gfw.film_work_id = fw.id
     LEFT JOIN "content".genre g on g.id = gfw.genre_id
     LEFT JOIN "content".person_film_work pfw on pfw.film_work_id = fw.id
     LEFT JOIN "content".person p on p.id = pfw.person_id
-    WHERE fw.id IN %s
+"""
+
+SQL_FILMWORD_DATA = f"""
+    SELECT
+        fw.id,
+        page.modified,
+        fw.rating AS rating,
+        fw.title,
+        fw.description,
+        {SQL_FILMWORK_AGGREGATES}
+    FROM (
+        SELECT cfw.id, cfw.modified
+        FROM changed_filmworks as cfw
+        {{filter}}
+        ORDER BY cfw.modified, cfw.id
+        LIMIT %(page_size)s
+    ) AS page
+    JOIN "content".film_work as fw on fw.id = page.id
+    {SQL_FILMWORK_JOINS}
+    GROUP BY fw.id, page.modified
+    ORDER BY page.modified, fw.id
+"""
+
+SQL_VERIFY_FILMWORKS = f"""
+    SELECT
+        fw.id,
+        fw.rating AS rating,
+        fw.title,
+        fw.description,
+        {SQL_FILMWORK_AGGREGATES}
+    FROM "content".film_work as fw
+    {SQL_FILMWORK_JOINS}
+    {{filter}}
     GROUP BY fw.id
+    ORDER BY fw.id
+"""
+
+SQL_FILMWORK_SHARDS = """
+    SELECT fw.id::text, (hashtext(fw.id::text) & 2147483647) %% %(shard_count)s
+    FROM "content".film_work as fw
+    WHERE fw.id = ANY(%(ids)s::uuid[])
+"""
+
+SQL_FILMWORK_LINKS = """
+    SELECT
+        fw.id,
+        page.modified,
+        fw.rating AS rating,
+        fw.title,
+        fw.description,
+        ARRAY(
+            SELECT gfw.genre_id::text FROM "content".genre_film_work gfw WHERE gfw.film_work_id = fw.id
+        ) AS genre_ids,
+        ARRAY(
+            SELECT pfw.person_id::text FROM "content".person_film_work pfw
+            WHERE pfw.film_work_id = fw.id AND pfw.role = 'actor'
+        ) AS actor_ids,
+        ARRAY(
+            SELECT pfw.person_id::text FROM "content".person_film_work pfw
+            WHERE pfw.film_work_id = fw.id AND pfw.role = 'writer'
+        ) AS writer_ids,
+        ARRAY(
+            SELECT pfw.person_id::text FROM "content".person_film_work pfw
+            WHERE pfw.film_work_id = fw.id AND pfw.role = 'director'
+        ) AS director_ids
+    FROM (
+        SELECT cfw.id, cfw.modified
+        FROM changed_filmworks as cfw
+        {filter}
+        ORDER BY cfw.modified, cfw.id
+        LIMIT %(page_size)s
+    ) AS page
+    JOIN "content".film_work as fw on fw.id = page.id
+    ORDER BY page.modified, fw.id
+"""
+
+SQL_PERSON_NAMES = """
+    SELECT p.id::text, p.full_name, p.modified
+    FROM "content".person as p
+    {filter}
+"""
+
+SQL_GENRE_NAMES = """
+    SELECT g.id::text, g.name, g.modified
+    FROM "content".genre as g
+    {filter}
+"""
+
+# now() - момент фиксации водяных знаков по часам базы, от него отсчитывается окно перекрытия
+SQL_HIGH_WATERMARKS = """
+    (SELECT 'film_work', modified, id::text, now() FROM "content".film_work
+     WHERE modified IS NOT NULL ORDER BY modified DESC, id DESC LIMIT 1)
+    UNION ALL
+    (SELECT 'person', modified, id::text, now() FROM "content".person
+     WHERE modified IS NOT NULL ORDER BY modified DESC, id DESC LIMIT 1)
+    UNION ALL
+    (SELECT 'genre', modified, id::text, now() FROM "content".genre
+     WHERE modified IS NOT NULL ORDER BY modified DESC, id DESC LIMIT 1)
+"""
+
+SQL_NOW = """
+    SELECT now()
 """
 
 SQL_FILMWORK_IDS = """
-    SELECT id
-    FROM content.film_work as fw 
+    SELECT fw.id, fw.modified
+    FROM content.film_work as fw
     {filter}
 """
 
 SQL_FILMWORK_IDS_BY_PERSONS = """
-    SELECT pfw.film_work_id
+    SELECT pfw.film_work_id, p.modified
     FROM content.person as p
-    LEFT JOIN content.person_film_work as pfw
+    JOIN content.person_film_work as pfw
     ON p.id = pfw.person_id
     {filter}
 """
 
 SQL_FILMWORK_IDS_BY_GENRES = """
-    SELECT gfw.film_work_id
+    SELECT gfw.film_work_id, g.modified
     FROM content.genre as g
-    LEFT JOIN content.genre_film_work as gfw
+    JOIN content.genre_film_work as gfw
     ON g.id = gfw.genre_id
     {filter}
 """
 
+# Фильмы без modified получают начало эпохи: контрольные точки и ключ (modified, id) не бывают NULL
+SQL_CHANGED_FILMWORKS = """
+    CREATE TEMPORARY TABLE changed_filmworks ON COMMIT DROP AS
+    SELECT changes.id, COALESCE(max(changes.modified), 'epoch'::timestamp with time zone) AS modified
+    FROM (
+        {changes}
+    ) AS changes (id, modified)
+    {shard_filter}
+    GROUP BY changes.id;
+
+    CREATE INDEX ON changed_filmworks (modified, id);
+"""
+
+SQL_SKIP_PROCESSED_FILMWORKS = """
+    DELETE FROM changed_filmworks
+    WHERE (modified, id) <= (%(modified)s, %(id)s)
+    AND NOT id = ANY(%(pending_ids)s::uuid[])
+"""
+
+SQL_COUNT_CHANGED_FILMWORKS = """
+    SELECT count(*), min(modified)
+    FROM changed_filmworks
+"""
+
 SQL_GENRES_DATA = """
-    SELECT *
+    SELECT g.id, g.name, g.description, g.modified
+    FROM "content".genre as g
+    {filter}
+    ORDER BY g.modified, g.id
+"""
+
+SQL_GENRE_IDS = """
+    SELECT id
     FROM "content".genre
-"""
\ No newline at end of file
+"""
+
+
+SQL_NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION content.etl_notify_change() RETURNS trigger AS $$
+    DECLARE
+        row_data jsonb;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            row_data := to_jsonb(OLD);
+        ELSE
+            row_data := to_jsonb(NEW);
+        END IF;
+        PERFORM pg_notify(TG_ARGV[0], json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', row_data ->> 'id',
+            'film_work_id', row_data ->> 'film_work_id'
+        )::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+SQL_NOTIFY_TRIGGER = """
+    DROP TRIGGER IF EXISTS etl_notify_change ON content.{table};
+    CREATE TRIGGER etl_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change(%(channel)s);
+"""
+
+# txid - транзакция, удалившая строку: записи читаются по ключу (txid, id), см. SQL_TOMBSTONES
+SQL_TOMBSTONE_TABLE = """
+    CREATE TABLE IF NOT EXISTS content.etl_tombstone (
+        id bigserial PRIMARY KEY,
+        txid bigint NOT NULL DEFAULT txid_current(),
+        table_name text NOT NULL,
+        row_id uuid NOT NULL,
+        film_work_id uuid,
+        deleted_at timestamp with time zone NOT NULL DEFAULT now()
+    );
+
+    CREATE INDEX IF NOT EXISTS etl_tombstone_txid_idx ON content.etl_tombstone (txid, id);
+    CREATE INDEX IF NOT EXISTS etl_tombstone_deleted_at_idx ON content.etl_tombstone (deleted_at);
+
+    CREATE OR REPLACE FUNCTION content.etl_record_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO content.etl_tombstone (table_name, row_id, film_work_id)
+        VALUES (TG_TABLE_NAME, OLD.id, (to_jsonb(OLD) ->> 'film_work_id')::uuid);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+SQL_TOMBSTONE_TRIGGER = """
+    DROP TRIGGER IF EXISTS etl_record_tombstone ON content.{table};
+    CREATE TRIGGER etl_record_tombstone
+    AFTER DELETE ON content.{table}
+    FOR EACH ROW EXECUTE FUNCTION content.etl_record_tombstone();
+"""
+
+# id из bigserial выдается при вставке, а не при фиксации, поэтому запись с меньшим id может стать видимой
+# позже записи с большим. Читаются только записи завершенных транзакций (txid меньше xmin текущего снимка):
+# все транзакции, которые еще могут добавить записи, имеют txid не меньше xmin, то есть больше ключа чтения
+SQL_TOMBSTONES = """
+    SELECT txid, id, table_name, row_id, film_work_id
+    FROM content.etl_tombstone
+    WHERE (txid, id) > (%(last_txid)s, %(last_id)s)
+    AND txid < txid_snapshot_xmin(txid_current_snapshot())
+    ORDER BY txid, id
+    LIMIT %(batch_size)s
+"""
+
+SQL_PURGE_TOMBSTONES = """
+    DELETE FROM content.etl_tombstone
+    WHERE deleted_at < now() - %(retention)s * interval '1 hour'
+    AND (txid, id) <= (%(txid)s, %(id)s)
+"""
@@ -0,0 +1,83 @@
+import logging
+from typing import Generator, Optional
+
+from utils.config import DataBaseConfig
+from utils.connection import postgresql_connection
+from .sql_queries import SQL_TOMBSTONE_TABLE, SQL_TOMBSTONE_TRIGGER, SQL_TOMBSTONES, SQL_PURGE_TOMBSTONES
+
+logger = logging.getLogger(__name__)
+
+
+class TombstoneBatch:
+    """Пачка записей об удалениях, разобранная по типам"""
+
+    def __init__(self, rows: list[dict]):
+        self.last_key = [rows[-1]['txid'], rows[-1]['id']]
+        self.filmwork_ids = {row['row_id'] for row in rows if row['table_name'] == 'film_work'}
+        self.genre_ids = {row['row_id'] for row in rows if row['table_name'] == 'genre'}
+        # Фильмы, у которых удалили связь с персоной или жанром, нужно собрать заново
+        self.relinked_filmwork_ids = {
+            row['film_work_id'] for row in rows if row['film_work_id']
+        } - self.filmwork_ids
+
+
+class TombstoneStore:
+    """
+    Класс TombstoneStore читает записи об удалениях (tombstones) из таблицы content.etl_tombstone.
+    Таблицу заполняют триггеры AFTER DELETE на таблицах контента.
+    Записи читаются пачками по ключу (txid, id) только из завершенных транзакций, каждый воркер хранит ключ
+    последней обработанной записи в своем состоянии. Применение записей идемпотентно: удаление отсутствующего
+    документа считается успешным. Записи удаляются по истечении retention_hours, если их обработали все шарды
+    """
+
+    TABLES = ('film_work', 'person', 'genre', 'person_film_work', 'genre_film_work')
+
+    def __init__(self, database_config: DataBaseConfig, batch_size: int = 1000, retention_hours: float = 168):
+        self.database_config = database_config
+        self.batch_size = batch_size
+        self.retention_hours = retention_hours
+
+    def install(self) -> None:
+        """Метод создает таблицу удалений и триггеры, заполняющие ее"""
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor() as curs:
+                curs.execute(SQL_TOMBSTONE_TABLE)
+                for table in self.TABLES:
+                    curs.execute(SQL_TOMBSTONE_TRIGGER.format(table=table))
+            pg_conn.commit()
+        logger.info('Deletion tracking triggers installed')
+
+    def batches(self, last_key: Optional[list] = None) -> Generator[TombstoneBatch, None, None]:
+        """
+        Метод пачками отдает записи об удалениях
+        :param last_key: ключ (txid, id) последней обработанной записи
+        """
+        last_txid, last_id = last_key or (0, 0)
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor() as curs:
+                while True:
+                    params = {'last_txid': last_txid, 'last_id': last_id, 'batch_size': self.batch_size}
+                    curs.execute(SQL_TOMBSTONES, params)
+                    columns = [col[0] for col in curs.description]
+                    rows = [dict(zip(columns, row)) for row in curs.fetchall()]
+                    if not rows:
+                        return
+                    batch = TombstoneBatch(rows)
+                    last_txid, last_id = batch.last_key
+                    yield batch
+                    if len(rows) < self.batch_size:
+                        return
+
+    def purge(self, processed_key: list) -> None:
+        """
+        Метод удаляет записи старше retention_hours
+        :param processed_key: наименьший ключ (txid, id), до которого записи обработаны всеми шардами
+        """
+        txid, row_id = processed_key
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor() as curs:
+                curs.execute(SQL_PURGE_TOMBSTONES, {'retention': self.retention_hours, 'txid': txid, 'id': row_id})
+                purged = curs.rowcount
+            pg_conn.commit()
+        if purged:
+            logger.info(f'{purged} expired tombstones purged')
@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, Iterable, Optional
+
+from utils.metrics import STAGE_DURATION, ROWS
+from utils.serializer import encode_document
+from .extractor import Extractor
+from .transformer import Transformer
+
+# Transformer процесса-воркера, создается инициализатором пула
+_transformer: Optional[Transformer] = None
+
+
+def _init_worker(fast_mode: bool, validation_sample_rate: float) -> None:
+    global _transformer
+    _transformer = Transformer(fast_mode=fast_mode, validation_sample_rate=validation_sample_rate)
+
+
+def _transform_chunk(data: list[dict]) -> tuple:
+    """
+    Функция выполняется в процессе-воркере: трансформирует чанк фильмов и кодирует документы в JSON
+    :return: ключ чанка, id фильмов чанка, закодированные документы (id, bytes) и время обработки
+    """
+    started = time.perf_counter()
+    documents = [encode_document(document) for document in _transformer.transform_filmworks(data)]
+    return Extractor.chunk_key(data), [row['id'] for row in data], documents, time.perf_counter() - started
+
+
+class TransformPool:
+    """
+    Класс TransformPool трансформирует и кодирует чанки фильмов в пуле процессов.
+    Построение документов и JSON-кодирование нагружают процессор, поэтому на полной перезагрузке
+    они выполняются на нескольких ядрах, а основной процесс только читает строки из базы и отправляет
+    готовые байты в Elastic. Результаты отдаются в порядке чанков источника, поэтому
+    контрольные точки по-прежнему сохраняются последовательно
+    """
+
+    def __init__(
+            self,
+            workers: int,
+            fast_mode: bool = False,
+            validation_sample_rate: float = 0.0,
+            max_pending: Optional[int] = None,
+    ):
+        """
+        :param workers: число процессов
+        :param max_pending: сколько чанков может обрабатываться одновременно, по умолчанию два на процесс
+        """
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        # spawn не копирует в воркеры потоки и соединения основного процесса
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(fast_mode, validation_sample_rate),
+        )
+
+    def map(self, chunks: Iterable[list[dict]]) -> Generator:
+        """
+        Метод отправляет чанки в пул и отдает результаты в исходном порядке.
+        Одновременно в работе не больше max_pending чанков, что ограничивает память
+        :return: генератор (ключ чанка, id фильмов, закодированные документы)
+        """
+        pending = deque()
+        iterator = iter(chunks)
+        try:
+            while True:
+                while len(pending) < self.max_pending:
+                    chunk = next(iterator, None)
+                    if chunk is None:
+                        break
+                    pending.append(self._executor.submit(_transform_chunk, chunk))
+                if not pending:
+                    return
+
+                chunk_key, ids, documents, duration = pending.popleft().result()
+                STAGE_DURATION.observe(duration, stage='transform')
+                ROWS.inc(len(documents), stage='transform')
+                yield chunk_key, ids, documents
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        """Метод останавливает процессы пула"""
+        self._executor.shutdown(cancel_futures=True)
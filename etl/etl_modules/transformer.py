@@ -1,37 +1,110 @@
+import random
+from typing import Optional, Union
+
 from utils.config import ESFilmWork, ESGenre
+from utils.metrics import STAGE_DURATION, ROWS
 
 
 class Transformer:
-    """Класс Transformer предназначен для обработки данных из PostgreSQL для загрузки в Elasticsearch."""
-
-    def transform_filmworks(self, extracted_filmworks: dict) -> list[ESFilmWork]:
-        transformed_filmworks = []
-        for record in extracted_filmworks:
-            filmwork = ESFilmWork(
-                id=record['id'],
-                imdb_rating=record['rating'],
-                title=record['title'],
-                description=record['description'],
-                genre=record['genre'],
-                director=record['director'],
-                actors_names=record['actors_names'] or [],
-                writers_names=record['writers_names'] or [],
-                actors=record['actors'] or [],
-                writers=record['writers'] or [],
-                directors=record['directors'] or [],
-            )
-            transformed_filmworks.append(filmwork)
+    """
+    Класс Transformer предназначен для обработки данных из PostgreSQL для загрузки в Elasticsearch.
+    В быстром режиме (fast_mode) строки преобразуются сразу в словари без построения pydantic-моделей,
+    валидация выполняется только для доли записей validation_sample_rate
+    """
+
+    def __init__(self, fast_mode: bool = False, validation_sample_rate: float = 0.0):
+        self.fast_mode = fast_mode
+        self.validation_sample_rate = validation_sample_rate
 
+    def transform_filmworks(self, extracted_filmworks: dict) -> list[Union[ESFilmWork, dict]]:
+        with STAGE_DURATION.time(stage='transform'):
+            if self.fast_mode:
+                transformed_filmworks = self._transform_fast(extracted_filmworks, self.filmwork_document, ESFilmWork)
+            else:
+                transformed_filmworks = [
+                    ESFilmWork(
+                        id=record['id'],
+                        imdb_rating=record['rating'],
+                        title=record['title'],
+                        description=record['description'],
+                        genre=self.names(record['genre']),
+                        director=self.names(record['director']),
+                        actors_names=self.names(record['actors_names']),
+                        writers_names=self.names(record['writers_names']),
+                        actors=record['actors'] or [],
+                        writers=record['writers'] or [],
+                        directors=record['directors'] or [],
+                    )
+                    for record in extracted_filmworks
+                ]
+
+        ROWS.inc(len(transformed_filmworks), stage='transform')
         return transformed_filmworks
 
-    def transform_genres(self, extracted_genres: dict) -> list[ESGenre]:
-        transformed_genres = []
-        for record in extracted_genres:
-            genre = ESGenre(
-                id=record['id'],
-                name=record['name'],
-                description=record['description'],
-            )
-            transformed_genres.append(genre)
+    def transform_genres(self, extracted_genres: dict) -> list[Union[ESGenre, dict]]:
+        with STAGE_DURATION.time(stage='transform'):
+            if self.fast_mode:
+                transformed_genres = self._transform_fast(extracted_genres, self.genre_document, ESGenre)
+            else:
+                transformed_genres = [
+                    ESGenre(
+                        id=record['id'],
+                        name=record['name'],
+                        description=record['description'],
+                    )
+                    for record in extracted_genres
+                ]
 
+        ROWS.inc(len(transformed_genres), stage='transform')
         return transformed_genres
+
+    @staticmethod
+    def filmwork_document(record: dict) -> dict:
+        """
+        Метод строит документ фильма в виде словаря.
+        Порядок и приведение полей совпадают с ESFilmWork.dict()
+        """
+        rating = record['rating']
+        return {
+            'id': str(record['id']),
+            'imdb_rating': float(rating) if rating is not None else None,
+            'genre': Transformer.names(record['genre']),
+            'title': record['title'],
+            'description': record['description'],
+            'director': Transformer.names(record['director']),
+            'actors_names': Transformer.names(record['actors_names']),
+            'writers_names': Transformer.names(record['writers_names']),
+            'actors': [{'id': str(p['id']), 'name': p['name']} for p in record['actors'] or []],
+            'writers': [{'id': str(p['id']), 'name': p['name']} for p in record['writers'] or []],
+            'directors': [{'id': str(p['id']), 'name': p['name']} for p in record['directors'] or []],
+        }
+
+    @staticmethod
+    def names(values: Optional[list]) -> list[str]:
+        """
+        Метод приводит список имен: NULL и [null] агрегации фильма без связей дают пустой список
+        в обоих режимах, а не ошибку валидации ESFilmWork
+        """
+        return [value for value in values or [] if value is not None]
+
+    @staticmethod
+    def genre_document(record: dict) -> dict:
+        """Метод строит документ жанра в виде словаря, совпадающего с ESGenre.dict()"""
+        return {
+            'id': str(record['id']),
+            'name': record['name'],
+            'description': record['description'],
+        }
+
+    def _transform_fast(self, records: list, build_document, model) -> list[dict]:
+        """
+        Метод преобразует строки в словари документов.
+        Выборочная валидация моделью model выбрасывает ValidationError для некорректной записи
+        """
+        documents = []
+        for record in records:
+            document = build_document(record)
+            if self.validation_sample_rate and random.random() < self.validation_sample_rate:
+                model(**document)
+            documents.append(document)
+        return documents
@@ -0,0 +1,215 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Generator, Iterator, Optional
+
+from elasticsearch import Elasticsearch
+
+from utils.config import DataBaseConfig
+from utils.connection import postgresql_connection, backoff
+from utils.fingerprint_cache import FingerprintCache
+from utils.serializer import dumps
+from .loader import ELASTIC_ERRORS
+from .sql_queries import SQL_VERIFY_FILMWORKS
+from .transformer import Transformer
+
+logger = logging.getLogger(__name__)
+
+MISSING = 'missing'
+STALE = 'stale'
+EXTRA = 'extra'
+DIFFERENCE_KINDS = (MISSING, STALE, EXTRA)
+
+
+def document_checksum(document: dict) -> bytes:
+    """
+    Функция вычисляет контрольную сумму документа фильма независимо от порядка ключей и элементов списков
+    и от пустых элементов: документы, загруженные из SQL-запроса прежних версий ([null] и сортировка базы)
+    и из LookupCache, не считаются устаревшими
+    """
+    return FingerprintCache.digest(dumps(_canonical(document)))
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _canonical(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return sorted((_canonical(item) for item in value if item is not None), key=dumps)
+    return value
+
+
+def merge_join(source: Iterator[tuple[str, bytes]], target: Iterator[tuple[str, bytes]]) -> Generator:
+    """
+    Функция сравнивает два потока (id, контрольная сумма), отсортированных по id, за один проход
+    :param source: документы, которые должны быть в индексе (PostgreSQL)
+    :param target: документы индекса (Elastic)
+    :return: генератор расхождений (вид, id)
+    """
+    source_item = next(source, None)
+    target_item = next(target, None)
+    while source_item is not None or target_item is not None:
+        if target_item is None or (source_item is not None and source_item[0] < target_item[0]):
+            yield MISSING, source_item[0]
+            source_item = next(source, None)
+        elif source_item is None or target_item[0] < source_item[0]:
+            yield EXTRA, target_item[0]
+            target_item = next(target, None)
+        else:
+            if source_item[1] != target_item[1]:
+                yield STALE, source_item[0]
+            source_item = next(source, None)
+            target_item = next(target, None)
+
+
+def partition_bounds(partitions: int) -> list[tuple[Optional[str], Optional[str]]]:
+    """
+    Функция делит пространство UUID на равные диапазоны [lower, upper).
+    Строки UUID в нижнем регистре упорядочены так же, как uuid в PostgreSQL и keyword в Elastic
+    """
+    bounds = [str(uuid.UUID(int=number * 2 ** 128 // partitions)) for number in range(1, partitions)]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+class Verifier:
+    """
+    Класс Verifier проверяет согласованность индекса фильмов с PostgreSQL без полной перезагрузки.
+    Пространство id делится на диапазоны, каждый диапазон проверяется в отдельном потоке:
+    фильмы читаются из PostgreSQL серверным курсором, документы Elastic - страницами search_after
+    в одной точке во времени (PIT), обе стороны отсортированы по id и сравниваются слиянием,
+    поэтому память не зависит от размера индекса.
+    Снимки сторон сделаны в разные моменты, поэтому фильмы, измененные во время проверки,
+    могут попасть в расхождения; повторная загрузка таких фильмов безопасна
+    """
+
+    def __init__(
+            self,
+            database_config: DataBaseConfig,
+            elastic_config,
+            partitions: int = 64,
+            workers: int = 4,
+            batch_size: int = 1000,
+            keep_alive: str = '5m',
+    ):
+        """
+        :param partitions: число диапазонов id, диапазонов больше, чем потоков, чтобы потоки загружались равномерно
+        :param workers: число потоков
+        :param batch_size: размер порции чтения каждой стороны и пачки расхождений
+        :param keep_alive: время жизни PIT между запросами страниц
+        """
+        self.database_config = database_config
+        self.index = elastic_config.movies_index
+        self.partitions = partitions
+        self.workers = workers
+        self.batch_size = batch_size
+        self.keep_alive = keep_alive
+        self.client = Elasticsearch(
+            elastic_config.get_elastic_url(), connections_per_node=max(workers, elastic_config.connections_per_node)
+        )
+
+    def verify(self, handler: Callable[[str, list[str]], None]) -> dict:
+        """
+        Метод сравнивает индекс с PostgreSQL
+        :param handler: функция, получающая пачки id расхождений одного вида (missing, stale, extra);
+        вызывается из потоков проверки
+        :return: количество проверенных документов, расхождений по видам и диапазонов, проверка которых не удалась
+        """
+        totals = dict.fromkeys(('postgres', 'elastic', *DIFFERENCE_KINDS, 'failed_partitions'), 0)
+        pit_id = self.client.open_point_in_time(index=self.index, keep_alive=self.keep_alive)['id']
+        try:
+            with ThreadPoolExecutor(self.workers, thread_name_prefix='etl-verify') as executor:
+                futures = {
+                    executor.submit(self._verify_partition, pit_id, lower, upper, handler): (lower, upper)
+                    for lower, upper in partition_bounds(self.partitions)
+                }
+                for future in as_completed(futures):
+                    try:
+                        counts = future.result()
+                    except Exception:
+                        logger.exception(f'Failed to verify filmworks in range {futures[future]}')
+                        totals['failed_partitions'] += 1
+                        continue
+                    for key, value in counts.items():
+                        totals[key] += value
+        finally:
+            self.client.close_point_in_time(id=pit_id)
+        return totals
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _verify_partition(self, pit_id: str, lower: Optional[str], upper: Optional[str], handler: Callable) -> dict:
+        """
+        Метод сравнивает диапазон id [lower, upper) и передает расхождения пачками по batch_size
+        :return: количество проверенных документов и расхождений по видам
+        """
+        counts = dict.fromkeys(('postgres', 'elastic', *DIFFERENCE_KINDS), 0)
+        pending = {kind: [] for kind in DIFFERENCE_KINDS}
+
+        def counted(items: Iterator, side: str) -> Generator:
+            for item in items:
+                counts[side] += 1
+                yield item
+
+        source = counted(self._source_checksums(lower, upper), 'postgres')
+        target = counted(self._target_checksums(pit_id, lower, upper), 'elastic')
+        for kind, doc_id in merge_join(source, target):
+            counts[kind] += 1
+            pending[kind].append(doc_id)
+            if len(pending[kind]) >= self.batch_size:
+                handler(kind, pending[kind])
+                pending[kind] = []
+        for kind, ids in pending.items():
+            if ids:
+                handler(kind, ids)
+        return counts
+
+    def _source_checksums(self, lower: Optional[str], upper: Optional[str]) -> Generator:
+        """Метод читает фильмы диапазона серверным курсором и строит из них документы, как Transformer"""
+        sql, params = self._range_query(lower, upper)
+        with postgresql_connection(self.database_config.dict()) as pg_conn:
+            with pg_conn.cursor(name='etl_verify') as curs:
+                curs.execute(sql, params)
+                while rows := curs.fetchmany(self.batch_size):
+                    for row in rows:
+                        document = Transformer.filmwork_document(row)
+                        yield document['id'], document_checksum(document)
+
+    def _target_checksums(self, pit_id: str, lower: Optional[str], upper: Optional[str]) -> Generator:
+        """Метод читает документы диапазона из Elastic страницами search_after в порядке id"""
+        bounds = {}
+        if lower is not None:
+            bounds['gte'] = lower
+        if upper is not None:
+            bounds['lt'] = upper
+        query = {'range': {'id': bounds}} if bounds else {'match_all': {}}
+        search = backoff(exceptions=ELASTIC_ERRORS, max_retries=3)(self.client.search)
+        search_after = None
+        while True:
+            # Все потоки используют исходный id PIT: он не меняется, пока PIT открыт на тех же шардах
+            response = search(
+                pit={'id': pit_id, 'keep_alive': self.keep_alive},
+                query=query,
+                sort=[{'id': 'asc'}],
+                size=self.batch_size,
+                search_after=search_after,
+                track_total_hits=False,
+            )
+            hits = response['hits']['hits']
+            for hit in hits:
+                yield hit['_id'], document_checksum(hit['_source'])
+            if len(hits) < self.batch_size:
+                return
+            search_after = hits[-1]['sort']
+
+    @staticmethod
+    def _range_query(lower: Optional[str], upper: Optional[str]) -> tuple:
+        """Метод формирует запрос фильмов диапазона id [lower, upper)"""
+        conditions, params = [], {}
+        if lower is not None:
+            params['lower'] = lower
+            conditions.append("fw.id >= %(lower)s::uuid")
+        if upper is not None:
+            params['upper'] = upper
+            conditions.append("fw.id < %(upper)s::uuid")
+        sql_filter = f"WHERE {' AND '.join(conditions)} " if conditions else " "
+        return SQL_VERIFY_FILMWORKS.format(filter=sql_filter), params
@@ -1,6 +1,10 @@
+import asyncio
 import logging
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+from functools import partial
+from itertools import takewhile
+from typing import Iterable, Optional
 
 import psycopg2
 import redis
@@ -11,66 +15,695 @@ from utils.config import (
     ElasticConfig, RedisConfig,
 )
 from etl_modules.extractor import Extractor
+from etl_modules.async_extractor import AsyncExtractor, POSTGRES_ERRORS
 from etl_modules.transformer import Transformer
 from etl_modules.loader import Loader
-from utils.state_storage import State, RedisStorage
-from utils.connection import backoff
+from etl_modules.async_loader import AsyncLoader
+from etl_modules.pipeline import Pipeline, AsyncPipeline
+from etl_modules.transform_pool import TransformPool
+from etl_modules.spool import Spool
+from etl_modules.lookup_cache import LookupCache
+from etl_modules.change_listener import ChangeListener
+from etl_modules.tombstones import TombstoneStore
+from etl_modules.recorder import Recorder
+from utils.state_storage import State, RedisHashStorage, AsyncState, AsyncRedisHashStorage, STORAGE_ERRORS
+from utils.batching import AdaptiveBatchSize
+from utils.resilience import CircuitBreaker
+from utils.connection import backoff, async_backoff
+from utils.coordination import RedisLease, LeaseLostError
+from utils.fingerprint_cache import FingerprintCache
+from utils.watermarks import from_legacy, advance, overlap_key
+from utils.serializer import encode_document
+from utils.metrics import ROWS, CHECKPOINT_LAG, FRESHNESS_LAG, start_http_server, log_snapshot
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
+def transform_chunk(transformer: Transformer, data: list[dict]) -> tuple:
+    """Функция трансформирует чанк фильмов и сохраняет данные, нужные для контрольной точки"""
+    return Extractor.chunk_key(data), [row['id'] for row in data], transformer.transform_filmworks(data)
+
+
+def encode_chunk(transformer: Transformer, data: list[dict]) -> tuple:
+    """Функция трансформирует и кодирует чанк фильмов, в асинхронном режиме она выполняется вне цикла событий"""
+    chunk_key, chunk_ids, documents = transform_chunk(transformer, data)
+    return chunk_key, chunk_ids, [encode_document(document) for document in documents]
+
+
+# Ключи состояния, которые читает загрузка фильмов
+FILMWORKS_STATE_KEYS = ('watermarks', 'last_start_time', 'rebuild_index', 'last_key', 'watermark_target')
+
+
+def prepare_loader(loader: Loader, state_storage: State) -> None:
+    """
+    Функция готовит Loader к запуску: создает индексы и продолжает полную перезагрузку, прерванную прошлым
+    запуском. Выполняется до применения удалений, чтобы они попали и в индекс перезагрузки
+    """
+    loader.prepare(state_storage.get_state('rebuild_index'))
+
+
+def begin_filmworks(
+        extractor: Extractor,
+        loader: Loader,
+        state_storage: State,
+        changed_ids: Iterable[str] = (),
+        full_rebuild: bool = False,
+) -> dict:
+    """
+    Функция начинает загрузку фильмов, общую для обоих режимов: добавляет changed_ids в pending_ids,
+    при необходимости начинает полную перезагрузку и фиксирует верхние водяные знаки.
+    Если full_rebuild включен, первая (полная) загрузка идет в новый индекс, который
+    подменяет рабочий через алиас после окончания загрузки
+    :return: параметры выгрузки: watermarks, target, last_key, pending_ids и rebuild_index
+    """
+    if changed_ids:
+        state_storage.save_checkpoint({}, add_members={'pending_ids': changed_ids})
+
+    state = {key: state_storage.get_state(key) for key in FILMWORKS_STATE_KEYS}
+    watermarks = state['watermarks']
+    if watermarks is None and state['last_start_time'] is not None:
+        watermarks = from_legacy(state['last_start_time'])
+    rebuild_index = state['rebuild_index']
+    if full_rebuild and watermarks is None and rebuild_index is None:
+        rebuild_index = loader.start_rebuild()
+        state_storage.set_state('rebuild_index', rebuild_index)
+
+    target = state['watermark_target']
+    if target is None:
+        target = extractor.capture_watermarks()
+        state_storage.set_state('watermark_target', target)
+
+    logger.info(f'Start updating from {watermarks} to {target}')
+    return {
+        'watermarks': watermarks,
+        'target': target,
+        'last_key': state['last_key'] and tuple(state['last_key']),
+        'pending_ids': state_storage.get_members('pending_ids'),
+        'rebuild_index': rebuild_index,
+    }
+
+
+def chunk_checkpoint(
+        chunk_key: tuple,
+        chunk_ids: list[str],
+        loaded_ids: list[str],
+        values: Optional[dict] = None,
+) -> tuple[dict, set[str]]:
+    """
+    Функция формирует контрольную точку загруженного чанка и обновляет метрики отставания.
+    Фильмы, которые не удалось загрузить, остаются в pending_ids
+    :param values: значения контрольной точки, по умолчанию ключ чанка last_key
+    :return: аргументы save_checkpoint и id фильмов, которые не удалось загрузить
+    """
+    chunk_failed_ids = set(chunk_ids) - set(loaded_ids)
+    CHECKPOINT_LAG.dec(len(chunk_ids))
+    FRESHNESS_LAG.set((datetime.now(timezone.utc) - datetime.fromisoformat(chunk_key[0])).total_seconds())
+    checkpoint = {
+        'values': {'last_key': chunk_key} if values is None else values,
+        'add_members': {'pending_ids': chunk_failed_ids},
+        'remove_members': {'pending_ids': loaded_ids},
+    }
+    return checkpoint, chunk_failed_ids
+
+
+def final_checkpoint(run: dict, done_ids: set[str], rebuild_done: bool = True) -> dict:
+    """
+    Функция формирует контрольную точку завершенной выгрузки: водяные знаки сдвигаются до target
+    :param run: параметры выгрузки из begin_filmworks
+    :param done_ids: id из pending_ids, которые больше не нужно ждать
+    :param rebuild_done: сбросить ли индекс полной перезагрузки
+    :return: аргументы save_checkpoint
+    """
+    values = {
+        'watermarks': advance(run['watermarks'], run['target']),
+        'watermark_target': None,
+        'last_start_time': None,
+        'last_key': None,
+    }
+    if rebuild_done:
+        values['rebuild_index'] = None
+    return {'values': values, 'remove_members': {'pending_ids': done_ids}}
+
+
+def end_filmworks(loader: Loader, state_storage: State, run: dict, failed_ids: set[str], spooled: bool = False) -> None:
+    """
+    Функция завершает загрузку фильмов, общую для обоих режимов: переключает алиас полной перезагрузки,
+    сдвигает водяные знаки и обнуляет метрики отставания
+    :param run: параметры выгрузки из begin_filmworks
+    :param failed_ids: id фильмов, которые не удалось загрузить
+    :param spooled: водяные знаки уже сдвинуты после записи журнала
+    """
+    if run['rebuild_index'] is not None:
+        loader.finish_rebuild()
+    if spooled:
+        state_storage.set_state('rebuild_index', None)
+    else:
+        # Фильмы из pending_ids, которых уже нет в базе, больше не нужно ждать
+        state_storage.save_checkpoint(**final_checkpoint(run, run['pending_ids'] - failed_ids))
+    if loader.fingerprint_cache is not None:
+        logger.info(f'{loader.skipped_documents} unchanged filmworks skipped')
+    CHECKPOINT_LAG.set(0)
+    FRESHNESS_LAG.set(0)
+
+
+def log_run(started: float, loaded_before: float) -> None:
+    """Функция выводит итоги запуска ETL"""
+    duration = time.monotonic() - started
+    loaded = ROWS.value(stage='load') - loaded_before
+    log_snapshot(
+        'etl_run',
+        duration=round(duration, 3),
+        documents=loaded,
+        documents_per_second=round(loaded / duration, 1) if duration else 0,
+    )
+
+
+def wait_for_changes(listener: Optional[ChangeListener], sleep_time: float) -> set[str]:
+    """
+    Функция ожидает следующего запуска: sleep_time секунд или, с ChangeListener, уведомлений об изменениях
+    :return: id фильмов из уведомлений
+    """
+    if listener is None:
+        logger.info('ETL process is finished. Sleep...')
+        time.sleep(sleep_time)
+        return set()
+
+    logger.info('ETL process is finished. Waiting for changes...')
+    events = listener.wait(sleep_time)
+    changed_ids = ChangeListener.filmwork_ids(events)
+    if events:
+        logger.info(f'Received {len(events)} change events, {len(changed_ids)} filmworks affected')
+    return changed_ids
+
+
 @backoff(exceptions=[
     psycopg2.OperationalError,
     redis.exceptions.ConnectionError,
-    elasticsearch.exceptions.ConnectionError
-])
-def run_etl(extractor: Extractor, transformer: Transformer, loader: Loader, state_storage: State) -> None:
-    last_start_time = state_storage.get_state('last_start_time')
-    is_running = state_storage.get_state('is_running')
-    completed_ids = state_storage.get_state('completed_ids') or []
-
-    if is_running:
-        logger.info('ETL process is already running or not yet completed')
+    redis.exceptions.TimeoutError,
+    elasticsearch.exceptions.ConnectionError,
+    elasticsearch.exceptions.ConnectionTimeout,
+], start_sleep_time=1, border_sleep_time=60)
+def run_etl(
+        extractor: Extractor,
+        transformer: Transformer,
+        loader: Loader,
+        state_storage: State,
+        lease: RedisLease,
+        pipeline: Optional[Pipeline] = None,
+        changed_ids: Iterable[str] = (),
+        full_rebuild: bool = False,
+        tombstones: Optional[TombstoneStore] = None,
+        transform_pool: Optional[TransformPool] = None,
+        spool: Optional[Spool] = None,
+        genres_reconcile_interval: Optional[float] = None,
+        shard_states: Optional[list[State]] = None,
+) -> None:
+    if not lease.acquire():
+        logger.info('ETL process is already running on another worker')
         return
+
+    started = time.monotonic()
+    loaded_before = ROWS.value(stage='load')
+    try:
+        prepare_loader(loader, state_storage)
+        if tombstones is not None:
+            sync_deletions(tombstones, loader, state_storage, shard_states)
+        sync_filmworks(
+            extractor, transformer, loader, state_storage, lease,
+            pipeline, changed_ids, full_rebuild, transform_pool, spool,
+        )
+        # Жанров немного, их синхронизирует только первый шард
+        if extractor.shard_index == 0:
+            sync_genres(extractor, transformer, loader, state_storage, genres_reconcile_interval)
+    except LeaseLostError as e:
+        logger.error(f'{e}, stopping the run')
+    finally:
+        lease.release()
+    log_run(started, loaded_before)
+
+
+def sync_filmworks(
+        extractor: Extractor,
+        transformer: Transformer,
+        loader: Loader,
+        state_storage: State,
+        lease: RedisLease,
+        pipeline: Optional[Pipeline] = None,
+        changed_ids: Iterable[str] = (),
+        full_rebuild: bool = False,
+        transform_pool: Optional[TransformPool] = None,
+        spool: Optional[Spool] = None,
+) -> None:
+    """
+    Функция загружает измененные фильмы, сохраняя контрольную точку после каждого чанка.
+    Множество pending_ids содержит фильмы, которые нужно обработать в любом случае:
+    не загруженные из-за ошибок и полученные из уведомлений об изменениях (changed_ids).
+    С пулом процессов transform_pool чанки трансформируются и кодируются в других процессах,
+    а конвейер pipeline в этом случае только выносит чтение из базы в отдельный поток.
+    С журналом spool чанки сначала целиком записываются на диск, а затем загружаются из него:
+    если Elastic недоступен, следующий запуск дозагружает журнал, не обращаясь к PostgreSQL
+    """
+    loader.skipped_documents = 0
+    if spool is not None and spool.pending():
+        logger.info('Loading filmworks left in the spool by the previous run')
+        drain_spool(spool, loader, state_storage, lease)
+
+    run = begin_filmworks(extractor, loader, state_storage, changed_ids, full_rebuild)
+    filmworks = extractor.extract_filmworks(run['watermarks'], run['target'], run['last_key'], run['pending_ids'])
+    transform = partial(transform_chunk, transformer)
+    if transform_pool is not None:
+        transformed_filmworks = transform_pool.map(pipeline.run(filmworks) if pipeline is not None else filmworks)
+    elif pipeline is not None:
+        transformed_filmworks = pipeline.run(filmworks, transform)
     else:
-        state_storage.set_state('is_running', True)
+        transformed_filmworks = map(transform, filmworks)
+
+    failed_ids = set()
+    if spool is None:
+        for chunk_key, chunk_ids, transformed_data in transformed_filmworks:
+            failed_ids |= load_chunk(loader, state_storage, lease, chunk_key, chunk_ids, transformed_data)
+    else:
+        for chunk_key, chunk_ids, transformed_data in transformed_filmworks:
+            spool.append(chunk_key, chunk_ids, transformed_data)
+            lease.check()
+            state_storage.save_checkpoint({'last_key': chunk_key})
+        # Выгрузка завершена: все фильмы из pending_ids уже в журнале, незагруженные вернутся в pending_ids
+        state_storage.save_checkpoint(**final_checkpoint(run, run['pending_ids'], rebuild_done=False))
+        failed_ids = drain_spool(spool, loader, state_storage, lease)
+    end_filmworks(loader, state_storage, run, failed_ids, spooled=spool is not None)
+
+
+def load_chunk(
+        loader: Loader,
+        state_storage: State,
+        lease: RedisLease,
+        chunk_key: tuple,
+        chunk_ids: list[str],
+        transformed_data: list,
+        checkpoint: Optional[dict] = None,
+) -> set[str]:
+    """
+    Функция загружает чанк фильмов и сохраняет контрольную точку
+    :param checkpoint: значения контрольной точки, по умолчанию ключ чанка last_key
+    :return: id фильмов, которые не удалось загрузить
+    """
+    loaded_ids = loader.load_filmworks(transformed_data)
+    lease.check()
+    chunk_state, chunk_failed_ids = chunk_checkpoint(chunk_key, chunk_ids, loaded_ids, checkpoint)
+    state_storage.save_checkpoint(**chunk_state)
+    return chunk_failed_ids
 
-    logger.info(f'Start updating from {last_start_time}')
-    for data in extractor.extract_filmworks(last_start_time, completed_ids):
-        transformed_data = transformer.transform_filmworks(data)
-        completed_ids = loader.load_filmworks(transformed_data)
-        completed_ids.extend(completed_ids)
-        state_storage.set_state('completed_ids', completed_ids)
 
-    state_storage.set_state('last_start_time', datetime.now().strftime("%m-%d-%Y %H:%M:%S"))
-    state_storage.set_state('completed_ids', [])
-    state_storage.set_state('is_running', False)
+def drain_spool(spool: Spool, loader: Loader, state_storage: State, lease: RedisLease) -> set[str]:
+    """
+    Функция загружает в Elastic чанки из журнала.
+    Позиция журнала сдвигается после контрольной точки чанка, поэтому при сбое чанк будет загружен повторно
+    :return: id фильмов, которые не удалось загрузить
+    """
+    failed_ids = set()
+    for position, chunk_key, chunk_ids, documents in spool.read():
+        failed_ids |= load_chunk(loader, state_storage, lease, chunk_key, chunk_ids, documents, checkpoint={})
+        spool.commit(position)
+    return failed_ids
 
-    for data in extractor.extract_genres():
+
+@async_backoff(exceptions=[
+    *POSTGRES_ERRORS,
+    psycopg2.OperationalError,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+    elasticsearch.exceptions.ConnectionError,
+    elasticsearch.exceptions.ConnectionTimeout,
+], start_sleep_time=1, border_sleep_time=60)
+async def run_etl_async(
+        extractor: AsyncExtractor,
+        transformer: Transformer,
+        loader: AsyncLoader,
+        state_storage: State,
+        async_state_storage: AsyncState,
+        lease: RedisLease,
+        pipeline: AsyncPipeline,
+        changed_ids: Iterable[str] = (),
+        full_rebuild: bool = False,
+        tombstones: Optional[TombstoneStore] = None,
+        genres_reconcile_interval: Optional[float] = None,
+        shard_states: Optional[list[State]] = None,
+) -> None:
+    """
+    Асинхронный вариант run_etl с тем же порядком этапов. Фильмы загружаются асинхронно, а удаления и жанры,
+    которых немного, синхронизируются прежними функциями в отдельном потоке с синхронным хранилищем состояния
+    """
+    if not await asyncio.to_thread(lease.acquire):
+        logger.info('ETL process is already running on another worker')
+        return
+
+    started = time.monotonic()
+    loaded_before = ROWS.value(stage='load')
+    try:
+        # Создание индексов и другие редкие запросы к Elastic выполняются синхронным клиентом в отдельном потоке
+        await asyncio.to_thread(prepare_loader, loader, state_storage)
+        if tombstones is not None:
+            await asyncio.to_thread(sync_deletions, tombstones, loader, state_storage, shard_states)
+        await sync_filmworks_async(
+            extractor, transformer, loader, state_storage, async_state_storage, lease,
+            pipeline, changed_ids, full_rebuild,
+        )
+        if extractor.shard_index == 0:
+            await asyncio.to_thread(
+                sync_genres, extractor, transformer, loader, state_storage, genres_reconcile_interval
+            )
+    except LeaseLostError as e:
+        logger.error(f'{e}, stopping the run')
+    finally:
+        await asyncio.to_thread(lease.release)
+    log_run(started, loaded_before)
+
+
+async def sync_filmworks_async(
+        extractor: AsyncExtractor,
+        transformer: Transformer,
+        loader: AsyncLoader,
+        state_storage: State,
+        async_state_storage: AsyncState,
+        lease: RedisLease,
+        pipeline: AsyncPipeline,
+        changed_ids: Iterable[str] = (),
+        full_rebuild: bool = False,
+) -> None:
+    """
+    Асинхронный вариант sync_filmworks. Начало и завершение загрузки общие с sync_filmworks и выполняются
+    в отдельном потоке, асинхронно выполняются выгрузка чанков, их загрузка и контрольные точки.
+    Следующие чанки выгружаются и трансформируются конвейером, пока текущий загружается
+    несколькими одновременными bulk-запросами. Пул процессов и журнал в асинхронном режиме не используются
+    """
+    loader.skipped_documents = 0
+    run = await asyncio.to_thread(begin_filmworks, extractor, loader, state_storage, changed_ids, full_rebuild)
+    filmworks = extractor.extract_filmworks(run['watermarks'], run['target'], run['last_key'], run['pending_ids'])
+    failed_ids = set()
+    async for chunk_key, chunk_ids, transformed_data in pipeline.run(filmworks, partial(encode_chunk, transformer)):
+        loaded_ids = await loader.load_filmworks(transformed_data)
+        lease.check()
+        chunk_state, chunk_failed_ids = chunk_checkpoint(chunk_key, chunk_ids, loaded_ids)
+        await async_state_storage.save_checkpoint(**chunk_state)
+        failed_ids |= chunk_failed_ids
+    await asyncio.to_thread(end_filmworks, loader, state_storage, run, failed_ids)
+
+
+async def serve_async(
+        app_config: AppConfig,
+        extractor: AsyncExtractor,
+        transformer: Transformer,
+        loader: AsyncLoader,
+        state_storage: State,
+        async_state_storage: AsyncState,
+        lease: RedisLease,
+        listener: Optional[ChangeListener] = None,
+        full_rebuild: bool = False,
+        tombstones: Optional[TombstoneStore] = None,
+        genres_reconcile_interval: Optional[float] = None,
+        shard_states: Optional[list[State]] = None,
+) -> None:
+    """Функция выполняет запуски ETL в асинхронном режиме, асинхронные клиенты живут в одном цикле событий"""
+    pipeline = AsyncPipeline(queue_size=app_config.pipeline_queue_size)
+    changed_ids = set()
+    try:
+        while True:
+            logger.info('ETL started...')
+            await run_etl_async(
+                extractor, transformer, loader, state_storage, async_state_storage, lease,
+                pipeline, changed_ids, full_rebuild, tombstones, genres_reconcile_interval, shard_states,
+            )
+            changed_ids = await asyncio.to_thread(wait_for_changes, listener, app_config.sleep_time)
+    finally:
+        await loader.aclose()
+
+
+def sync_deletions(
+        tombstones: TombstoneStore,
+        loader: Loader,
+        state_storage: State,
+        shard_states: Optional[list[State]] = None,
+) -> None:
+    """
+    Функция применяет удаления из PostgreSQL к Elastic.
+    Удаленные фильмы и жанры удаляются из индексов, а фильмы, потерявшие связь с персоной или жанром,
+    добавляются в pending_ids и будут собраны заново на этапе загрузки фильмов
+    :param shard_states: хранилища состояния всех шардов; если заданы, из таблицы удалений удаляются записи,
+    которые обработали все шарды
+    """
+    last_key = state_storage.get_state('tombstones_last_key')
+    for batch in tombstones.batches(last_key):
+        deleted_ids = set(loader.delete_filmworks(batch.filmwork_ids)) if batch.filmwork_ids else set()
+        if batch.genre_ids:
+            deleted_ids.update(loader.delete_genres(batch.genre_ids))
+        if deleted_ids != batch.filmwork_ids | batch.genre_ids:
+            logger.error('Failed to apply deletions, will retry on the next run')
+            return
+        state_storage.save_checkpoint(
+            {'tombstones_last_key': batch.last_key},
+            add_members={'pending_ids': batch.relinked_filmwork_ids},
+            remove_members={'pending_ids': batch.filmwork_ids},
+        )
+        logger.info(
+            f'Deletions applied: {len(batch.filmwork_ids)} filmworks, {len(batch.genre_ids)} genres, '
+            f'{len(batch.relinked_filmwork_ids)} filmworks to rebuild'
+        )
+
+    if shard_states is not None:
+        # Шард, который еще не обработал записи, не должен их потерять, даже если отстает дольше retention_hours
+        processed_keys = [shard_state.get_state('tombstones_last_key') for shard_state in shard_states]
+        if None not in processed_keys:
+            tombstones.purge(min(processed_keys))
+
+
+def sync_genres(
+        extractor: Extractor,
+        transformer: Transformer,
+        loader: Loader,
+        state_storage: State,
+        reconcile_interval: Optional[float] = None,
+) -> None:
+    """
+    Функция загружает жанры, измененные после контрольной точки genres_last_key, с тем же окном перекрытия,
+    что у водяных знаков фильмов: контрольная точка хранит момент фиксации по часам базы.
+    Удаленные жанры приходят из sync_deletions; без отслеживания удалений задается reconcile_interval,
+    и не чаще раза в reconcile_interval секунд жанры, которых нет в PostgreSQL, удаляются из Elastic
+    """
+    last_key = state_storage.get_state('genres_last_key')
+    captured_at = extractor.capture_time()
+    since = last_key and overlap_key(last_key, extractor.watermark_overlap)
+    for data in extractor.extract_genres(since and tuple(since)):
         transformed_data = transformer.transform_genres(data)
-        loader.load_genres(transformed_data)
+        loaded_ids = set(loader.load_genres(transformed_data))
+        # Контрольная точка сдвигается только до первого незагруженного жанра
+        loaded_rows = list(takewhile(lambda row: row['id'] in loaded_ids, data))
+        if loaded_rows:
+            last_key = [*Extractor.chunk_key(loaded_rows), captured_at]
+            state_storage.set_state('genres_last_key', last_key)
+        if len(loaded_rows) < len(data):
+            logger.error('Genres sync stopped on a failed document, will continue on the next run')
+            return
+
+    # Пока контрольная точка попадает в окно перекрытия, момент фиксации сдвигается, чтобы окно закрылось
+    if last_key is not None and last_key[2:] != [captured_at] and since != last_key[:2]:
+        state_storage.set_state('genres_last_key', [*last_key[:2], captured_at])
+
+    if reconcile_interval is None:
+        return
+    reconciled_at = state_storage.get_state('genres_reconciled_at')
+    if reconciled_at is not None and time.time() - reconciled_at < reconcile_interval:
+        return
+    deleted_ids = loader.genre_ids() - extractor.extract_genre_ids()
+    if deleted_ids:
+        loader.delete_genres(deleted_ids)
+        logger.info(f'{len(deleted_ids)} deleted genres removed from Elastic')
+    state_storage.set_state('genres_reconciled_at', time.time())
 
 
 if __name__ == '__main__':
     app_config = AppConfig()
+    if app_config.async_runtime:
+        # Асинхронный режим не поддерживает пул процессов, журнал и кеш персон: они отключаются с предупреждением
+        unsupported = {
+            'TRANSFORM_WORKERS': app_config.transform_workers,
+            'SPOOL_PATH': app_config.spool_path,
+            'LOOKUP_CACHE': app_config.lookup_cache,
+        }
+        enabled = [name for name, value in unsupported.items() if value]
+        if enabled:
+            logger.warning(f'{", ".join(enabled)} not supported by the async runtime and ignored')
+        app_config = app_config.copy(update={'transform_workers': 0, 'spool_path': None, 'lookup_cache': False})
+
+    if app_config.metrics_port:
+        start_http_server(app_config.metrics_port)
+
+    redis_config = RedisConfig()
+    redis_client = redis_config.get_redis_client()
+    # Повторы отдельных чанков и запросов ограничены бюджетом, запуск целиком повторяется без ограничения
+    # и продолжается с последней контрольной точки
+    redis_breaker = CircuitBreaker(
+        'redis', app_config.breaker_failure_threshold, app_config.breaker_reset_timeout)
+    elastic_breaker = CircuitBreaker(
+        'elastic', app_config.breaker_failure_threshold, app_config.breaker_reset_timeout)
 
     state_storage = State(
-        storage=RedisStorage(redis_adapter=RedisConfig().get_redis_client()))
+        storage=RedisHashStorage(redis_adapter=redis_client, key=app_config.shard_key(redis_config.state_key)),
+        retries=app_config.chunk_retries,
+        breaker=redis_breaker,
+    )
+    if backoff(exceptions=STORAGE_ERRORS)(state_storage.storage.migrate_legacy)():
+        logger.info('State of the previous format moved to the Redis hash')
+    lease = RedisLease(
+        redis_adapter=redis_client,
+        key=app_config.shard_key(f'{redis_config.state_key}:lease'),
+        ttl=app_config.lease_ttl,
+    )
+
+    elastic_config = ElasticConfig()
+    extract_batch_size = bulk_batch_size = None
+    if app_config.adaptive_batching:
+        # Чанк не может быть больше страницы выборки фильмов
+        extract_batch_size = AdaptiveBatchSize(
+            name='extract',
+            initial=app_config.chunk_size,
+            minimum=app_config.extract_batch_min,
+            maximum=min(app_config.extract_batch_max, app_config.page_size),
+            target_latency=app_config.extract_target_latency,
+            max_bytes=app_config.extract_max_chunk_bytes,
+        )
+        bulk_batch_size = AdaptiveBatchSize(
+            name='bulk',
+            initial=elastic_config.bulk_chunk_size,
+            minimum=elastic_config.bulk_batch_min,
+            maximum=elastic_config.bulk_batch_max,
+            target_latency=elastic_config.bulk_target_latency,
+            max_bytes=elastic_config.bulk_max_chunk_bytes,
+        )
 
-    extractor = Extractor(
+    recorder = None
+    if app_config.record_path:
+        # Запись трафика для воспроизведения через benchmarks.replay
+        recorder = Recorder(directory=app_config.record_path)
+
+    lookup_cache = None
+    if app_config.lookup_cache:
+        lookup_cache = LookupCache(
+            max_persons=app_config.lookup_cache_max_persons, overlap=app_config.watermark_overlap
+        )
+
+    # В асинхронном режиме фильмы выгружаются через asyncpg и загружаются через AsyncElasticsearch
+    extractor_class, loader_class = (AsyncExtractor, AsyncLoader) if app_config.async_runtime else (Extractor, Loader)
+    extractor = extractor_class(
         chunk_size=app_config.chunk_size,
-        database_config=DataBaseConfig()
+        database_config=DataBaseConfig(),
+        itersize=app_config.itersize,
+        server_side_cursor=app_config.server_side_cursor,
+        page_size=app_config.page_size,
+        shard_index=app_config.shard_index,
+        shard_count=app_config.shard_count,
+        batch_size=extract_batch_size,
+        lookup_cache=lookup_cache,
+        watermark_overlap=app_config.watermark_overlap,
+        max_chunk_bytes=app_config.extract_max_chunk_bytes,
+        recorder=recorder,
+    )
+
+    transformer = Transformer(
+        fast_mode=app_config.fast_transform,
+        validation_sample_rate=app_config.validation_sample_rate,
     )
 
-    transformer = Transformer()
+    fingerprint_cache = None
+    if app_config.fingerprint_cache_path:
+        fingerprint_cache = FingerprintCache(
+            path=app_config.fingerprint_cache_path,
+            max_entries=app_config.fingerprint_cache_size,
+        )
 
-    loader = Loader(
-        elastic_config=ElasticConfig(),
+    loader = loader_class(
+        elastic_config=elastic_config,
+        fingerprint_cache=fingerprint_cache,
+        bulk_batch_size=bulk_batch_size,
+        chunk_retries=app_config.chunk_retries,
+        breaker=elastic_breaker,
+        recorder=recorder,
     )
 
-    while True:
-        logger.info('ETL started...')
-        run_etl(extractor, transformer, loader, state_storage)
-        logger.info('ETL process is finished. Sleep...')
-        time.sleep(app_config.sleep_time)
+    pipeline = None
+    if app_config.pipeline_mode:
+        pipeline = Pipeline(queue_size=app_config.pipeline_queue_size)
+
+    transform_pool = None
+    if app_config.transform_workers:
+        transform_pool = TransformPool(
+            workers=app_config.transform_workers,
+            fast_mode=app_config.fast_transform,
+            validation_sample_rate=app_config.validation_sample_rate,
+        )
+
+    spool = None
+    if app_config.spool_path:
+        spool = Spool(directory=app_config.spool_path, segment_bytes=app_config.spool_segment_bytes)
+
+    listener = None
+    if app_config.change_capture:
+        listener = ChangeListener(
+            database_config=DataBaseConfig(),
+            channel=app_config.notify_channel,
+            debounce=app_config.notify_debounce,
+        )
+        if app_config.install_triggers:
+            backoff(exceptions=[psycopg2.OperationalError])(listener.install_triggers)()
+
+    tombstones = shard_states = None
+    if app_config.deletion_tracking:
+        tombstones = TombstoneStore(
+            database_config=DataBaseConfig(),
+            batch_size=app_config.tombstone_batch_size,
+            retention_hours=app_config.tombstone_retention_hours,
+        )
+        if app_config.install_triggers:
+            backoff(exceptions=[psycopg2.OperationalError])(tombstones.install)()
+        if app_config.shard_index == 0:
+            # Первый шард очищает таблицу удалений до наименьшей контрольной точки всех шардов
+            shard_states = [
+                State(
+                    storage=RedisHashStorage(
+                        redis_adapter=redis_client,
+                        key=app_config.copy(update={'shard_index': shard}).shard_key(redis_config.state_key),
+                    ),
+                    retries=app_config.chunk_retries,
+                    breaker=redis_breaker,
+                )
+                for shard in range(app_config.shard_count)
+            ]
+
+    # Перезагрузка через алиас переключает индекс целиком, поэтому доступна только без шардирования
+    full_rebuild = app_config.blue_green_rebuild and app_config.shard_count == 1
+    # С отслеживанием удалений удаленные жанры приходят из таблицы удалений, полная сверка не нужна
+    genres_reconcile_interval = app_config.genres_reconcile_interval if tombstones is None else None
+
+    if app_config.async_runtime:
+        async_state_storage = AsyncState(
+            storage=AsyncRedisHashStorage(
+                redis_adapter=redis_config.get_async_redis_client(),
+                key=app_config.shard_key(redis_config.state_key),
+            ),
+            retries=app_config.chunk_retries,
+            breaker=redis_breaker,
+        )
+        asyncio.run(serve_async(
+            app_config, extractor, transformer, loader, state_storage, async_state_storage, lease,
+            listener, full_rebuild, tombstones, genres_reconcile_interval, shard_states,
+        ))
+    else:
+        changed_ids = set()
+        while True:
+            logger.info('ETL started...')
+            run_etl(
+                extractor, transformer, loader, state_storage, lease,
+                pipeline, changed_ids, full_rebuild, tombstones, transform_pool, spool,
+                genres_reconcile_interval, shard_states,
+            )
+            changed_ids = wait_for_changes(listener, app_config.sleep_time)
@@ -0,0 +1,55 @@
+from utils.batching import AdaptiveBatchSize
+
+
+def controller(**kwargs) -> AdaptiveBatchSize:
+    params = {'initial': 100, 'minimum': 10, 'maximum': 200, 'target_latency': 1.0, 'increase': 10}
+    return AdaptiveBatchSize('test', **{**params, **kwargs})
+
+
+def test_full_fast_batches_grow_additively():
+    batch_size = controller()
+
+    batch_size.record(100, latency=0.1)
+    batch_size.record(110, latency=0.1)
+
+    assert batch_size.size == 120
+
+
+def test_partial_batches_keep_size():
+    batch_size = controller()
+
+    batch_size.record(30, latency=0.1)
+
+    assert batch_size.size == 100
+
+
+def test_slow_or_large_batches_shrink_multiplicatively():
+    batch_size = controller(max_bytes=1000)
+
+    batch_size.record(100, latency=2.0)
+    assert batch_size.size == 50
+    batch_size.record(50, latency=0.1, payload_bytes=1000)
+    assert batch_size.size == 25
+    batch_size.reject()
+    assert batch_size.size == 12
+
+
+def test_size_stays_within_bounds():
+    batch_size = controller(initial=190)
+
+    for _ in range(5):
+        batch_size.record(batch_size.size, latency=0.1)
+    assert batch_size.size == 200
+    for _ in range(10):
+        batch_size.reject()
+    assert batch_size.size == 10
+
+
+def test_fixed_size_never_changes():
+    batch_size = AdaptiveBatchSize.fixed('test', 50)
+
+    batch_size.record(50, latency=100.0)
+    batch_size.reject()
+    batch_size.record(50, latency=0.0)
+
+    assert batch_size.size == 50
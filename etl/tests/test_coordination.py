@@ -0,0 +1,71 @@
+import time
+
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError
+
+from utils.coordination import RedisLease, LeaseLostError
+
+
+@pytest.fixture
+def redis_adapter():
+    return fakeredis.FakeRedis()
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    """Функция ждет выполнения условия не дольше timeout секунд"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_lease_is_exclusive(redis_adapter):
+    first = RedisLease(redis_adapter, 'etl_lease', ttl=5)
+    second = RedisLease(redis_adapter, 'etl_lease', ttl=5)
+
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_heartbeat_renews_lease(redis_adapter):
+    lease = RedisLease(redis_adapter, 'etl_lease', ttl=0.3, heartbeat_interval=0.05)
+    assert lease.acquire()
+
+    time.sleep(0.6)
+
+    assert redis_adapter.get('etl_lease') == lease.token.encode()
+    lease.check()
+    lease.release()
+    assert redis_adapter.get('etl_lease') is None
+
+
+def test_stolen_lease_is_lost_and_kept_by_new_owner(redis_adapter):
+    lease = RedisLease(redis_adapter, 'etl_lease', ttl=5, heartbeat_interval=0.05)
+    assert lease.acquire()
+
+    redis_adapter.set('etl_lease', 'other-worker')
+
+    assert wait_until(lambda: lease.lost)
+    with pytest.raises(LeaseLostError):
+        lease.check()
+    lease.release()
+    assert redis_adapter.get('etl_lease') == b'other-worker'
+
+
+def test_release_error_does_not_propagate(redis_adapter):
+    lease = RedisLease(redis_adapter, 'etl_lease', ttl=5)
+    assert lease.acquire()
+
+    def fail(*args, **kwargs):
+        raise ConnectionError('connection lost')
+
+    lease._release = fail
+    lease.release()
+
+    assert lease.token is None
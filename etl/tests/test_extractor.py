@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from etl_modules.extractor import Extractor
+from etl_modules.sql_queries import SQL_SKIP_PROCESSED_FILMWORKS, SQL_COUNT_CHANGED_FILMWORKS
+from utils.config import DataBaseConfig
+
+WATERMARKS = {table: ['2024-01-01T00:00:00+00:00', 'a'] for table in ('film_work', 'person', 'genre')}
+
+
+class FakeCursor:
+    """Курсор, запоминающий выполненные запросы"""
+
+    def __init__(self, count_row: tuple):
+        self.count_row = count_row
+        self.queries = []
+
+    def execute(self, sql: str, params: dict = None) -> None:
+        self.queries.append((sql, params))
+
+    def fetchone(self) -> tuple:
+        return self.count_row
+
+
+@pytest.fixture
+def extractor():
+    return Extractor(chunk_size=10, database_config=DataBaseConfig())
+
+
+def test_resume_skips_processed_filmworks_except_pending(extractor):
+    cursor = FakeCursor((3, datetime(2024, 1, 1, tzinfo=timezone.utc)))
+
+    total = extractor._collect_changed_filmworks(
+        WATERMARKS, None, ('2024-01-01T12:00:00+00:00', 'f'), {'p'}, cursor
+    )
+
+    assert total == 3
+    changes, skip, count = cursor.queries
+    assert changes[1]['pending_ids'] == ['p']
+    assert skip == (
+        SQL_SKIP_PROCESSED_FILMWORKS, {'modified': '2024-01-01T12:00:00+00:00', 'id': 'f', 'pending_ids': ['p']}
+    )
+    assert count == (SQL_COUNT_CHANGED_FILMWORKS, None)
+
+
+def test_first_run_does_not_skip(extractor):
+    cursor = FakeCursor((0, None))
+
+    assert extractor._collect_changed_filmworks(None, None, None, set(), cursor) == 0
+    assert [sql for sql, _ in cursor.queries][1:] == [SQL_COUNT_CHANGED_FILMWORKS]
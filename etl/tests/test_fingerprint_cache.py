@@ -0,0 +1,35 @@
+import pytest
+
+from utils.fingerprint_cache import FingerprintCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'fingerprints.db'), max_entries=2)
+    yield cache
+    cache.conn.close()
+
+
+def test_only_documents_with_same_digest_are_unchanged(cache):
+    cache.update({'a': cache.digest(b'{"id":"a"}'), 'b': cache.digest(b'{"id":"b"}')})
+
+    digests = {'a': cache.digest(b'{"id":"a"}'), 'b': cache.digest(b'{"id":"b","title":"new"}'), 'c': b'c'}
+
+    assert cache.unchanged(digests) == {'a'}
+
+
+def test_oldest_entries_are_evicted(cache):
+    for doc_id in 'abc':
+        cache.update({doc_id: cache.digest(doc_id.encode())})
+
+    digests = {doc_id: cache.digest(doc_id.encode()) for doc_id in 'abc'}
+    assert cache.unchanged(digests) == {'b', 'c'}
+
+
+def test_discarded_documents_are_loaded_again(cache):
+    digest = cache.digest(b'{}')
+    cache.update({'a': digest})
+
+    cache.discard(['a'])
+
+    assert cache.unchanged({'a': digest}) == set()
@@ -0,0 +1,57 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from etl_modules.loader import Loader
+from utils.config import ElasticConfig
+
+
+@pytest.fixture
+def loader():
+    loader = Loader(ElasticConfig(movies_index='movies', genres_index='genres'))
+    loader.client = MagicMock()
+    yield loader
+    loader.close()
+
+
+def test_finish_rebuild_switches_alias_and_drops_old_indices(loader):
+    client = loader.client
+    client.indices.exists_alias.return_value = True
+    client.indices.get_alias.return_value = {'movies_v1': {}}
+    client.indices.get.return_value = {'movies_v1': {}, 'movies_v2': {}, 'movies_v3': {}}
+    loader.resume_rebuild('movies_v2')
+    loader.skipped_documents = 5
+
+    loader.finish_rebuild()
+
+    client.indices.put_settings.assert_called_once()
+    client.indices.refresh.assert_called_once_with(index='movies_v2')
+    client.indices.update_aliases.assert_called_once_with(actions=[
+        {'add': {'index': 'movies_v2', 'alias': 'movies'}},
+        {'remove': {'index': 'movies_v1', 'alias': 'movies'}},
+    ])
+    deleted = {call.kwargs['index'] for call in client.options.return_value.indices.delete.call_args_list}
+    assert deleted == {'movies_v1', 'movies_v3'}
+    assert loader._rebuild_index is None
+    assert loader.skipped_documents == 0
+
+
+def test_finish_rebuild_replaces_index_without_alias(loader):
+    client = loader.client
+    client.indices.exists_alias.return_value = False
+    client.indices.exists.return_value = True
+    client.indices.get.return_value = {'movies_v1': {}}
+    loader.resume_rebuild('movies_v1')
+
+    loader.finish_rebuild()
+
+    client.indices.update_aliases.assert_called_once_with(actions=[
+        {'remove_index': {'index': 'movies'}},
+        {'add': {'index': 'movies_v1', 'alias': 'movies'}},
+    ])
+    client.options.return_value.indices.delete.assert_not_called()
+
+
+def test_loader_rejects_shared_index_name():
+    with pytest.raises(ValueError):
+        Loader(ElasticConfig(movies_index='content', genres_index='content'))
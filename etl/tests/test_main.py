@@ -0,0 +1,30 @@
+import json
+import logging
+
+import main
+from utils.metrics import ROWS
+
+
+def run_event(caplog) -> dict:
+    record = next(record for record in caplog.records if 'etl_run' in record.getMessage())
+    return json.loads(record.getMessage())
+
+
+def test_log_run_reports_throughput(caplog, monkeypatch):
+    monkeypatch.setattr(main.time, 'monotonic', lambda: 12.0)
+    loaded_before = ROWS.value(stage='load')
+    ROWS.inc(50, stage='load')
+
+    with caplog.at_level(logging.INFO):
+        main.log_run(10.0, loaded_before)
+
+    assert run_event(caplog)['documents_per_second'] == 25.0
+
+
+def test_log_run_with_zero_duration(caplog, monkeypatch):
+    monkeypatch.setattr(main.time, 'monotonic', lambda: 10.0)
+
+    with caplog.at_level(logging.INFO):
+        main.log_run(10.0, ROWS.value(stage='load'))
+
+    assert run_event(caplog)['documents_per_second'] == 0
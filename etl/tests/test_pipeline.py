@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from etl_modules.pipeline import Pipeline
+
+
+def test_run_keeps_source_order():
+    pipeline = Pipeline(queue_size=1, poll_timeout=0.01)
+
+    results = list(pipeline.run(range(20), lambda item: item * 2, lambda item: item + 1))
+
+    assert results == [item * 2 + 1 for item in range(20)]
+
+
+def test_run_bounds_chunks_in_flight():
+    pipeline = Pipeline(queue_size=1, poll_timeout=0.01)
+    produced = []
+
+    def source():
+        for item in range(10):
+            produced.append(item)
+            yield item
+
+    results = pipeline.run(source(), lambda item: item)
+    assert next(results) == 0
+    time.sleep(0.2)
+    # Отданный чанк, по чанку в каждой из двух очередей и по одному у ожидающих потоков источника и этапа
+    assert len(produced) == 5
+    assert list(results) == list(range(1, 10))
+
+
+def test_run_raises_stage_error():
+    pipeline = Pipeline(queue_size=1, poll_timeout=0.01)
+
+    def stage(item):
+        if item == 3:
+            raise ValueError('broken chunk')
+        return item
+
+    with pytest.raises(ValueError, match='broken chunk'):
+        list(pipeline.run(range(10), stage))
+
+
+def test_closing_results_stops_source():
+    pipeline = Pipeline(queue_size=1, poll_timeout=0.01)
+    closed = threading.Event()
+
+    def source():
+        try:
+            for item in range(1000):
+                yield item
+        finally:
+            closed.set()
+
+    results = pipeline.run(source(), lambda item: item)
+    assert next(results) == 0
+    results.close()
+
+    assert closed.is_set()
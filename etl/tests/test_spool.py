@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from etl_modules.spool import Spool
+
+KEY = ('2024-01-01T00:00:00+00:00', 'a')
+
+
+def read_all(spool: Spool) -> list:
+    return list(spool.read())
+
+
+def test_chunks_are_read_in_order_and_committed(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(KEY, ['a'], [('a', b'{"id":"a"}')])
+    spool.append(KEY, ['b', 'c'], [{'id': 'b'}])
+
+    (position, key, ids, documents), second = read_all(spool)
+    assert key == KEY
+    assert ids == ['a']
+    assert documents == [('a', b'{"id":"a"}')]
+    assert second[2:] == (['b', 'c'], [('b', b'{"id":"b"}')])
+
+    spool.commit(position)
+    assert spool.pending()
+    assert [chunk[2] for chunk in read_all(spool)] == [['b', 'c']]
+    spool.commit(second[0])
+    assert not spool.pending()
+    spool.close()
+
+
+def test_segments_roll_over_and_consumed_segments_are_removed(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=1)
+    for doc_id in 'abc':
+        spool.append(KEY, [doc_id], [(doc_id, b'{}')])
+    spool.close()
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.spool')]) == 3
+
+    chunks = read_all(spool)
+    spool.commit(chunks[-1][0])
+
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.spool')] == ['segment-00000002.spool']
+    assert not spool.pending()
+
+
+def test_incomplete_record_is_truncated_on_start(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(KEY, ['a'], [('a', b'{}')])
+    spool.close()
+    with open(tmp_path / 'segment-00000000.spool', 'ab') as file:
+        file.write(b'\x00\x00\x01\x00partial')
+
+    spool = Spool(str(tmp_path))
+
+    assert [chunk[2] for chunk in read_all(spool)] == [['a']]
+
+
+def test_corrupted_record_is_detected(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(KEY, ['a'], [('a', b'{}')])
+    spool.close()
+    path = tmp_path / 'segment-00000000.spool'
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match='corrupted'):
+        read_all(spool)
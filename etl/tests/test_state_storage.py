@@ -0,0 +1,86 @@
+import json
+
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError
+
+from utils.state_storage import State, RedisHashStorage
+
+
+@pytest.fixture
+def redis_adapter():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def state(redis_adapter):
+    return State(RedisHashStorage(redis_adapter))
+
+
+def test_checkpoint_keeps_failed_ids_pending(state):
+    state.save_checkpoint({}, add_members={'pending_ids': ['a', 'b', 'c']})
+
+    state.save_checkpoint(
+        {'last_key': ['2024-01-01T00:00:00+00:00', 'c']},
+        add_members={'pending_ids': ['d']},
+        remove_members={'pending_ids': ['a', 'c']},
+    )
+
+    assert state.get_state('last_key') == ['2024-01-01T00:00:00+00:00', 'c']
+    assert state.get_members('pending_ids') == {'b', 'd'}
+
+
+def test_checkpoint_is_written_atomically(state, redis_adapter, monkeypatch):
+    state.set_state('last_key', ['2024-01-01T00:00:00+00:00', 'a'])
+
+    def fail(self, *args, **kwargs):
+        raise ConnectionError('connection lost')
+
+    monkeypatch.setattr(redis_adapter.pipeline().__class__, 'execute', fail)
+    with pytest.raises(ConnectionError):
+        state.save_checkpoint(
+            {'last_key': ['2024-01-02T00:00:00+00:00', 'b']},
+            add_members={'pending_ids': ['b']},
+        )
+
+    assert state.get_state('last_key') == ['2024-01-01T00:00:00+00:00', 'a']
+    assert state.get_members('pending_ids') == set()
+
+
+def test_checkpoint_is_retried_after_connection_error(redis_adapter, monkeypatch):
+    state = State(RedisHashStorage(redis_adapter), retries=1)
+    pipeline_class = redis_adapter.pipeline().__class__
+    execute = pipeline_class.execute
+    calls = []
+
+    def flaky(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError('connection lost')
+        return execute(self, *args, **kwargs)
+
+    monkeypatch.setattr('utils.connection.sleep', lambda seconds: None)
+    monkeypatch.setattr(pipeline_class, 'execute', flaky)
+    state.save_checkpoint({'last_key': ['2024-01-01T00:00:00+00:00', 'a']}, add_members={'pending_ids': ['a']})
+
+    assert len(calls) == 2
+    assert state.get_members('pending_ids') == {'a'}
+
+
+def test_migrate_legacy_moves_json_state_once(redis_adapter):
+    redis_adapter.set('data', json.dumps({'last_start_time': '01-01-2024 00:00:00', 'is_running': False}))
+    storage = RedisHashStorage(redis_adapter)
+
+    assert storage.migrate_legacy()
+    assert not storage.migrate_legacy()
+    assert redis_adapter.get('data') is None
+    assert storage.retrieve_value('last_start_time') == '01-01-2024 00:00:00'
+
+
+def test_migrate_legacy_keeps_existing_hash(redis_adapter):
+    storage = RedisHashStorage(redis_adapter)
+    storage.save_values({'last_key': ['2024-01-01T00:00:00+00:00', 'a']})
+    redis_adapter.set('data', json.dumps({'last_start_time': '01-01-2024 00:00:00'}))
+
+    assert not storage.migrate_legacy()
+    assert storage.retrieve_value('last_start_time') is None
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from etl_modules.lookup_cache import LookupCache
+from etl_modules.transformer import Transformer
+from etl_modules.verifier import document_checksum, merge_join, partition_bounds, MISSING, STALE, EXTRA
+
+FILMWORK_ID = '6e5cd268-8ce4-45f9-87d2-52f265a4e6c5'
+ACTORS = {
+    '0a2a3b53-2e3e-4a1c-9d3b-6a6b0a0e0f01': 'Émile Zola',
+    '1b2a3b53-2e3e-4a1c-9d3b-6a6b0a0e0f02': 'adam West',
+    '2c2a3b53-2e3e-4a1c-9d3b-6a6b0a0e0f03': 'Zed',
+}
+MODIFIED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def sql_row(genre: list, actors_names: list) -> dict:
+    """Строка в формате SQL_FILMWORD_DATA"""
+    return {
+        'id': FILMWORK_ID,
+        'modified': MODIFIED,
+        'rating': 7.5,
+        'title': 'Title',
+        'description': None,
+        'genre': genre,
+        'director': [],
+        'actors_names': actors_names,
+        'writers_names': None,
+        'actors': [{'id': person_id, 'name': name} for person_id, name in ACTORS.items()],
+        'writers': None,
+        'directors': None,
+    }
+
+
+def cached_row(genre_ids: list) -> dict:
+    """Строка, собранная LookupCache из строки SQL_FILMWORK_LINKS"""
+    cache = LookupCache()
+    cache.persons.update(ACTORS)
+    cache.genres.update({'g1': 'Drama', 'g2': 'comedy'})
+    return cache.assemble(None, [{
+        'id': FILMWORK_ID,
+        'modified': MODIFIED,
+        'rating': 7.5,
+        'title': 'Title',
+        'description': None,
+        'genre_ids': genre_ids,
+        'actor_ids': list(reversed(ACTORS)),
+        'writer_ids': [],
+        'director_ids': [],
+    }])[0]
+
+
+def checksum(row: dict) -> bytes:
+    return document_checksum(Transformer.filmwork_document(row))
+
+
+def test_checksum_matches_sql_and_lookup_cache_documents():
+    # Порядок имен сортировки базы отличается от порядка кодов символов
+    names = ['adam West', 'Émile Zola', 'Zed']
+    assert checksum(sql_row(['comedy', 'Drama'], names)) == checksum(cached_row(['g2', 'g1']))
+    # Фильм без жанров: [null] из прежнего запроса и [] из кеша
+    assert checksum(sql_row([None], names)) == checksum(cached_row([]))
+
+
+def test_checksum_detects_changed_document():
+    names = ['Zed', 'adam West', 'Émile Zola']
+    changed = sql_row(['Drama'], names)
+    changed['title'] = 'Other'
+    assert checksum(sql_row(['Drama'], names)) != checksum(changed)
+
+
+def test_merge_join_reports_only_differences():
+    source = iter([('a', b'1'), ('b', b'2'), ('d', b'4')])
+    target = iter([('b', b'2'), ('c', b'3'), ('d', b'5')])
+    assert list(merge_join(source, target)) == [(MISSING, 'a'), (EXTRA, 'c'), (STALE, 'd')]
+
+
+def test_partition_bounds_cover_uuid_space():
+    bounds = partition_bounds(4)
+    assert bounds[0][0] is None and bounds[-1][1] is None
+    assert all(upper == lower for (_, upper), (lower, _) in zip(bounds, bounds[1:]))
@@ -0,0 +1,33 @@
+from utils.watermarks import NIL_ID, TABLES, advance, from_legacy, overlap_key, with_overlap
+
+MODIFIED = '2024-01-01T00:00:00+00:00'
+
+
+def test_overlap_starts_before_capture_time():
+    key = [MODIFIED, 'b', '2024-01-01T00:00:10+00:00']
+
+    assert overlap_key(key, 30) == ['2023-12-31T23:59:40+00:00', NIL_ID]
+
+
+def test_overlap_closes_when_watermark_is_older_than_window():
+    key = [MODIFIED, 'b', '2024-01-01T00:05:00+00:00']
+
+    assert overlap_key(key, 30) == [MODIFIED, 'b']
+    assert overlap_key(key, 0) == [MODIFIED, 'b']
+
+
+def test_legacy_watermarks_count_overlap_from_modified():
+    watermarks = from_legacy('01-01-2024 00:00:00')
+
+    assert set(watermarks) == set(TABLES)
+    assert all(row_id == NIL_ID for _, row_id in watermarks.values())
+    since = with_overlap({'film_work': [MODIFIED, 'b']}, 30)
+    assert since == {'film_work': ['2023-12-31T23:59:30+00:00', NIL_ID]}
+
+
+def test_advance_keeps_watermarks_of_empty_tables():
+    watermarks = {'film_work': [MODIFIED, 'a', MODIFIED], 'genre': [MODIFIED, 'g', MODIFIED]}
+    target = {'film_work': ['2024-01-02T00:00:00+00:00', 'b', '2024-01-02T00:00:05+00:00']}
+
+    assert advance(watermarks, target) == {**watermarks, **target}
+    assert advance(None, target) == target
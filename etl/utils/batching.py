@@ -0,0 +1,87 @@
+import logging
+import threading
+from typing import Optional
+
+from utils.metrics import BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatchSize:
+    """
+    Класс AdaptiveBatchSize подбирает размер пачки по принципу AIMD.
+    Пока полные пачки обрабатываются быстрее target_latency, размер растет на increase (аддитивно),
+    при превышении задержки, объема или отказе сервиса из-за перегрузки размер умножается на decrease.
+    Размер всегда остается в границах [minimum, maximum], при minimum == maximum размер постоянный
+    """
+
+    def __init__(
+            self,
+            name: str,
+            initial: int,
+            minimum: int,
+            maximum: int,
+            target_latency: float,
+            max_bytes: Optional[int] = None,
+            increase: Optional[int] = None,
+            decrease: float = 0.5,
+    ):
+        """
+        :param name: имя контроллера для метрик и логов
+        :param initial: начальный размер пачки
+        :param minimum: минимальный размер пачки
+        :param maximum: максимальный размер пачки
+        :param target_latency: допустимое время обработки пачки в секундах
+        :param max_bytes: допустимый объем пачки в байтах
+        :param increase: шаг увеличения размера, по умолчанию minimum
+        :param decrease: множитель уменьшения размера
+        """
+        self.name = name
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.increase = increase or max(1, minimum)
+        self.decrease = decrease
+        self._size = min(max(initial, self.minimum), self.maximum)
+        self._lock = threading.Lock()
+        BATCH_SIZE.set(self._size, controller=name)
+
+    @classmethod
+    def fixed(cls, name: str, size: int) -> 'AdaptiveBatchSize':
+        """Метод создает контроллер с постоянным размером пачки"""
+        return cls(name, size, size, size, target_latency=float('inf'))
+
+    @property
+    def size(self) -> int:
+        """Текущий размер пачки"""
+        return self._size
+
+    def record(self, size: int, latency: float, payload_bytes: Optional[int] = None) -> None:
+        """
+        Метод учитывает результат обработки пачки
+        :param size: количество элементов в пачке
+        :param latency: время обработки в секундах
+        :param payload_bytes: объем пачки в байтах, если известен
+        """
+        if latency > self.target_latency:
+            self._shrink(f'latency {latency:.2f}s')
+        elif self.max_bytes is not None and payload_bytes is not None and payload_bytes >= self.max_bytes:
+            self._shrink(f'payload {payload_bytes} bytes')
+        elif size >= self._size:
+            # Неполные пачки (конец выборки) ничего не говорят о запасе мощности
+            self._resize(self._size + self.increase)
+
+    def reject(self) -> None:
+        """Метод учитывает отказ сервиса из-за перегрузки, например ответ 429 от Elastic"""
+        self._shrink('rejected by server')
+
+    def _shrink(self, reason: str) -> None:
+        size = self._resize(int(self._size * self.decrease))
+        logger.debug(f'Batch size {self.name} decreased to {size}: {reason}')
+
+    def _resize(self, size: int) -> int:
+        with self._lock:
+            self._size = min(max(size, self.minimum), self.maximum)
+            BATCH_SIZE.set(self._size, controller=self.name)
+            return self._size
@@ -3,6 +3,7 @@ from typing import Optional
 from dotenv import load_dotenv
 from pydantic import Field, BaseModel, BaseSettings
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
 load_dotenv()
 
@@ -10,6 +11,53 @@ load_dotenv()
 class AppConfig(BaseSettings):
     chunk_size: int = Field(50, env='CHUNK_SIZE')
     sleep_time: float = Field(60.0, env='SLEEP_TIME')
+    server_side_cursor: bool = Field(True, env='SERVER_SIDE_CURSOR')
+    itersize: int = Field(2000, env='ITERSIZE')
+    page_size: int = Field(1000, env='PAGE_SIZE')
+    watermark_overlap: float = Field(30.0, env='WATERMARK_OVERLAP')
+    lookup_cache: bool = Field(False, env='LOOKUP_CACHE')
+    lookup_cache_max_persons: Optional[int] = Field(None, env='LOOKUP_CACHE_MAX_PERSONS')
+    pipeline_mode: bool = Field(False, env='PIPELINE_MODE')
+    async_runtime: bool = Field(False, env='ASYNC_RUNTIME')
+    pipeline_queue_size: int = Field(2, env='PIPELINE_QUEUE_SIZE')
+    fast_transform: bool = Field(False, env='FAST_TRANSFORM')
+    validation_sample_rate: float = Field(0.0, env='VALIDATION_SAMPLE_RATE')
+    transform_workers: int = Field(0, env='TRANSFORM_WORKERS')
+    spool_path: Optional[str] = Field(None, env='SPOOL_PATH')
+    spool_segment_bytes: int = Field(256 * 1024 * 1024, env='SPOOL_SEGMENT_BYTES')
+    shard_index: int = Field(0, env='SHARD_INDEX')
+    shard_count: int = Field(1, env='SHARD_COUNT')
+    lease_ttl: float = Field(30.0, env='LEASE_TTL')
+    change_capture: bool = Field(False, env='CHANGE_CAPTURE')
+    install_triggers: bool = Field(True, env='INSTALL_TRIGGERS')
+    notify_channel: str = Field('etl_changes', env='NOTIFY_CHANNEL')
+    notify_debounce: float = Field(1.0, env='NOTIFY_DEBOUNCE')
+    blue_green_rebuild: bool = Field(True, env='BLUE_GREEN_REBUILD')
+    fingerprint_cache_path: Optional[str] = Field(None, env='FINGERPRINT_CACHE_PATH')
+    fingerprint_cache_size: int = Field(1_000_000, env='FINGERPRINT_CACHE_SIZE')
+    deletion_tracking: bool = Field(False, env='DELETION_TRACKING')
+    tombstone_batch_size: int = Field(1000, env='TOMBSTONE_BATCH_SIZE')
+    tombstone_retention_hours: float = Field(168.0, env='TOMBSTONE_RETENTION_HOURS')
+    genres_reconcile_interval: float = Field(3600.0, env='GENRES_RECONCILE_INTERVAL')
+    metrics_port: Optional[int] = Field(None, env='METRICS_PORT')
+    record_path: Optional[str] = Field(None, env='RECORD_PATH')
+    verify_partitions: int = Field(64, env='VERIFY_PARTITIONS')
+    verify_workers: int = Field(4, env='VERIFY_WORKERS')
+    verify_batch_size: int = Field(1000, env='VERIFY_BATCH_SIZE')
+    adaptive_batching: bool = Field(False, env='ADAPTIVE_BATCHING')
+    extract_batch_min: int = Field(10, env='EXTRACT_BATCH_MIN')
+    extract_batch_max: int = Field(1000, env='EXTRACT_BATCH_MAX')
+    extract_target_latency: float = Field(1.0, env='EXTRACT_TARGET_LATENCY')
+    extract_max_chunk_bytes: Optional[int] = Field(16 * 1024 * 1024, env='EXTRACT_MAX_CHUNK_BYTES')
+    chunk_retries: int = Field(3, env='CHUNK_RETRIES')
+    breaker_failure_threshold: int = Field(5, env='BREAKER_FAILURE_THRESHOLD')
+    breaker_reset_timeout: float = Field(30.0, env='BREAKER_RESET_TIMEOUT')
+
+    def shard_key(self, key: str) -> str:
+        """Возвращает ключ Redis, уникальный для шарда воркера"""
+        if self.shard_count == 1:
+            return key
+        return f'{key}:{self.shard_index}-{self.shard_count}'
 
 
 class DataBaseConfig(BaseSettings):
@@ -23,8 +71,22 @@ class DataBaseConfig(BaseSettings):
 class ElasticConfig(BaseSettings):
     elastic_host: str = Field('localhost', env='ELASTIC_HOST')
     elastic_port: str = Field(9200, env='ELASTIC_PORT')
-    movies_index: str = Field('default', env='ELASTIC_MOVIES_INDEX')
-    genres_index: str = Field('default', env='ELASTIC_GENRES_INDEX')
+    movies_index: str = Field('movies', env='ELASTIC_MOVIES_INDEX')
+    genres_index: str = Field('genres', env='ELASTIC_GENRES_INDEX')
+    connections_per_node: int = Field(10, env='ELASTIC_CONNECTIONS_PER_NODE')
+    bulk_thread_count: int = Field(4, env='ELASTIC_BULK_THREAD_COUNT')
+    bulk_concurrency: int = Field(8, env='ELASTIC_BULK_CONCURRENCY')
+    bulk_chunk_size: int = Field(500, env='ELASTIC_BULK_CHUNK_SIZE')
+    bulk_max_chunk_bytes: int = Field(10 * 1024 * 1024, env='ELASTIC_BULK_MAX_CHUNK_BYTES')
+    bulk_oversized_bytes: int = Field(1024 * 1024, env='ELASTIC_BULK_OVERSIZED_BYTES')
+    bulk_batch_min: int = Field(50, env='ELASTIC_BULK_BATCH_MIN')
+    bulk_batch_max: int = Field(5000, env='ELASTIC_BULK_BATCH_MAX')
+    bulk_target_latency: float = Field(2.0, env='ELASTIC_BULK_TARGET_LATENCY')
+    bulk_rejection_retries: int = Field(3, env='ELASTIC_BULK_REJECTION_RETRIES')
+    bulk_rejection_backoff: float = Field(1.0, env='ELASTIC_BULK_REJECTION_BACKOFF')
+    bulk_retries: int = Field(2, env='ELASTIC_BULK_RETRIES')
+    number_of_replicas: int = Field(1, env='ELASTIC_NUMBER_OF_REPLICAS')
+    forcemerge_segments: int = Field(1, env='ELASTIC_FORCEMERGE_SEGMENTS')
 
     def get_elastic_url(self):
         return 'http://{}:{}'.format(self.elastic_host, self.elastic_port)
@@ -33,11 +95,16 @@ class ElasticConfig(BaseSettings):
 class RedisConfig(BaseSettings):
     redis_host: str = Field('localhost', env='REDIS_HOST')
     redis_port: int = Field(6379, env='REDIS_PORT')
+    state_key: str = Field('etl_state', env='REDIS_STATE_KEY')
 
     def get_redis_client(self):
         redis_url = f'redis://{self.redis_host}:{self.redis_port}'
         return Redis.from_url(redis_url)
 
+    def get_async_redis_client(self):
+        redis_url = f'redis://{self.redis_host}:{self.redis_port}'
+        return AsyncRedis.from_url(redis_url)
+
 
 class ESPerson(BaseModel):
     id: str
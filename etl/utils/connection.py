@@ -1,12 +1,24 @@
+import asyncio
+import json
 import logging
-from contextlib import contextmanager
+import random
+from contextlib import asynccontextmanager, contextmanager
 from functools import wraps
 from time import sleep
+from typing import Optional
 
 import psycopg2
 from psycopg2.extras import DictCursor
 from elasticsearch import Elasticsearch
 
+from utils.metrics import RETRIES
+from utils.resilience import CircuitBreaker
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +30,25 @@ def postgresql_connection(dsl: dict):
     conn.close()
 
 
+@asynccontextmanager
+async def async_postgresql_connection(dsl: dict):
+    """
+    Асинхронный контекстный менеджер для управления соединением с PostgreSQL через asyncpg.
+    uuid и json декодируются так же, как в psycopg2: строками и разобранными объектами
+    """
+    if asyncpg is None:
+        raise RuntimeError('asyncpg is required for the async runtime')
+    dsl = dict(dsl)
+    dsl['database'] = dsl.pop('dbname')
+    conn = await asyncpg.connect(**dsl)
+    try:
+        await conn.set_type_codec('uuid', encoder=str, decoder=str, schema='pg_catalog', format='text')
+        await conn.set_type_codec('json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+        yield conn
+    finally:
+        await conn.close()
+
+
 @contextmanager
 def elastic_connection(database: str):
     """Контекстный менеджер для управлени соединением с Elasticsearch"""
@@ -26,33 +57,104 @@ def elastic_connection(database: str):
     conn.close()
 
 
-def backoff(exceptions=None, start_sleep_time=0.1, factor=2, border_sleep_time=10):
+def backoff(
+        exceptions=None,
+        start_sleep_time=0.1,
+        factor=2,
+        border_sleep_time=10,
+        max_retries: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        jitter: bool = True,
+):
     """
-    Функция для повторного выполнения функции через некоторое время, если возникла ошибка. Использует наивный экспоненциальный рост времени повтора (factor) до граничного времени ожидания (border_sleep_time)
+    Функция для повторного выполнения функции через некоторое время, если возникла ошибка. Использует экспоненциальный рост времени повтора (factor) до граничного времени ожидания (border_sleep_time)
 
     Формула:
         t = start_sleep_time * 2^(n) if t < border_sleep_time
         t = border_sleep_time if t >= border_sleep_time
+    При jitter фактическая пауза выбирается случайно из [0, t], чтобы воркеры не повторяли запросы одновременно.
+    Если задан предохранитель breaker, ошибки учитываются в нем, а пока он разомкнут, вызов ждет пробного обращения
     :param start_sleep_time: начальное время повтора
     :param factor: во сколько раз нужно увеличить время ожидания
     :param border_sleep_time: граничное время ожидания
-    :param exceptions: список ошибок при которых стоит делать повторные попытки
+    :param exceptions: список ошибок при которых стоит делать повторные попытки, подклассы тоже учитываются
+    :param max_retries: бюджет повторов, после его исчерпания ошибка пробрасывается; None - без ограничения
+    :param breaker: предохранитель зависимости
+    :param jitter: добавлять ли случайный разброс паузы
     :return: результат выполнения функции
     """
     def func_wrapper(func):
         @wraps(func)
         def inner(*args, **kwargs):
             sleep_time = start_sleep_time
+            retries = 0
+            while True:
+                if breaker is not None:
+                    sleep(breaker.wait_time())
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    if exceptions and not isinstance(e, tuple(exceptions)):
+                        raise e
+                    if breaker is not None:
+                        breaker.record_failure()
+                    if max_retries is not None and retries >= max_retries:
+                        raise e
+                    retries += 1
+                    logger.info(f'Connection error {e}. Retrying...')
+                    RETRIES.inc(function=func.__name__)
+                    sleep(random.uniform(0, sleep_time) if jitter else sleep_time)
+                    sleep_time *= factor
+                    sleep_time = min(sleep_time, border_sleep_time)
+                else:
+                    if breaker is not None:
+                        breaker.record_success()
+                    return result
+
+        return inner
+    return func_wrapper
+
+
+def async_backoff(
+        exceptions=None,
+        start_sleep_time=0.1,
+        factor=2,
+        border_sleep_time=10,
+        max_retries: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        jitter: bool = True,
+):
+    """
+    Вариант backoff для корутин: пауза между повторами не блокирует цикл событий.
+    Параметры совпадают с backoff
+    """
+    def func_wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            sleep_time = start_sleep_time
+            retries = 0
             while True:
+                if breaker is not None:
+                    await asyncio.sleep(breaker.wait_time())
                 try:
-                    return func(*args, **kwargs)
+                    result = await func(*args, **kwargs)
                 except Exception as e:
-                    if exceptions and type(e) not in exceptions:
+                    if exceptions and not isinstance(e, tuple(exceptions)):
+                        raise e
+                    if breaker is not None:
+                        breaker.record_failure()
+                    if max_retries is not None and retries >= max_retries:
                         raise e
-                    logger.info(f'Connection error {e}Retrying...')
-                    sleep(sleep_time)
+                    retries += 1
+                    logger.info(f'Connection error {e}. Retrying...')
+                    RETRIES.inc(function=func.__name__)
+                    await asyncio.sleep(random.uniform(0, sleep_time) if jitter else sleep_time)
                     sleep_time *= factor
                     sleep_time = min(sleep_time, border_sleep_time)
+                else:
+                    if breaker is not None:
+                        breaker.record_success()
+                    return result
 
         return inner
     return func_wrapper
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from typing import Optional
+from uuid import uuid4
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLostError(Exception):
+    """Аренда истекла или перехвачена другим воркером"""
+
+
+class RedisLease:
+    """
+    Класс RedisLease реализует аренду (распределенную блокировку) в Redis.
+    Ключ аренды хранит уникальный токен владельца и имеет TTL, фоновый поток периодически продлевает его.
+    Если процесс упадет, аренда освободится сама через ttl секунд.
+    """
+
+    def __init__(self, redis_adapter: Redis, key: str, ttl: float = 30.0, heartbeat_interval: Optional[float] = None):
+        self.redis_adapter = redis_adapter
+        self.key = key
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval or ttl / 3
+        self.token = None
+        self.lost = False
+        self._renew = redis_adapter.register_script(RENEW_SCRIPT)
+        self._release = redis_adapter.register_script(RELEASE_SCRIPT)
+        self._stop_event = threading.Event()
+        self._heartbeat = None
+
+    def acquire(self) -> bool:
+        """
+        Метод пытается взять аренду
+        :return: True, если аренда получена
+        """
+        token = uuid4().hex
+        if not self.redis_adapter.set(self.key, token, nx=True, px=int(self.ttl * 1000)):
+            return False
+
+        self.token = token
+        self.lost = False
+        self._stop_event.clear()
+        self._heartbeat = threading.Thread(target=self._keep_alive, name='etl-lease', daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def release(self) -> None:
+        """
+        Метод освобождает аренду, если она все еще принадлежит этому воркеру.
+        Ошибка Redis только логируется: release вызывается в finally и не должен подменять исключение запуска,
+        а не освобожденная аренда истечет через ttl
+        """
+        if self.token is None:
+            return
+
+        self._stop_event.set()
+        self._heartbeat.join()
+        try:
+            self._release(keys=[self.key], args=[self.token])
+        except RedisError as e:
+            logger.warning(f'Failed to release lease {self.key}, it will expire after the ttl: {e}')
+        finally:
+            self.token = None
+
+    def check(self) -> None:
+        """Метод выбрасывает LeaseLostError, если аренда потеряна"""
+        if self.lost:
+            raise LeaseLostError(f'Lease {self.key} is lost')
+
+    def _keep_alive(self) -> None:
+        """Метод продлевает аренду, пока она не будет освобождена или потеряна"""
+        renewed_at = time.monotonic()
+        while not self._stop_event.wait(self.heartbeat_interval):
+            try:
+                if not self._renew(keys=[self.key], args=[self.token, int(self.ttl * 1000)]):
+                    logger.error(f'Lease {self.key} was taken over by another worker')
+                    self.lost = True
+                    return
+                renewed_at = time.monotonic()
+            except RedisError as e:
+                logger.warning(f'Failed to renew lease {self.key}: {e}')
+                if time.monotonic() - renewed_at >= self.ttl:
+                    self.lost = True
+                    return
@@ -0,0 +1,100 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Iterable
+
+# SQLite ограничивает число параметров одного запроса
+SQL_PARAMS_LIMIT = 500
+
+
+class FingerprintCache:
+    """
+    Класс FingerprintCache хранит отпечатки (хеши) последних загруженных в Elastic документов.
+    Отпечатки лежат в локальном файле SQLite, размер кеша ограничен max_entries:
+    при переполнении удаляются записи, которые дольше всего не обновлялись.
+    Потеря записи безопасна - документ просто будет загружен повторно
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints '
+            '(id TEXT PRIMARY KEY, digest BLOB NOT NULL, touched INTEGER NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS fingerprints_touched ON fingerprints (touched)')
+        self.conn.commit()
+        self._size = self.conn.execute('SELECT count(*) FROM fingerprints').fetchone()[0]
+
+    @staticmethod
+    def digest(source: bytes) -> bytes:
+        """Метод вычисляет отпечаток закодированного документа"""
+        return hashlib.blake2b(source, digest_size=16).digest()
+
+    def unchanged(self, digests: dict[str, bytes]) -> set[str]:
+        """
+        Метод возвращает id документов, отпечаток которых совпадает с сохраненным
+        :param digests: отпечатки документов по id
+        """
+        ids = list(digests)
+        unchanged_ids = set()
+        with self._lock:
+            for start in range(0, len(ids), SQL_PARAMS_LIMIT):
+                batch = ids[start:start + SQL_PARAMS_LIMIT]
+                rows = self.conn.execute(
+                    f'SELECT id, digest FROM fingerprints WHERE id IN ({",".join("?" * len(batch))})', batch
+                )
+                unchanged_ids.update(doc_id for doc_id, digest in rows if digest == digests[doc_id])
+        return unchanged_ids
+
+    def update(self, digests: dict[str, bytes]) -> None:
+        """Метод сохраняет отпечатки загруженных документов и вытесняет самые старые при переполнении"""
+        if not digests:
+            return
+
+        touched = time.time_ns()
+        with self._lock:
+            self._size += len(digests) - self._count_existing(list(digests))
+            self.conn.executemany(
+                'INSERT INTO fingerprints (id, digest, touched) VALUES (?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET digest = excluded.digest, touched = excluded.touched',
+                ((doc_id, digest, touched) for doc_id, digest in digests.items()),
+            )
+            if self._size > self.max_entries:
+                self.conn.execute(
+                    'DELETE FROM fingerprints WHERE id IN '
+                    '(SELECT id FROM fingerprints ORDER BY touched LIMIT ?)',
+                    [self._size - self.max_entries],
+                )
+                self._size = self.max_entries
+            self.conn.commit()
+
+    def discard(self, ids: Iterable[str]) -> None:
+        """Метод удаляет отпечатки документов, например удаленных из Elastic"""
+        ids = list(ids)
+        with self._lock:
+            for start in range(0, len(ids), SQL_PARAMS_LIMIT):
+                batch = ids[start:start + SQL_PARAMS_LIMIT]
+                self.conn.execute(f'DELETE FROM fingerprints WHERE id IN ({",".join("?" * len(batch))})', batch)
+            self.conn.commit()
+            self._size = self.conn.execute('SELECT count(*) FROM fingerprints').fetchone()[0]
+
+    def _count_existing(self, ids: list[str]) -> int:
+        """Метод считает, сколько из переданных id уже есть в кеше"""
+        count = 0
+        for start in range(0, len(ids), SQL_PARAMS_LIMIT):
+            batch = ids[start:start + SQL_PARAMS_LIMIT]
+            count += self.conn.execute(
+                f'SELECT count(*) FROM fingerprints WHERE id IN ({",".join("?" * len(batch))})', batch
+            ).fetchone()[0]
+        return count
+
+    def clear(self) -> None:
+        """Метод очищает кеш"""
+        with self._lock:
+            self.conn.execute('DELETE FROM fingerprints')
+            self.conn.commit()
+            self._size = 0
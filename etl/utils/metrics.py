@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** power for power in range(10))
+
+
+class Metric:
+    """
+    Базовый класс метрики в формате Prometheus.
+    Значения хранятся отдельно для каждого набора меток
+    """
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: Optional[dict] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """Метод возвращает значения метрики в виде (имя, метки, значение)"""
+        with self._lock:
+            return [(self.name, self._format_labels(key), value) for key, value in self._values.items()]
+
+    def snapshot(self) -> dict:
+        """Метод возвращает значения метрики для структурированного лога"""
+        with self._lock:
+            return {','.join(key) or 'total': value for key, value in self._values.items()}
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Значение, которое может как расти, так и уменьшаться"""
+
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Гистограмма распределения значений, например задержек"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Контекстный менеджер, измеряющий длительность блока кода"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        result = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    result.append((f'{self.name}_bucket', self._format_labels(key, {'le': le}), cumulative))
+                result.append((f'{self.name}_count', self._format_labels(key), cumulative))
+                result.append((f'{self.name}_sum', self._format_labels(key), total))
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                ','.join(key) or 'total': {'count': sum(counts), 'sum': round(total, 6)}
+                for key, (counts, total) in self._values.items()
+            }
+
+
+class Registry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Метод формирует текст метрик в формате Prometheus exposition"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """Метод возвращает значения всех метрик в виде словаря"""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = Histogram('etl_stage_duration_seconds', 'Duration of a pipeline stage per chunk', ['stage'])
+ROWS = Counter('etl_rows_total', 'Rows or documents processed by a stage', ['stage'])
+BYTES = Counter('etl_bytes_total', 'Payload bytes sent to Elasticsearch', ['index'])
+DOCUMENT_BYTES = Histogram('etl_document_bytes', 'Size of an encoded document', ['index'], buckets=SIZE_BUCKETS)
+OVERSIZED_DOCUMENTS = Counter(
+    'etl_oversized_documents_total', 'Documents sent in a bulk request of their own', ['index'])
+BULK_ERRORS = Counter('etl_bulk_errors_total', 'Documents rejected by Elasticsearch', ['index'])
+RETRIES = Counter('etl_retries_total', 'Retries made by the backoff decorator', ['function'])
+CHECKPOINT_LAG = Gauge('etl_checkpoint_lag_rows', 'Changed filmworks not yet checkpointed in the current run')
+FRESHNESS_LAG = Gauge('etl_freshness_lag_seconds', 'Now minus modified time of the oldest unindexed filmwork')
+BATCH_SIZE = Gauge('etl_batch_size', 'Current size of an adaptive batch', ['controller'])
+CIRCUIT_STATE = Gauge('etl_circuit_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open', ['dependency'])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Функция запускает в фоновом потоке HTTP-сервер с эндпоинтом /metrics"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='etl-metrics', daemon=True).start()
+    logger.info(f'Metrics are available on http://{host}:{port}/metrics')
+    return server
+
+
+def log_snapshot(event: str, **fields) -> None:
+    """Функция пишет значения всех метрик одной структурированной строкой лога"""
+    logger.info(json.dumps({'event': event, **fields, 'metrics': REGISTRY.snapshot()}, default=str))
@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+
+from utils.metrics import CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Класс CircuitBreaker - предохранитель для одной внешней зависимости (PostgreSQL, Elastic, Redis).
+    После failure_threshold ошибок подряд предохранитель размыкается: в течение reset_timeout секунд
+    обращения к зависимости не выполняются, а ждут. Затем пропускается пробное обращение (полуоткрытое
+    состояние): успех замыкает предохранитель, ошибка снова размыкает его
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(self.CLOSED, dependency=name)
+
+    @property
+    def state(self) -> int:
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def wait_time(self) -> float:
+        """Метод возвращает, сколько секунд осталось до пробного обращения, 0 - обращаться можно"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining <= 0:
+                CIRCUIT_STATE.set(self.HALF_OPEN, dependency=self.name)
+            return max(0.0, remaining)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f'Circuit {self.name} closed')
+            self._failures = 0
+            self._opened_at = None
+            CIRCUIT_STATE.set(self.CLOSED, dependency=self.name)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            # Ошибка пробного обращения размыкает предохранитель сразу
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f'Circuit {self.name} opened after {self._failures} failures')
+                self._opened_at = time.monotonic()
+                CIRCUIT_STATE.set(self.OPEN, dependency=self.name)
@@ -0,0 +1,48 @@
+import json
+from typing import Any, Union
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Функция сериализует документ в компактный JSON.
+    При наличии orjson используется он, иначе стандартный json с тем же форматом вывода.
+    Вывод не совпадает побайтно с pydantic .json(): без пробелов после разделителей и с не-ASCII символами
+    в UTF-8 вместо \\u-последовательностей. Elastic разбирает оба варианта в одинаковый документ
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def encode_document(document: Union[BaseModel, dict, tuple[str, bytes]]) -> tuple[str, bytes]:
+    """
+    Функция однократно кодирует документ для bulk-запроса
+    :param document: pydantic-модель, готовый словарь документа или уже закодированный документ (id, bytes)
+    :return: id документа и его JSON-представление
+    """
+    if isinstance(document, tuple):
+        return document
+    if isinstance(document, BaseModel):
+        document = document.dict()
+    return document['id'], dumps(document)
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Функция оценивает размер значения в JSON без сериализации: строки учитываются по числу символов,
+    списки и словари - по сумме элементов. Точности достаточно, чтобы ограничивать объем чанков
+    """
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return sum(len(key) + 3 + estimate_size(item) for key, item in value.items()) + 2
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) + 1 for item in value) + 2
+    return 8
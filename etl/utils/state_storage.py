@@ -1,7 +1,16 @@
 import json
 
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Optional, Set
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from utils.connection import backoff, async_backoff
+from utils.metrics import STAGE_DURATION
+from utils.resilience import CircuitBreaker
+
+# Ошибки хранилища, после которых операцию можно повторить
+STORAGE_ERRORS = (ConnectionError, TimeoutError)
 
 
 class BaseStorage:
@@ -18,23 +27,70 @@ class BaseStorage:
         """Получить состояние из хранилища."""
         raise NotImplementedError()
 
+    def retrieve_value(self, key: str) -> Any:
+        """Получить значение одного ключа."""
+        return self.retrieve_state().get(key, None)
+
+    def retrieve_members(self, key: str) -> Set[str]:
+        """Получить элементы множества."""
+        return set(self.retrieve_state().get(key) or [])
+
+    def save_values(
+            self,
+            values: Dict[str, Any],
+            add_members: Optional[Dict[str, Iterable[str]]] = None,
+            remove_members: Optional[Dict[str, Iterable[str]]] = None,
+    ) -> None:
+        """
+        Сохранить значения ключей и изменить множества.
+        Реализация по умолчанию перезаписывает состояние целиком.
+        """
+        state = self.retrieve_state()
+        state.update(values)
+        for key, members in (add_members or {}).items():
+            state[key] = sorted(set(state.get(key) or []) | set(members))
+        for key, members in (remove_members or {}).items():
+            state[key] = sorted(set(state.get(key) or []) - set(members))
+        self.save_state(state)
+
 
 class State:
-    """Класс для работы с состояниями."""
+    """
+    Класс для работы с состояниями.
+    Операции с хранилищем при ошибке соединения повторяются не более retries раз,
+    поэтому кратковременный сбой хранилища не прерывает загрузку.
+    """
 
-    def __init__(self, storage: BaseStorage) -> None:
+    def __init__(self, storage: BaseStorage, retries: int = 0, breaker: Optional[CircuitBreaker] = None) -> None:
         self.storage = storage
+        self._retry = backoff(exceptions=STORAGE_ERRORS, max_retries=retries, breaker=breaker)
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа."""
-        data = self.storage.retrieve_state()
-        data.update({key: value})
-        self.storage.save_state(data)
+        self._retry(self.storage.save_values)({key: value})
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу."""
-        data = self.storage.retrieve_state()
-        return data.get(key, None)
+        return self._retry(self.storage.retrieve_value)(key)
+
+    def get_members(self, key: str) -> Set[str]:
+        """Получить множество, сохраненное по определённому ключу."""
+        return self._retry(self.storage.retrieve_members)(key)
+
+    def save_checkpoint(
+            self,
+            values: Dict[str, Any],
+            add_members: Optional[Dict[str, Iterable[str]]] = None,
+            remove_members: Optional[Dict[str, Iterable[str]]] = None,
+    ) -> None:
+        """
+        Атомарно сохранить контрольную точку: значения ключей и изменения множеств.
+        :param values: значения ключей
+        :param add_members: элементы, добавляемые в множества
+        :param remove_members: элементы, удаляемые из множеств
+        """
+        with STAGE_DURATION.time(stage='checkpoint'):
+            self._retry(self.storage.save_values)(values, add_members, remove_members)
 
 
 class RedisStorage(BaseStorage):
@@ -49,3 +105,157 @@ class RedisStorage(BaseStorage):
         if data:
             return json.loads(data)
         return {}
+
+
+class RedisHashStorage(BaseStorage):
+    """
+    Хранилище состояния в Redis с обновлением за O(1).
+    Скалярные ключи хранятся полями хеша, множества - отдельными Redis set,
+    изменения контрольной точки отправляются одной транзакцией MULTI/EXEC.
+    """
+
+    def __init__(self, redis_adapter: Redis, key: str = 'etl_state'):
+        self.redis_adapter = redis_adapter
+        self.key = key
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        self.save_values(state)
+
+    def migrate_legacy(self, legacy_key: str = 'data') -> bool:
+        """
+        Метод однократно переносит состояние прежнего формата RedisStorage (JSON в ключе data) в хеш
+        и удаляет прежний ключ, чтобы после обновления загрузка продолжилась с last_start_time.
+        Перенос выполняется, только если хеша еще нет
+        :return: было ли перенесено состояние
+        """
+        migrated = False
+
+        def migrate(pipe) -> None:
+            nonlocal migrated
+            if pipe.exists(self.key):
+                return
+            data = pipe.get(legacy_key)
+            if not data:
+                return
+            state = json.loads(data)
+            pipe.multi()
+            if state:
+                pipe.hset(self.key, mapping={key: json.dumps(value) for key, value in state.items()})
+            pipe.delete(legacy_key)
+            migrated = True
+
+        # Ключи отслеживаются WATCH, поэтому параллельно запущенные воркеры не перенесут состояние дважды
+        self.redis_adapter.transaction(migrate, self.key, legacy_key)
+        return migrated
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        data = self.redis_adapter.hgetall(self.key)
+        return {field.decode(): json.loads(value) for field, value in data.items()}
+
+    def retrieve_value(self, key: str) -> Any:
+        value = self.redis_adapter.hget(self.key, key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def retrieve_members(self, key: str) -> Set[str]:
+        return {member.decode() for member in self.redis_adapter.smembers(self._set_key(key))}
+
+    def save_values(
+            self,
+            values: Dict[str, Any],
+            add_members: Optional[Dict[str, Iterable[str]]] = None,
+            remove_members: Optional[Dict[str, Iterable[str]]] = None,
+    ) -> None:
+        pipe = self.redis_adapter.pipeline(transaction=True)
+        if values:
+            pipe.hset(self.key, mapping={key: json.dumps(value) for key, value in values.items()})
+        for key, members in (add_members or {}).items():
+            members = list(members)
+            if members:
+                pipe.sadd(self._set_key(key), *members)
+        for key, members in (remove_members or {}).items():
+            members = list(members)
+            if members:
+                pipe.srem(self._set_key(key), *members)
+        pipe.execute()
+
+    def _set_key(self, key: str) -> str:
+        return f'{self.key}:{key}'
+
+
+class AsyncRedisHashStorage:
+    """
+    Асинхронный вариант RedisHashStorage на redis.asyncio для асинхронного режима.
+    Формат хранения совпадает, поэтому состояние переносится между режимами без миграции.
+    """
+
+    def __init__(self, redis_adapter: AsyncRedis, key: str = 'etl_state'):
+        self.redis_adapter = redis_adapter
+        self.key = key
+
+    async def retrieve_value(self, key: str) -> Any:
+        value = await self.redis_adapter.hget(self.key, key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    async def retrieve_members(self, key: str) -> Set[str]:
+        return {member.decode() for member in await self.redis_adapter.smembers(self._set_key(key))}
+
+    async def save_values(
+            self,
+            values: Dict[str, Any],
+            add_members: Optional[Dict[str, Iterable[str]]] = None,
+            remove_members: Optional[Dict[str, Iterable[str]]] = None,
+    ) -> None:
+        async with self.redis_adapter.pipeline(transaction=True) as pipe:
+            if values:
+                pipe.hset(self.key, mapping={key: json.dumps(value) for key, value in values.items()})
+            for key, members in (add_members or {}).items():
+                members = list(members)
+                if members:
+                    pipe.sadd(self._set_key(key), *members)
+            for key, members in (remove_members or {}).items():
+                members = list(members)
+                if members:
+                    pipe.srem(self._set_key(key), *members)
+            await pipe.execute()
+
+    def _set_key(self, key: str) -> str:
+        return f'{self.key}:{key}'
+
+
+class AsyncState:
+    """
+    Асинхронный вариант State.
+    Операции с хранилищем при ошибке соединения повторяются не более retries раз.
+    """
+
+    def __init__(
+            self, storage: AsyncRedisHashStorage, retries: int = 0, breaker: Optional[CircuitBreaker] = None
+    ) -> None:
+        self.storage = storage
+        self._retry = async_backoff(exceptions=STORAGE_ERRORS, max_retries=retries, breaker=breaker)
+
+    async def set_state(self, key: str, value: Any) -> None:
+        """Установить состояние для определённого ключа."""
+        await self._retry(self.storage.save_values)({key: value})
+
+    async def get_state(self, key: str) -> Any:
+        """Получить состояние по определённому ключу."""
+        return await self._retry(self.storage.retrieve_value)(key)
+
+    async def get_members(self, key: str) -> Set[str]:
+        """Получить множество, сохраненное по определённому ключу."""
+        return await self._retry(self.storage.retrieve_members)(key)
+
+    async def save_checkpoint(
+            self,
+            values: Dict[str, Any],
+            add_members: Optional[Dict[str, Iterable[str]]] = None,
+            remove_members: Optional[Dict[str, Iterable[str]]] = None,
+    ) -> None:
+        """Атомарно сохранить контрольную точку: значения ключей и изменения множеств."""
+        with STAGE_DURATION.time(stage='checkpoint'):
+            await self._retry(self.storage.save_values)(values, add_members, remove_members)
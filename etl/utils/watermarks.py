@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Таблицы, изменения которых отслеживаются отдельными водяными знаками
+TABLES = ('film_work', 'person', 'genre')
+# Наименьший uuid: граница (modified, NIL_ID) включает все строки с этим modified
+NIL_ID = '00000000-0000-0000-0000-000000000000'
+LEGACY_FORMAT = '%m-%d-%Y %H:%M:%S'
+
+
+def from_legacy(last_start_time: str) -> dict:
+    """
+    Функция переводит last_start_time старого формата (локальное время контейнера) в водяные знаки
+    :return: водяные знаки {таблица: [modified в ISO/UTC, id]}
+    """
+    moment = datetime.strptime(last_start_time, LEGACY_FORMAT).astimezone(timezone.utc)
+    return {table: [moment.isoformat(), NIL_ID] for table in TABLES}
+
+
+def with_overlap(watermarks: dict, overlap: float) -> dict:
+    """
+    Функция возвращает нижние границы выборки для водяных знаков с учетом окна перекрытия
+    :param watermarks: водяные знаки {таблица: [modified, id, момент фиксации]}
+    :return: границы {таблица: [modified, id]}
+    """
+    return {table: overlap_key(key, overlap) for table, key in watermarks.items()}
+
+
+def overlap_key(key: list, overlap: float) -> list:
+    """
+    Функция возвращает нижнюю границу выборки для водяного знака [modified, id, момент фиксации].
+    Транзакция, начатая до фиксации водяного знака, может закоммитить строки с более ранним modified уже
+    после нее, но не раньше чем за overlap секунд до момента фиксации. Пока водяной знак попадает в это окно,
+    граница сдвигается к его началу; когда изменений нет дольше overlap, используется точный ключ (modified, id),
+    и строки с тем же modified, но большим id, не выбираются повторно.
+    У водяных знаков без момента фиксации (прежний формат) окно отсчитывается от modified
+    :return: ключ [modified, id]
+    """
+    modified, row_id = key[:2]
+    if overlap:
+        captured_at = key[2] if len(key) > 2 else modified
+        start = datetime.fromisoformat(captured_at) - timedelta(seconds=overlap)
+        if start < datetime.fromisoformat(modified):
+            return [start.isoformat(), NIL_ID]
+    return [modified, row_id]
+
+
+def advance(watermarks: Optional[dict], target: dict) -> dict:
+    """Функция возвращает водяные знаки после успешного запуска, пустые таблицы сохраняют прежнее значение"""
+    return {**(watermarks or {}), **target}
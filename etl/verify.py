@@ -0,0 +1,167 @@
+"""
+Проверка согласованности индекса фильмов с PostgreSQL.
+
+Фильмы PostgreSQL и документы Elastic сравниваются по контрольным суммам, расхождения
+выводятся строками "вид<TAB>id":
+    missing - фильма нет в индексе,
+    stale - документ индекса отличается от собранного из PostgreSQL,
+    extra - документа нет в PostgreSQL.
+С --requeue расхождения исправляются точечно: отсутствующие и устаревшие фильмы добавляются
+в pending_ids своего шарда и загружаются следующим запуском сервиса, лишние документы удаляются.
+
+Запуск из каталога etl:
+    python verify.py --output differences.tsv
+    python verify.py --requeue
+"""
+import argparse
+import logging
+import sys
+import threading
+from collections import defaultdict
+from functools import partial
+from typing import Optional, TextIO
+
+from utils.config import AppConfig, DataBaseConfig, ElasticConfig, RedisConfig
+from etl_modules.loader import Loader
+from etl_modules.sql_queries import SQL_FILMWORK_SHARDS
+from etl_modules.verifier import Verifier, EXTRA
+from utils.connection import postgresql_connection
+from utils.fingerprint_cache import FingerprintCache
+from utils.state_storage import State, RedisHashStorage
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+class Repairer:
+    """
+    Класс Repairer исправляет расхождения, найденные Verifier.
+    Перед исправлением id проверяются в PostgreSQL еще раз: фильм, добавленный после чтения диапазона,
+    не удаляется из индекса, а ставится в очередь, как и отсутствующие и устаревшие фильмы.
+    Отпечатки этих фильмов удаляются из кеша, иначе Loader пропустит их как не изменившиеся
+    """
+
+    def __init__(self, pg_conn, loader: Loader, states: list[State]):
+        """
+        :param pg_conn: соединение с PostgreSQL
+        :param states: хранилища состояния шардов по номеру шарда
+        """
+        self.pg_conn = pg_conn
+        self.loader = loader
+        self.states = states
+        self.requeued = 0
+        self.deleted = 0
+        # Пачки расхождений приходят из нескольких потоков, соединение с PostgreSQL у Repairer одно
+        self._lock = threading.Lock()
+
+    def __call__(self, kind: str, ids: list[str]) -> None:
+        with self._lock:
+            with self.pg_conn.cursor() as curs:
+                curs.execute(SQL_FILMWORK_SHARDS, {'ids': ids, 'shard_count': len(self.states)})
+                shards = dict(curs.fetchall())
+
+            shard_ids = defaultdict(set)
+            for doc_id, shard in shards.items():
+                shard_ids[shard].add(doc_id)
+            if self.loader.fingerprint_cache is not None:
+                self.loader.fingerprint_cache.discard(shards)
+            for shard, pending_ids in shard_ids.items():
+                self.states[shard].save_checkpoint({}, add_members={'pending_ids': pending_ids})
+            self.requeued += len(shards)
+
+            if kind == EXTRA:
+                deleted_ids = [doc_id for doc_id in ids if doc_id not in shards]
+                if deleted_ids:
+                    self.deleted += len(self.loader.delete_filmworks(deleted_ids))
+
+
+def write_differences(output: TextIO, lock: threading.Lock, kind: str, ids: list[str]) -> None:
+    """Функция выводит пачку расхождений одного вида, по строке на id"""
+    with lock:
+        output.writelines(f'{kind}\t{doc_id}\n' for doc_id in ids)
+        output.flush()
+
+
+def verify(app_config: AppConfig, output: TextIO, requeue: bool) -> dict:
+    """
+    Функция проверяет индекс фильмов и, если включен requeue, исправляет расхождения
+    :return: результаты Verifier.verify
+    """
+    elastic_config = ElasticConfig()
+    verifier = Verifier(
+        database_config=DataBaseConfig(),
+        elastic_config=elastic_config,
+        partitions=app_config.verify_partitions,
+        workers=app_config.verify_workers,
+        batch_size=app_config.verify_batch_size,
+    )
+    write = partial(write_differences, output, threading.Lock())
+
+    if not requeue:
+        try:
+            return verifier.verify(write)
+        finally:
+            verifier.close()
+
+    redis_config = RedisConfig()
+    redis_client = redis_config.get_redis_client()
+    states = [
+        State(
+            storage=RedisHashStorage(
+                redis_adapter=redis_client,
+                key=app_config.copy(update={'shard_index': shard}).shard_key(redis_config.state_key),
+            ),
+            retries=app_config.chunk_retries,
+        )
+        for shard in range(app_config.shard_count)
+    ]
+    fingerprint_cache = None
+    if app_config.fingerprint_cache_path:
+        fingerprint_cache = FingerprintCache(
+            path=app_config.fingerprint_cache_path,
+            max_entries=app_config.fingerprint_cache_size,
+        )
+    loader = Loader(elastic_config=elastic_config, fingerprint_cache=fingerprint_cache)
+
+    with postgresql_connection(DataBaseConfig().dict()) as pg_conn:
+        pg_conn.autocommit = True
+        repairer = Repairer(pg_conn, loader, states)
+
+        def write_and_repair(kind: str, ids: list[str]) -> None:
+            write(kind, ids)
+            repairer(kind, ids)
+
+        try:
+            results = verifier.verify(write_and_repair)
+        finally:
+            verifier.close()
+            loader.close()
+    logger.info(f'{repairer.requeued} filmworks requeued, {repairer.deleted} documents deleted from Elastic')
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requeue', action='store_true', help='requeue missing and stale filmworks, delete extra')
+    parser.add_argument('--output', help='write differences to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        results = verify(AppConfig(), output, args.requeue)
+    finally:
+        if args.output:
+            output.close()
+
+    logger.info(
+        f'Verified {results["postgres"]} filmworks in PostgreSQL and {results["elastic"]} documents in Elastic: '
+        f'{results["missing"]} missing, {results["stale"]} stale, {results["extra"]} extra'
+    )
+    if results['failed_partitions']:
+        logger.error(f'{results["failed_partitions"]} id ranges were not verified')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())